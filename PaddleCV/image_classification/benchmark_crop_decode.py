@@ -0,0 +1,137 @@
+#copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Benchmark the random crops which decode JPEG images at a reduced scale
+against decoding the full images first, and check that the crops are close,
+for reader.py, reader_cv2.py and fast_imagenet/transforms.py, eg:
+
+    python benchmark_crop_decode.py --image_dir=./data/ILSVRC2012/train/n01440764
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import random
+import argparse
+import functools
+import cv2
+import numpy as np
+from PIL import Image
+
+import reader
+import reader_cv2
+from utils.utility import add_arguments, print_arguments
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fast_imagenet"))
+import transforms
+
+parser = argparse.ArgumentParser(description=__doc__)
+add_arg = functools.partial(add_arguments, argparser=parser)
+# yapf: disable
+add_arg('image_dir',    str,   None,   "Directory of JPEG images, synthetic images are used if not set.")
+add_arg('num_images',   int,   200,    "Number of images to test.")
+add_arg('min_size',     int,   300,    "Min height of synthetic images, widths are 4/3 of heights.")
+add_arg('max_size',     int,   600,    "Max height of synthetic images.")
+add_arg('crop_size',    int,   224,    "Size of crops.")
+add_arg('lower_scale',  float, 0.08,   "The lower scale in random crop.")
+add_arg('lower_ratio',  float, 3./4.,  "The lower ratio in random crop.")
+add_arg('upper_ratio',  float, 4./3.,  "The upper ratio in random crop.")
+# yapf: enable
+
+
+def synthetic_images(num, min_size, max_size, dirname):
+    """ make smooth JPEG images like photos """
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    rng = np.random.RandomState(0)
+    files = []
+    for k in range(num):
+        h = rng.randint(min_size, max_size + 1)
+        w = h * 4 // 3
+        small = rng.randint(0, 255, (h // 32 + 1, w // 32 + 1, 3))
+        img = cv2.resize(small.astype('uint8'), (w, h))
+        img = cv2.GaussianBlur(img, (0, 0), 2) + rng.randint(
+            0, 16, (h, w, 3)).astype('uint8')
+        fname = os.path.join(dirname, '%d.jpg' % k)
+        cv2.imwrite(fname, img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        files.append(fname)
+    return files
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype('float64') - b.astype('float64'))**2)
+    return 100. if mse == 0 else 10 * np.log10(255.**2 / mse)
+
+
+def run(crop, files, seed=0):
+    """ crop all files with the same random state, returns
+        (images per second, crops as uint8 arrays)
+    """
+    np.random.seed(seed)
+    random.seed(seed)
+    crops = []
+    start = time.time()
+    for fname in files:
+        crops.append(np.asarray(crop(fname)))
+    return len(files) / (time.time() - start), crops
+
+
+def main(args):
+    if args.image_dir is None:
+        files = synthetic_images(args.num_images, args.min_size,
+                                 args.max_size, 'synthetic_jpegs')
+    else:
+        files = sorted(
+            os.path.join(args.image_dir, f) for f in os.listdir(args.image_dir)
+            if f.lower().endswith(('.jpg', '.jpeg')))[:args.num_images]
+    size = args.crop_size
+    scale = [args.lower_scale, 1.0]
+    ratio = [args.lower_ratio, args.upper_ratio]
+
+    def _rgb(img):
+        return img if img.mode == 'RGB' else img.convert('RGB')
+
+    fast_full = transforms.RandomResizedCrop(size, scale, ratio)
+    fast_draft = transforms.RandomResizedCrop(size, scale, ratio, draft=True)
+    methods = [
+        ('reader.py', lambda f: _rgb(reader.random_crop(
+            Image.open(f), size, scale, ratio)),
+         lambda f: _rgb(reader.random_crop_draft(
+             Image.open(f), size, scale, ratio))),
+        ('reader_cv2.py', lambda f: reader_cv2.random_crop(
+            cv2.imread(f), size, args, scale, ratio),
+         lambda f: reader_cv2.decode_random_crop(f, size, args, scale, ratio)),
+        ('fast_imagenet', lambda f: fast_full(_rgb(Image.open(f))),
+         lambda f: fast_draft(Image.open(f))),
+    ]
+
+    print('%-16s %-14s %-14s %-10s %-10s' %
+          ('reader', 'full(imgs/s)', 'draft(imgs/s)', 'speedup', 'psnr(dB)'))
+    for name, full, draft in methods:
+        full_speed, full_crops = run(full, files)
+        draft_speed, draft_crops = run(draft, files)
+        quality = np.mean([psnr(a, b) for a, b in zip(full_crops, draft_crops)])
+        print('%-16s %-14.1f %-14.1f %-10.2f %-10.2f' %
+              (name, full_speed, draft_speed, draft_speed / full_speed,
+               quality))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    print_arguments(args)
+    main(args)
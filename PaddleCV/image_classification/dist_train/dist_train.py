@@ -58,6 +58,7 @@ def parse_args():
     add_arg('fp16',             bool,  False,                "Enable half precision training with fp16." )
     add_arg('scale_loss',       float, 1.0,                  "Scale loss for fp16." )
     add_arg('reduce_master_grad', bool, False,               "Whether to allreduce fp32 gradients." )
+    add_arg('draft_decode',     bool,  False,                "Whether to decode JPEG images at a reduced scale for the random crop.")
     # for distributed
     add_arg('update_method',      str,  "local",            "Can be local, pserver, nccl2.")
     add_arg('multi_batch_repeat', int,  1,                  "Batch merge repeats.")
@@ -91,7 +92,10 @@ def prepare_reader(is_train, pyreader, args, pass_id=1):
     # NOTE: always use infinite reader for dist training
     if is_train:
         reader = train(
-            data_dir=args.data_dir, pass_id_as_seed=pass_id, infinite=True)
+            data_dir=args.data_dir,
+            pass_id_as_seed=pass_id,
+            infinite=True,
+            draft=args.draft_decode)
     else:
         reader = val(data_dir=args.data_dir)
     if is_train:
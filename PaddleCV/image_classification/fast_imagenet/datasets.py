@@ -14,10 +14,14 @@
 
 from PIL import Image
 
+import io
 import os
 import os.path
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import record_shard
+
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
 
 
@@ -173,6 +177,12 @@ def default_loader(path):
     return pil_loader(path)
 
 
+def lazy_loader(path):
+    # the image is decoded later, eg: at a reduced scale by
+    # 'transforms.RandomResizedCrop' with 'draft' set
+    return Image.open(path)
+
+
 class ImageFolder(DatasetFolder):
     """A generic data loader where the images are arranged in this way: ::
 
@@ -210,3 +220,52 @@ class ImageFolder(DatasetFolder):
             transform=transform,
             target_transform=target_transform)
         self.imgs = self.samples
+
+
+class RecordShardFolder(object):
+    """A data loader reading images from record shards made by
+    'make_record_shards.py', which is faster than 'ImageFolder' when
+    opening a lot of small files is slow: ::
+
+        prefix-00000-of-00128.rec
+        prefix-00000-of-00128.idx
+        ...
+
+    Args:
+        prefix (string): prefix of the record shards.
+        transform (callable, optional): same as 'ImageFolder'
+        target_transform (callable, optional): same as 'ImageFolder'
+        lazy (bool): whether to return images not decoded yet, like
+            'lazy_loader'
+    """
+
+    def __init__(self,
+                 prefix,
+                 transform=None,
+                 target_transform=None,
+                 lazy=False):
+        self.prefix = prefix
+        self.transform = transform
+        self.target_transform = target_transform
+        self.lazy = lazy
+        self.shards = record_shard.RecordShards(prefix)
+
+    def epoch_indices(self, shuffle=True, seed=None):
+        """Indices with shard-level shuffle, see 'RecordShards.epoch_indices'
+        """
+        return self.shards.epoch_indices(shuffle, seed)
+
+    def __getitem__(self, index):
+        data, target = self.shards[index]
+        sample = Image.open(io.BytesIO(data.tostring()))
+        if not self.lazy:
+            sample = sample.convert('RGB')
+        if self.transform is not None:
+            sample = self.transform(sample)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+
+        return sample, target
+
+    def __len__(self):
+        return len(self.shards)
@@ -23,15 +23,22 @@ import random
 import pickle
 from tqdm import tqdm
 import time
+import threading
 import multiprocessing
 
 import transforms
 import datasets
 
-FINISH_EVENT = "FINISH_EVENT"
-
 
 class PaddleDataLoader(object):
+    """Load samples of 'dataset' by 'concurrent' worker processes.
+
+    Workers take indices from a shared queue, so a slow sample only delays
+    the worker loading it instead of all samples assigned to that worker.
+    At most 'queue_size' samples are in flight, and samples are returned
+    in the order of indices.
+    """
+
     def __init__(self,
                  dataset,
                  indices=None,
@@ -44,67 +51,122 @@ class PaddleDataLoader(object):
         self.concurrent = concurrent
         self.shuffle = shuffle
         self.shuffle_seed = shuffle_seed
-        self.queue_size = queue_size // self.concurrent
+        self.queue_size = queue_size
 
-    def _worker_loop(self, queue, worker_indices, worker_id):
+    def _worker_loop(self, index_queue, data_queue, worker_id):
+        # forked workers share the random state of the parent
+        random.seed(self.shuffle_seed * self.concurrent + worker_id)
+        np.random.seed(self.shuffle_seed * self.concurrent + worker_id)
         cnt = 0
-        for idx in worker_indices:
+        while True:
+            task = index_queue.get()
+            if task is None:
+                break
+            seq, idx = task
+            try:
+                img, label = self.dataset[idx]
+                img = np.array(img).astype('uint8').transpose((2, 0, 1))
+            except Exception as e:
+                data_queue.put((seq, None, "worker: [%d] failed to read "
+                                "sample [%d]: %s" % (worker_id, idx, str(e))))
+                break
+            data_queue.put((seq, img, label))
             cnt += 1
-            img, label = self.dataset[idx]
-            img = np.array(img).astype('uint8').transpose((2, 0, 1))
-            queue.put((img, label))
         print("worker: [%d] read [%d] samples. " % (worker_id, cnt))
-        queue.put(FINISH_EVENT)
+
+    def _feed(self, index_queue, indices, in_flight, stop):
+        for seq, idx in enumerate(indices):
+            in_flight.acquire()
+            if stop.is_set():
+                return
+            index_queue.put((seq, idx))
+        for _ in range(self.concurrent):
+            index_queue.put(None)
 
     def reader(self):
         def _reader_creator():
-            worker_processes = []
-            index_queues = []
             total_img = len(self.dataset)
             print("total image: ", total_img)
-            if self.shuffle:
-                self.indices = [i for i in xrange(total_img)]
+            if self.shuffle and hasattr(self.dataset, 'epoch_indices'):
+                # shuffle shards and records in each shard, so that
+                # workers read a few shards at the same time
+                self.indices = self.dataset.epoch_indices(
+                    shuffle=True, seed=self.shuffle_seed)
+                print("shuffle indices: %s ..." % self.indices[:10])
+            elif self.shuffle:
+                self.indices = [i for i in range(total_img)]
                 random.seed(self.shuffle_seed)
                 random.shuffle(self.indices)
                 print("shuffle indices: %s ..." % self.indices[:10])
+            indices = self.indices
+            if indices is None:
+                indices = range(total_img)
 
-            imgs_per_worker = int(math.ceil(total_img / self.concurrent))
-            for i in xrange(self.concurrent):
-                start = i * imgs_per_worker
-                end = (i + 1
-                       ) * imgs_per_worker if i != self.concurrent - 1 else None
-                sliced_indices = self.indices[start:end]
-                index_queue = multiprocessing.Queue(self.queue_size)
+            index_queue = multiprocessing.Queue()
+            data_queue = multiprocessing.Queue()
+            worker_processes = []
+            for i in range(self.concurrent):
                 w = multiprocessing.Process(
                     target=self._worker_loop,
-                    args=(index_queue, sliced_indices, i))
+                    args=(index_queue, data_queue, i))
                 w.daemon = True
                 w.start()
                 worker_processes.append(w)
-                index_queues.append(index_queue)
-            finish_workers = 0
-            worker_cnt = len(worker_processes)
-            recv_index = 0
-            while finish_workers < worker_cnt:
-                while (index_queues[recv_index].empty()):
-                    recv_index = (recv_index + 1) % self.concurrent
-                sample = index_queues[recv_index].get()
-                recv_index = (recv_index + 1) % self.concurrent
-                if sample == FINISH_EVENT:
-                    finish_workers += 1
-                else:
+
+            in_flight = threading.Semaphore(self.queue_size)
+            stop = threading.Event()
+            feeder = threading.Thread(
+                target=self._feed,
+                args=(index_queue, indices, in_flight, stop))
+            feeder.daemon = True
+            feeder.start()
+
+            reorder_buf = {}
+            try:
+                for seq in range(len(indices)):
+                    while seq not in reorder_buf:
+                        # blocks until any worker puts a sample
+                        recv_seq, img, label = data_queue.get()
+                        if img is None:
+                            raise ValueError(label)
+                        reorder_buf[recv_seq] = (img, label)
+                    sample = reorder_buf.pop(seq)
+                    in_flight.release()
                     yield sample
+            finally:
+                stop.set()
+                in_flight.release()
+                for w in worker_processes:
+                    if w.is_alive():
+                        w.terminate()
+                    w.join()
 
         return _reader_creator
 
 
-def train(traindir, sz, min_scale=0.08, shuffle_seed=0):
+def _image_dataset(root, transform, lazy=False):
+    """ read images from record shards with prefix 'root' if there are,
+        otherwise from image folder 'root'. Images are not decoded
+        by the dataset if 'lazy' is set.
+    """
+    prefix = root.rstrip('/')
+    if datasets.record_shard.has_shards(prefix):
+        print("read images from record shards: %s" % prefix)
+        return datasets.RecordShardFolder(prefix, transform, lazy=lazy)
+    loader = datasets.lazy_loader if lazy else datasets.default_loader
+    return datasets.ImageFolder(root, transform, loader=loader)
+
+
+def train(traindir, sz, min_scale=0.08, shuffle_seed=0, draft=False):
+    # with 'draft', JPEG images are decoded at a reduced scale
+    # which is enough for the cropped region
     train_tfms = [
         transforms.RandomResizedCrop(
-            sz, scale=(min_scale, 1.0)), transforms.RandomHorizontalFlip()
+            sz, scale=(min_scale, 1.0), draft=draft),
+        transforms.RandomHorizontalFlip()
     ]
-    train_dataset = datasets.ImageFolder(traindir,
-                                         transforms.Compose(train_tfms))
+    train_dataset = _image_dataset(
+        traindir, transforms.Compose(train_tfms), lazy=draft)
     return PaddleDataLoader(train_dataset, shuffle_seed=shuffle_seed).reader()
 
 
@@ -121,7 +183,7 @@ def test(valdir, bs, sz, rect_val=False):
             shuffle=False).reader()
 
     val_tfms = [transforms.Resize(int(sz * 1.14)), transforms.CenterCrop(sz)]
-    val_dataset = datasets.ImageFolder(valdir, transforms.Compose(val_tfms))
+    val_dataset = _image_dataset(valdir, transforms.Compose(val_tfms))
 
     return PaddleDataLoader(val_dataset).reader()
 
@@ -0,0 +1,165 @@
+#copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Benchmark reader.PaddleDataLoader against loading with indices split
+statically between workers, which polls the queues of workers in turn.
+Samples are synthetic images whose loading time follows a long tail, like
+reading from a network file system, eg:
+
+    python tools/benchmark_loader.py --samples 2000 --workers 8
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import reader
+
+FINISH_EVENT = "FINISH_EVENT"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--samples', type=int, default=2000, help='number of samples')
+    parser.add_argument(
+        '--workers', type=int, default=8, help='number of workers')
+    parser.add_argument(
+        '--size', type=int, default=224, help='size of images')
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=2.,
+        help='median latency(ms) of loading a sample')
+    parser.add_argument(
+        '--slow_ratio',
+        type=float,
+        default=0.01,
+        help='ratio of samples 50 times slower than median')
+    return parser.parse_args()
+
+
+class SyntheticDataset(object):
+    def __init__(self, num, size, latency, slow_ratio, seed=0):
+        rng = np.random.RandomState(seed)
+        self.latency = rng.lognormal(
+            math.log(latency / 1000.), 0.5, size=num)
+        slow = rng.rand(num) < slow_ratio
+        self.latency[slow] *= 50
+        self.image = rng.randint(0, 255, (size, size, 3)).astype('uint8')
+
+    def __getitem__(self, idx):
+        time.sleep(self.latency[idx])
+        return self.image, idx
+
+    def __len__(self):
+        return len(self.latency)
+
+
+class StaticSplitLoader(reader.PaddleDataLoader):
+    """ split indices between workers in contiguous slices, and poll the
+        queues of workers in turn until one is not empty
+    """
+
+    def _worker_loop(self, queue, worker_indices, worker_id):
+        for idx in worker_indices:
+            img, label = self.dataset[idx]
+            img = np.array(img).astype('uint8').transpose((2, 0, 1))
+            queue.put((img, label))
+        queue.put(FINISH_EVENT)
+
+    def reader(self):
+        def _reader_creator():
+            worker_processes = []
+            index_queues = []
+            total_img = len(self.dataset)
+            if self.shuffle:
+                self.indices = [i for i in range(total_img)]
+                random.seed(self.shuffle_seed)
+                random.shuffle(self.indices)
+            queue_size = self.queue_size // self.concurrent
+            imgs_per_worker = int(math.ceil(total_img / self.concurrent))
+            for i in range(self.concurrent):
+                start = i * imgs_per_worker
+                end = (i + 1
+                       ) * imgs_per_worker if i != self.concurrent - 1 else None
+                index_queue = multiprocessing.Queue(queue_size)
+                w = multiprocessing.Process(
+                    target=self._worker_loop,
+                    args=(index_queue, self.indices[start:end], i))
+                w.daemon = True
+                w.start()
+                worker_processes.append(w)
+                index_queues.append(index_queue)
+            finish_workers = 0
+            recv_index = 0
+            while finish_workers < len(worker_processes):
+                while (index_queues[recv_index].empty()):
+                    recv_index = (recv_index + 1) % self.concurrent
+                sample = index_queues[recv_index].get()
+                recv_index = (recv_index + 1) % self.concurrent
+                if isinstance(sample, str) and sample == FINISH_EVENT:
+                    finish_workers += 1
+                else:
+                    yield sample
+
+        return _reader_creator
+
+
+def _cpu_time():
+    """ cpu time used by this process, excluding workers """
+    t = os.times()
+    return t[0] + t[1]
+
+
+def run(loader_cls, dataset, args):
+    loader = loader_cls(
+        dataset, concurrent=args.workers, queue_size=256, shuffle=True)
+    st, cpu_st = time.time(), _cpu_time()
+    labels = [label for _, label in loader.reader()()]
+    cost, cpu = time.time() - st, _cpu_time() - cpu_st
+    assert sorted(labels) == list(range(len(dataset))), 'samples mismatch'
+    return cost, cpu, labels
+
+
+def main():
+    args = parse_args()
+    dataset = SyntheticDataset(args.samples, args.size, args.latency,
+                               args.slow_ratio)
+    ideal = dataset.latency.sum() / args.workers
+    print("samples: %d, workers: %d, ideal time: %.2fs" %
+          (args.samples, args.workers, ideal))
+    print('%-20s %-10s %-12s %-16s %-10s' %
+          ('loader', 'time(s)', 'samples/s', 'reader cpu(s)', 'ordered'))
+    for name, loader_cls in [('static split', StaticSplitLoader),
+                             ('work stealing', reader.PaddleDataLoader)]:
+        cost, cpu, labels = run(loader_cls, dataset, args)
+        random.seed(0)
+        expected = list(range(args.samples))
+        random.shuffle(expected)
+        print('%-20s %-10.2f %-12.1f %-16.2f %-10s' %
+              (name, cost, args.samples / cost, cpu, labels == expected))
+
+
+if __name__ == '__main__':
+    main()
@@ -57,6 +57,7 @@ def parse_args():
     add_arg('log_period',       int,    30,                 "Print period, defualt is 5.")
     add_arg('memory_optimize',  bool,   True,               "Whether to enable memory optimize.")
     add_arg('best_acc5',        float,  0.93,               "The best acc5, default is 93%.")
+    add_arg('draft_decode',     bool,   False,              "Whether to decode JPEG images at a reduced scale for the random crop.")
     # yapf: enable
     args = parser.parse_args()
     return args
@@ -297,7 +298,8 @@ def prepare_reader(epoch_id, train_py_reader, train_bs, val_bs, trn_dir,
         traindir="%s/%strain" % (args.data_dir, trn_dir),
         sz=img_dim,
         min_scale=min_scale,
-        shuffle_seed=epoch_id + 1)
+        shuffle_seed=epoch_id + 1,
+        draft=args.draft_decode)
     train_py_reader.decorate_paddle_reader(
         paddle.batch(
             train_reader, batch_size=train_bs))
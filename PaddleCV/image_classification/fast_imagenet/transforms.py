@@ -62,6 +62,25 @@ def resize(img, size, interpolation=Image.BILINEAR):
         return img.resize(size[::-1], interpolation)
 
 
+def draft(img, region, size):
+    """Let the JPEG 'img' which is not loaded yet be decoded at the smallest
+    scale(1/2, 1/4 or 1/8) at which 'region'(h, w) of it is still not smaller
+    than 'size'(h, w). Nothing is done for loaded images or other formats.
+
+    Returns:
+        tuple: (sy, sx), scales of the decoded image to the original one
+    """
+    width, height = img.size
+    reduce = 1
+    while reduce < 8 and region[0] >= 2 * reduce * size[0] and \
+            region[1] >= 2 * reduce * size[1]:
+        reduce *= 2
+    if reduce > 1:
+        img.draft(img.mode, (max(width // reduce, 1), max(height // reduce,
+                                                           1)))
+    return float(img.size[1]) / height, float(img.size[0]) / width
+
+
 def center_crop(img, output_size):
     if isinstance(output_size, int):
         output_size = (output_size, output_size)
@@ -162,13 +181,16 @@ class RandomResizedCrop(object):
         scale: range of ratio of the origin size to be cropped
         ratio: range of aspect ratio of the origin aspect ratio to be cropped
         interpolation: interpolation method
+        draft: whether to decode the JPEG image at a reduced scale for the
+            cropped region, the image should not be loaded yet
     """
 
     def __init__(self,
                  size,
                  scale=(0.08, 1.0),
                  ratio=(3. / 4., 4. / 3.),
-                 interpolation=Image.BILINEAR):
+                 interpolation=Image.BILINEAR,
+                 draft=False):
         if isinstance(size, tuple):
             self._size = size
         else:
@@ -179,6 +201,7 @@ class RandomResizedCrop(object):
         self._interpolation = interpolation
         self._scale = scale
         self._ratio = ratio
+        self._draft = draft
 
     @staticmethod
     def get_params(img, scale, ratio):
@@ -233,6 +256,13 @@ class RandomResizedCrop(object):
         """
         i, j, h, w = self.get_params(img, self._scale, self._ratio)
         assert _is_pil_image(img), 'image should be a PIL Image'
+        if self._draft:
+            sy, sx = draft(img, (h, w), self._size)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            # crop and resize in one pass with subpixel accurate box
+            box = (j * sx, i * sy, (j + w) * sx, (i + h) * sy)
+            return img.resize(self._size[::-1], self._interpolation, box=box)
         img = crop(img, i, j, h, w)
         img = resize(img, self._size, self._interpolation)
         return img
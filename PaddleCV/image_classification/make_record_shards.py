@@ -0,0 +1,114 @@
+#copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Pack images to record shards which are read by reader.py, reader_cv2.py
+and fast_imagenet/reader.py instead of the image files, eg:
+
+    # images listed in train_list.txt, read by reader.train()
+    python make_record_shards.py --data_dir=./data/ILSVRC2012/ \\
+        --file_list=train_list.txt --output_prefix=train --num_shards=256
+    python make_record_shards.py --data_dir=./data/ILSVRC2012/ \\
+        --file_list=val_list.txt --output_prefix=val --num_shards=32 \\
+        --shuffle=False
+
+    # images in class folders, read by fast_imagenet/reader.py
+    python make_record_shards.py --data_dir=/data/imagenet/sz/160 \\
+        --image_folder=train --output_prefix=train --num_shards=256
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+import random
+import argparse
+import functools
+
+from utils import record_shard
+from utils.utility import add_arguments, print_arguments
+
+parser = argparse.ArgumentParser(description=__doc__)
+add_arg = functools.partial(add_arguments, argparser=parser)
+# yapf: disable
+add_arg('data_dir',       str,  "./data/ILSVRC2012/", "The dataset root dir.")
+add_arg('file_list',      str,  None,                 "List file of 'image_path label' lines, relative to data_dir.")
+add_arg('image_folder',   str,  None,                 "Folder of one sub-folder per class, relative to data_dir.")
+add_arg('output_prefix',  str,  "train",              "Prefix of shards, relative to data_dir.")
+add_arg('num_shards',     int,  256,                  "Number of shards.")
+add_arg('shuffle',        bool, True,                 "Whether to shuffle images before packing, so every shard has all classes.")
+add_arg('shuffle_seed',   int,  0,                    "Seed to shuffle images.")
+# yapf: enable
+
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def list_file_samples(data_dir, file_list):
+    samples = []
+    with open(os.path.join(data_dir, file_list)) as flist:
+        for line in flist:
+            if not line.strip():
+                continue
+            img_path, label = line.split()
+            samples.append((os.path.join(data_dir, img_path), int(label)))
+    return samples
+
+
+def image_folder_samples(root):
+    """ list images and labels in the same order as fast_imagenet's
+        'datasets.ImageFolder'
+    """
+    classes = sorted(d for d in os.listdir(root)
+                     if os.path.isdir(os.path.join(root, d)))
+    samples = []
+    for label, target in enumerate(classes):
+        for dirpath, _, fnames in sorted(os.walk(os.path.join(root, target))):
+            for fname in sorted(fnames):
+                if fname.lower().endswith(IMG_EXTENSIONS):
+                    samples.append((os.path.join(dirpath, fname), label))
+    return samples
+
+
+def main(args):
+    assert (args.file_list is None) != (args.image_folder is None), \
+        "exactly one of file_list and image_folder should be set"
+    if args.file_list is not None:
+        samples = list_file_samples(args.data_dir, args.file_list)
+    else:
+        samples = image_folder_samples(
+            os.path.join(args.data_dir, args.image_folder))
+    if args.shuffle:
+        random.seed(args.shuffle_seed)
+        random.shuffle(samples)
+
+    prefix = os.path.join(args.data_dir, args.output_prefix)
+    assert not record_shard.has_shards(prefix), \
+        "record shards with prefix[%s] already exist" % (prefix)
+
+    start = time.time()
+    with record_shard.RecordShardWriter(prefix, args.num_shards) as writer:
+        for i, (img_path, label) in enumerate(samples):
+            with open(img_path, 'rb') as f:
+                writer.write(f.read(), label)
+            if (i + 1) % 10000 == 0:
+                print("packed %d/%d images, %.1f images/s" %
+                      (i + 1, len(samples), (i + 1) / (time.time() - start)))
+    print("packed %d images to %d shards with prefix %s" %
+          (len(samples), args.num_shards, prefix))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    print_arguments(args)
+    main(args)
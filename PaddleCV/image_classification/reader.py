@@ -13,6 +13,7 @@
 #limitations under the License.
 
 import os
+import io
 import math
 import random
 import functools
@@ -20,6 +21,7 @@ import numpy as np
 from PIL import Image, ImageEnhance
 
 import paddle
+from utils import record_shard, shared_batch
 
 random.seed(0)
 np.random.seed(0)
@@ -58,30 +60,62 @@ def crop_image(img, target_size, center):
     return img
 
 
-def random_crop(img, size, scale=[0.08, 1.0], ratio=[3. / 4., 4. / 3.]):
+def random_crop_params(img_size,
+                       scale=[0.08, 1.0],
+                       ratio=[3. / 4., 4. / 3.]):
+    """ get the box (i, j, w, h) of a random crop in image of 'img_size'
+    """
     aspect_ratio = math.sqrt(np.random.uniform(*ratio))
     w = 1. * aspect_ratio
     h = 1. / aspect_ratio
 
-    bound = min((float(img.size[0]) / img.size[1]) / (w**2),
-                (float(img.size[1]) / img.size[0]) / (h**2))
+    bound = min((float(img_size[0]) / img_size[1]) / (w**2),
+                (float(img_size[1]) / img_size[0]) / (h**2))
     scale_max = min(scale[1], bound)
     scale_min = min(scale[0], bound)
 
-    target_area = img.size[0] * img.size[1] * np.random.uniform(scale_min,
+    target_area = img_size[0] * img_size[1] * np.random.uniform(scale_min,
                                                                 scale_max)
     target_size = math.sqrt(target_area)
     w = int(target_size * w)
     h = int(target_size * h)
 
-    i = np.random.randint(0, img.size[0] - w + 1)
-    j = np.random.randint(0, img.size[1] - h + 1)
+    i = np.random.randint(0, img_size[0] - w + 1)
+    j = np.random.randint(0, img_size[1] - h + 1)
+    return i, j, w, h
+
+
+def random_crop(img, size, scale=[0.08, 1.0], ratio=[3. / 4., 4. / 3.]):
+    i, j, w, h = random_crop_params(img.size, scale, ratio)
 
     img = img.crop((i, j, i + w, j + h))
     img = img.resize((size, size), Image.LANCZOS)
     return img
 
 
+def random_crop_draft(img, size, scale=[0.08, 1.0], ratio=[3. / 4., 4. / 3.]):
+    """ same as random_crop, but the JPEG image 'img' which is not loaded
+        yet is decoded at the smallest scale(1/2, 1/4 or 1/8) at which the
+        cropped region is not smaller than 'size'
+    """
+    width, height = img.size
+    i, j, w, h = random_crop_params(img.size, scale, ratio)
+
+    reduce = 1
+    while reduce < 8 and min(w, h) >= 2 * reduce * size:
+        reduce *= 2
+    if reduce > 1:
+        # nothing is done if 'img' is loaded or not a JPEG image
+        img.draft(img.mode, (max(width // reduce, 1), max(height // reduce,
+                                                           1)))
+
+    # crop and resize in one pass with subpixel accurate box
+    sx = float(img.size[0]) / width
+    sy = float(img.size[1]) / height
+    box = (i * sx, j * sy, (i + w) * sx, (j + h) * sy)
+    return img.resize((size, size), Image.LANCZOS, box=box)
+
+
 def rotate_image(img):
     angle = np.random.randint(-10, 11)
     img = img.rotate(angle)
@@ -111,11 +145,22 @@ def distort_color(img):
     return img
 
 
-def process_image(sample, mode, color_jitter, rotate):
+def process_image(sample,
+                  mode,
+                  color_jitter,
+                  rotate,
+                  to_uint8=False,
+                  draft=False):
     img_path = sample[0]
 
-    img = Image.open(img_path)
-    if mode == 'train':
+    if isinstance(img_path, np.ndarray):
+        # encoded image read from record shards
+        img = Image.open(io.BytesIO(img_path.tostring()))
+    else:
+        img = Image.open(img_path)
+    if mode == 'train' and draft and not rotate:
+        img = random_crop_draft(img, DATA_DIM)
+    elif mode == 'train':
         if rotate: img = rotate_image(img)
         img = random_crop(img, DATA_DIM)
     else:
@@ -130,9 +175,13 @@ def process_image(sample, mode, color_jitter, rotate):
     if img.mode != 'RGB':
         img = img.convert('RGB')
 
-    img = np.array(img).astype('float32').transpose((2, 0, 1)) / 255
-    img -= img_mean
-    img /= img_std
+    if to_uint8:
+        # normalized later for a whole batch by 'SharedBatchReader'
+        img = np.array(img).transpose((2, 0, 1))
+    else:
+        img = np.array(img).astype('float32').transpose((2, 0, 1)) / 255
+        img -= img_mean
+        img /= img_std
 
     if mode == 'train' or mode == 'val':
         return img, sample[1]
@@ -147,7 +196,10 @@ def _reader_creator(file_list,
                     rotate=False,
                     data_dir=DATA_DIR,
                     pass_id_as_seed=1,
-                    infinite=False):
+                    infinite=False,
+                    shard_prefix=None,
+                    batch_size=None,
+                    draft=False):
     def reader():
         with open(file_list) as flist:
             full_lines = [line.strip() for line in flist]
@@ -185,13 +237,73 @@ def _reader_creator(file_list,
                 pass_id_as_seed_counter += 1
                 print("passid ++, current: ", pass_id_as_seed_counter)
 
-    mapper = functools.partial(
-        process_image, mode=mode, color_jitter=color_jitter, rotate=rotate)
+    def shard_reader():
+        shards = record_shard.RecordShards(shard_prefix)
+        trainer_id, trainer_count = 0, 1
+        if mode == 'train' and os.getenv('PADDLE_TRAINING_ROLE'):
+            # distributed mode if the env var `PADDLE_TRAINING_ROLE` exits
+            trainer_id = int(os.getenv("PADDLE_TRAINER_ID", "0"))
+            trainer_count = int(os.getenv("PADDLE_TRAINERS_NUM", "1"))
+        pass_id_as_seed_counter = pass_id_as_seed
+        while True:
+            seed = pass_id_as_seed_counter if pass_id_as_seed_counter else None
+            epoch_reader = shards.reader(shuffle, seed, trainer_id,
+                                         trainer_count)
+            for data, label in epoch_reader():
+                if mode == 'train' or mode == 'val':
+                    yield data, label
+                elif mode == 'test':
+                    yield [data]
+            if not infinite:
+                break
+            pass_id_as_seed_counter += 1
+            print("passid ++, current: ", pass_id_as_seed_counter)
+
+    if shard_prefix is not None:
+        print("read images from record shards: %s" % shard_prefix)
+        reader = shard_reader
+
+    if batch_size is not None:
+        # uint8 images are batched in shared memory by worker processes
+        mapper = functools.partial(
+            process_image,
+            mode=mode,
+            color_jitter=color_jitter,
+            rotate=rotate,
+            to_uint8=True,
+            draft=draft)
+        return shared_batch.SharedBatchReader(
+            mapper,
+            reader,
+            batch_size, [3, DATA_DIM, DATA_DIM],
+            num_workers=THREAD,
+            mean=img_mean.reshape(-1),
+            std=img_std.reshape(-1),
+            drop_last=(mode == 'train'),
+            with_label=(mode != 'test'))
 
+    mapper = functools.partial(
+        process_image,
+        mode=mode,
+        color_jitter=color_jitter,
+        rotate=rotate,
+        draft=draft)
     return paddle.reader.xmap_readers(mapper, reader, THREAD, BUF_SIZE)
 
 
-def train(data_dir=DATA_DIR, pass_id_as_seed=1, infinite=False):
+def _shard_prefix(data_dir, name):
+    """ get the prefix of record shards made by 'make_record_shards.py'
+        for 'name' in 'data_dir', None if there is no such shards
+    """
+    prefix = os.path.join(data_dir, name)
+    return prefix if record_shard.has_shards(prefix) else None
+
+
+def train(data_dir=DATA_DIR,
+          pass_id_as_seed=1,
+          infinite=False,
+          batch_size=None,
+          draft=False):
     file_list = os.path.join(data_dir, 'train_list.txt')
     return _reader_creator(
         file_list,
@@ -201,16 +313,21 @@ def train(data_dir=DATA_DIR, pass_id_as_seed=1, infinite=False):
         rotate=False,
         data_dir=data_dir,
         pass_id_as_seed=pass_id_as_seed,
-        infinite=infinite)
+        infinite=infinite,
+        shard_prefix=_shard_prefix(data_dir, 'train'),
+        batch_size=batch_size,
+        draft=draft)
 
 
-def val(data_dir=DATA_DIR):
+def val(data_dir=DATA_DIR, batch_size=None):
     file_list = os.path.join(data_dir, 'val_list.txt')
     return _reader_creator(file_list, 'val', shuffle=False, 
-            data_dir=data_dir)
+            data_dir=data_dir, shard_prefix=_shard_prefix(data_dir, 'val'),
+            batch_size=batch_size)
 
 
-def test(data_dir=DATA_DIR):
+def test(data_dir=DATA_DIR, batch_size=None):
     file_list = os.path.join(data_dir, 'val_list.txt')
     return _reader_creator(file_list, 'test', shuffle=False, 
-            data_dir=data_dir)
+            data_dir=data_dir, shard_prefix=_shard_prefix(data_dir, 'val'),
+            batch_size=batch_size)
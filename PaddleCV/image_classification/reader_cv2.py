@@ -19,8 +19,10 @@ import functools
 import numpy as np
 import cv2
 import io
+from PIL import Image
 
 import paddle
+from utils import record_shard, shared_batch
 
 random.seed(0)
 np.random.seed(0)
@@ -44,8 +46,8 @@ def rotate_image(img):
     rotated = cv2.warpAffine(img, M, (w, h))
     return rotated
 
-def random_crop(img, size, settings, scale=None, ratio=None):
-    """ random_crop """
+def random_crop_params(height, width, settings, scale=None, ratio=None):
+    """ get the region (i, j, h, w) of a random crop """
     lower_scale = settings.lower_scale
     lower_ratio = settings.lower_ratio
     upper_ratio = settings.upper_ratio
@@ -57,20 +59,25 @@ def random_crop(img, size, settings, scale=None, ratio=None):
     w = 1. * aspect_ratio
     h = 1. / aspect_ratio
 
-    bound = min((float(img.shape[0]) / img.shape[1]) / (h**2),
-                (float(img.shape[1]) / img.shape[0]) / (w**2))
+    bound = min((float(height) / width) / (h**2),
+                (float(width) / height) / (w**2))
 
     scale_max = min(scale[1], bound)
     scale_min = min(scale[0], bound)
 
-    target_area = img.shape[0] * img.shape[1] * np.random.uniform(scale_min,
-                                                                  scale_max)
+    target_area = height * width * np.random.uniform(scale_min, scale_max)
     target_size = math.sqrt(target_area)
     w = int(target_size * w)
     h = int(target_size * h)
-    i = np.random.randint(0, img.shape[0] - h + 1)
-    j = np.random.randint(0, img.shape[1] - w + 1)
+    i = np.random.randint(0, height - h + 1)
+    j = np.random.randint(0, width - w + 1)
+    return i, j, h, w
 
+
+def random_crop(img, size, settings, scale=None, ratio=None):
+    """ random_crop """
+    i, j, h, w = random_crop_params(img.shape[0], img.shape[1], settings,
+                                    scale, ratio)
     img = img[i:i + h, j:j + w, :]
 
     resized = cv2.resize(img, (size, size)
@@ -78,6 +85,49 @@ def random_crop(img, size, settings, scale=None, ratio=None):
             )
     return resized
 
+
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+
+def decode_random_crop(img_path, size, settings, scale=None, ratio=None):
+    """ same as random_crop on the decoded image of 'img_path'(file name
+        or encoded ndarray), but the crop is computed from the size in the
+        header first, and JPEG images are decoded at the smallest scale
+        (1/2, 1/4 or 1/8) at which the cropped region is not smaller
+        than 'size'
+    """
+    if isinstance(img_path, np.ndarray):
+        data = img_path
+    else:
+        data = np.fromfile(img_path, dtype='uint8')
+    header = Image.open(io.BytesIO(data.tostring()))
+    width, height = header.size
+    i, j, h, w = random_crop_params(height, width, settings, scale, ratio)
+
+    reduce = 1
+    if header.format == 'JPEG':
+        while reduce < 8 and min(h, w) >= 2 * reduce * size:
+            reduce *= 2
+    img = cv2.imdecode(data, REDUCED_FLAGS[reduce])
+
+    sy = float(img.shape[0]) / height
+    sx = float(img.shape[1]) / width
+    y0, x0 = int(round(i * sy)), int(round(j * sx))
+    y1 = max(int(round((i + h) * sy)), y0 + 1)
+    x1 = max(int(round((j + w) * sx)), x0 + 1)
+    img = img[y0:y1, x0:x1, :]
+
+    resized = cv2.resize(img, (size, size)
+            #, interpolation=cv2.INTER_LANCZOS4
+            )
+    return resized
+
+
 def distort_color(img):
     return img
 
@@ -148,6 +198,13 @@ def create_mixup_reader(settings, rd):
                 
     return mixup_reader
 
+def _decode(img_path):
+    if isinstance(img_path, np.ndarray):
+        # encoded image read from record shards
+        return cv2.imdecode(img_path, cv2.IMREAD_COLOR)
+    return cv2.imread(img_path)
+
+
 def process_image(
                   sample,
                   settings,
@@ -156,36 +213,46 @@ def process_image(
                   rotate,
                   crop_size=224,
                   mean=None,
-                  std=None):
+                  std=None,
+                  to_uint8=False,
+                  reduced_decode=False):
     """ process_image """
 
     mean = [0.485, 0.456, 0.406] if mean is None else mean
     std = [0.229, 0.224, 0.225] if std is None else std
 
     img_path = sample[0]
-    img = cv2.imread(img_path)
-
     if mode == 'train':
-        if rotate:
-            img = rotate_image(img)
-        if crop_size > 0:
-            img = random_crop(img, crop_size,settings)
+        if reduced_decode and not rotate and crop_size > 0:
+            # crop and decode at a reduced scale in one step
+            img = decode_random_crop(img_path, crop_size, settings)
+        else:
+            img = _decode(img_path)
+            if rotate:
+                img = rotate_image(img)
+            if crop_size > 0:
+                img = random_crop(img, crop_size,settings)
         if color_jitter:
             img = distort_color(img)
         if np.random.randint(0, 2) == 1:
             img = img[:, ::-1, :]
     else:
+        img = _decode(img_path)
         if crop_size > 0:
             target_size = settings.resize_short_size
             img = resize_short(img, target_size)
 
             img = crop_image(img, target_size=crop_size, center=True)
 
-    img = img[:, :, ::-1].astype('float32').transpose((2, 0, 1)) / 255
-    img_mean = np.array(mean).reshape((3, 1, 1))
-    img_std = np.array(std).reshape((3, 1, 1))
-    img -= img_mean
-    img /= img_std
+    if to_uint8:
+        # normalized later for a whole batch by 'SharedBatchReader'
+        img = img[:, :, ::-1].transpose((2, 0, 1))
+    else:
+        img = img[:, :, ::-1].astype('float32').transpose((2, 0, 1)) / 255
+        img_mean = np.array(mean).reshape((3, 1, 1))
+        img_std = np.array(std).reshape((3, 1, 1))
+        img -= img_mean
+        img /= img_std
 
     if mode == 'train' or mode == 'val':
         return (img, sample[1])
@@ -205,7 +272,10 @@ def _reader_creator(settings,
                     color_jitter=False,
                     rotate=False,
                     data_dir=DATA_DIR,
-                    pass_id_as_seed=0):
+                    pass_id_as_seed=0,
+                    shard_prefix=None,
+                    batch_size=None,
+                    reduced_decode=False):
     def reader():
         with open(file_list) as flist:
             full_lines = [line.strip() for line in flist]
@@ -237,19 +307,67 @@ def _reader_creator(settings,
                     img_path = os.path.join(data_dir, img_path)
  
                     yield [img_path]
+
+    def shard_reader():
+        shards = record_shard.RecordShards(shard_prefix)
+        trainer_id, trainer_count = 0, 1
+        if mode == 'train' and os.getenv('PADDLE_TRAINING_ROLE'):
+            # distributed mode if the env var `PADDLE_TRAINING_ROLE` exits
+            trainer_id = int(os.getenv("PADDLE_TRAINER_ID", "0"))
+            trainer_count = int(os.getenv("PADDLE_TRAINERS_NUM", "1"))
+        seed = pass_id_as_seed if pass_id_as_seed else None
+        epoch_reader = shards.reader(shuffle, seed, trainer_id, trainer_count)
+        for data, label in epoch_reader():
+            if mode == 'train' or mode == 'val':
+                yield data, label
+            elif mode == 'test':
+                yield [data]
+
+    if shard_prefix is not None:
+        print("read images from record shards: %s" % shard_prefix)
+        reader = shard_reader
     crop_size = int(settings.image_shape.split(",")[2])
+    if batch_size is not None:
+        # uint8 images are batched in shared memory by worker processes
+        assert crop_size > 0, "images of a batch should have the same size"
+        image_mapper = functools.partial(
+            process_image,
+            settings=settings,
+            mode=mode,
+            color_jitter=color_jitter,
+            rotate=rotate,
+            crop_size=crop_size,
+            to_uint8=True,
+            reduced_decode=reduced_decode)
+        return shared_batch.SharedBatchReader(
+            image_mapper,
+            reader,
+            batch_size, [3, crop_size, crop_size],
+            num_workers=THREAD,
+            drop_last=(mode == 'train'),
+            with_label=(mode != 'test'))
+
     image_mapper = functools.partial(
         process_image,
         settings=settings,
         mode=mode,
         color_jitter=color_jitter,
         rotate=rotate,
-        crop_size=crop_size)
+        crop_size=crop_size,
+        reduced_decode=reduced_decode)
     reader = paddle.reader.xmap_readers(
         image_mapper, reader, THREAD, BUF_SIZE, order=False)
     return reader
 
-def train(settings, data_dir=DATA_DIR, pass_id_as_seed=0):
+
+def _shard_prefix(data_dir, name):
+    """ get the prefix of record shards made by 'make_record_shards.py'
+        for 'name' in 'data_dir', None if there is no such shards
+    """
+    prefix = os.path.join(data_dir, name)
+    return prefix if record_shard.has_shards(prefix) else None
+
+def train(settings, data_dir=DATA_DIR, pass_id_as_seed=0, batch_size=None):
     file_list = os.path.join(data_dir, 'train_list.txt')
     reader =  _reader_creator(
         settings,
@@ -260,18 +378,24 @@ def train(settings, data_dir=DATA_DIR, pass_id_as_seed=0):
         rotate=False,
         data_dir=data_dir,
         pass_id_as_seed=pass_id_as_seed,
+        shard_prefix=_shard_prefix(data_dir, 'train'),
+        batch_size=batch_size,
+        reduced_decode=settings.reduced_decode,
         )
     if settings.use_mixup == True:
+        assert batch_size is None, "mixup is not supported for batched reader"
         reader = create_mixup_reader(settings, reader)
     return reader
 
-def val(settings,data_dir=DATA_DIR):
+def val(settings,data_dir=DATA_DIR, batch_size=None):
     file_list = os.path.join(data_dir, 'val_list.txt')
     return _reader_creator(settings ,file_list, 'val', shuffle=False, 
-            data_dir=data_dir)
+            data_dir=data_dir, shard_prefix=_shard_prefix(data_dir, 'val'),
+            batch_size=batch_size)
 
 
-def test(settings,data_dir=DATA_DIR):
+def test(settings,data_dir=DATA_DIR, batch_size=None):
     file_list = os.path.join(data_dir, 'val_list.txt')
     return _reader_creator(settings, file_list, 'test', shuffle=False,
-            data_dir=data_dir)
+            data_dir=data_dir, shard_prefix=_shard_prefix(data_dir, 'val'),
+            batch_size=batch_size)
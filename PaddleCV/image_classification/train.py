@@ -85,6 +85,8 @@ add_arg('resize_short_size',      int,     256,      "Set the resize_short_size"
 add_arg('use_mixup',      bool,      False,        "Whether to use mixup or not")
 add_arg('mixup_alpha',      float,     0.2,      "Set the mixup_alpha parameter")
 add_arg('is_distill',       bool,  False,        "is distill or not")
+add_arg('use_shared_batch', bool,  False,        "Whether to assemble uint8 batches in shared memory by worker processes.")
+add_arg('reduced_decode',   bool,  False,        "Whether to decode JPEG images at a reduced scale for the random crop.")
 
 def optimizer_setting(params):
     ls = params["learning_strategy"]
@@ -405,7 +407,11 @@ def train(args):
     train_batch_size = args.batch_size / device_num
 
     test_batch_size = 16
-    if not args.enable_ce:
+    if not args.enable_ce and args.use_shared_batch:
+        train_reader = reader.train(
+            settings=args, batch_size=int(train_batch_size))
+        test_reader = reader.val(settings=args, batch_size=test_batch_size)
+    elif not args.enable_ce:
         train_reader = paddle.batch(
             reader.train(settings=args), batch_size=train_batch_size, drop_last=True)
         test_reader = paddle.batch(reader.val(settings=args), batch_size=test_batch_size)
@@ -422,8 +428,13 @@ def train(args):
         test_reader = paddle.batch(
             flowers.test(use_xmap=False), batch_size=test_batch_size)
 
-    train_py_reader.decorate_paddle_reader(train_reader)
-    test_py_reader.decorate_paddle_reader(test_reader)
+    if not args.enable_ce and args.use_shared_batch:
+        # readers yield batches of [images, labels] as numpy arrays
+        train_py_reader.decorate_tensor_provider(train_reader)
+        test_py_reader.decorate_tensor_provider(test_reader)
+    else:
+        train_py_reader.decorate_paddle_reader(train_reader)
+        test_py_reader.decorate_paddle_reader(test_reader)
 
     # use_ngraph is for CPU only, please refer to README_ngraph.md for details
     use_ngraph = os.getenv('FLAGS_use_ngraph')
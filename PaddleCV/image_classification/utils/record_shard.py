@@ -0,0 +1,183 @@
+#copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Packed record shards of encoded images.
+
+A dataset with prefix 'data/ILSVRC2012/train' is stored in files:
+
+    data/ILSVRC2012/train-00000-of-00128.rec
+    data/ILSVRC2012/train-00000-of-00128.idx
+    ...
+
+The '.rec' file is the concatenation of the encoded image files(eg: jpeg
+bytes as they are on disk), and the '.idx' file is a '.npy' array of int64
+with shape [N, 3], whose rows are (offset, length, label) of the records.
+The '.rec' files are memory-mapped, so reading a record is a slice of one
+big file instead of an open/stat/read of a small file.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import glob
+import mmap
+import numpy as np
+
+REC_SUFFIX = '.rec'
+IDX_SUFFIX = '.idx'
+
+
+def shard_name(prefix, shard_id, num_shards):
+    return '%s-%05d-of-%05d' % (prefix, shard_id, num_shards)
+
+
+def list_shards(prefix):
+    """List names(without suffix) of shards with 'prefix' in order"""
+    names = sorted(glob.glob(prefix + '-?????-of-?????' + REC_SUFFIX))
+    return [n[:-len(REC_SUFFIX)] for n in names]
+
+
+def has_shards(prefix):
+    """Whether there are record shards with 'prefix'"""
+    return len(list_shards(prefix)) > 0
+
+
+class RecordShardWriter(object):
+    """Write (encoded image, label) records to 'num_shards' shards with
+    'prefix', the i-th record is written to shard 'i % num_shards'.
+    """
+
+    def __init__(self, prefix, num_shards):
+        dirname = os.path.dirname(prefix)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self._names = [
+            shard_name(prefix, i, num_shards) for i in range(num_shards)
+        ]
+        self._files = [open(n + REC_SUFFIX, 'wb') for n in self._names]
+        self._offsets = [0] * num_shards
+        self._indexes = [[] for _ in range(num_shards)]
+        self._count = 0
+
+    def write(self, data, label):
+        shard_id = self._count % len(self._files)
+        self._files[shard_id].write(data)
+        self._indexes[shard_id].append(
+            (self._offsets[shard_id], len(data), label))
+        self._offsets[shard_id] += len(data)
+        self._count += 1
+
+    def close(self):
+        for name, f, index in zip(self._names, self._files, self._indexes):
+            f.close()
+            index = np.array(index, dtype='int64').reshape((-1, 3))
+            with open(name + IDX_SUFFIX, 'wb') as fi:
+                np.save(fi, index)
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RecordShards(object):
+    """Random access to records in shards with 'prefix'
+
+    The shards are memory-mapped lazily in each process, so an instance
+    can be created before worker processes are forked.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._names = list_shards(prefix)
+        assert len(self._names) > 0, \
+            "not found any record shard with prefix[%s]" % (prefix)
+        self._indexes = []
+        for name in self._names:
+            with open(name + IDX_SUFFIX, 'rb') as f:
+                self._indexes.append(np.load(f))
+        sizes = [len(index) for index in self._indexes]
+        self._starts = np.cumsum([0] + sizes)
+        self._maps = None
+        self._pid = None
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def _map(self, shard_id):
+        if self._pid != os.getpid():
+            self._maps = [None] * len(self._names)
+            self._pid = os.getpid()
+        if self._maps[shard_id] is None:
+            with open(self._names[shard_id] + REC_SUFFIX, 'rb') as f:
+                self._maps[shard_id] = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[shard_id]
+
+    def locate(self, idx):
+        """Get (shard id, position in shard) of the 'idx'-th record"""
+        shard_id = int(np.searchsorted(self._starts, idx, side='right')) - 1
+        return shard_id, idx - int(self._starts[shard_id])
+
+    def read(self, shard_id, pos):
+        """Get (encoded image as uint8 ndarray, label) of a record,
+        the ndarray is a view of the memory-mapped shard"""
+        offset, length, label = self._indexes[shard_id][pos]
+        data = np.frombuffer(
+            self._map(shard_id), dtype='uint8', count=length, offset=offset)
+        return data, int(label)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        return self.read(*self.locate(idx))
+
+    def label(self, idx):
+        shard_id, pos = self.locate(idx)
+        return int(self._indexes[shard_id][pos][2])
+
+    def epoch_indices(self, shuffle=True, seed=None):
+        """Get global indices of records for an epoch. If 'shuffle', the
+        order of shards is shuffled and so are records in each shard, so
+        records of one shard are still read together."""
+        rng = np.random.RandomState(seed)
+        shard_ids = np.arange(len(self._names))
+        if shuffle:
+            rng.shuffle(shard_ids)
+        indices = []
+        for shard_id in shard_ids:
+            index = np.arange(self._starts[shard_id],
+                              self._starts[shard_id + 1])
+            if shuffle:
+                rng.shuffle(index)
+            indices.append(index)
+        return np.concatenate(indices).tolist()
+
+    def reader(self, shuffle=False, seed=None, trainer_id=0, trainer_num=1):
+        """Create a reader of (encoded image, label) for an epoch, records
+        are split evenly between 'trainer_num' trainers"""
+
+        def _reader():
+            indices = self.epoch_indices(shuffle, seed)
+            per_trainer = len(indices) // trainer_num
+            if trainer_num > 1:
+                indices = indices[trainer_id * per_trainer:(trainer_id + 1) *
+                                  per_trainer]
+            for idx in indices:
+                yield self[idx]
+
+        return _reader
@@ -0,0 +1,225 @@
+#copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Assemble batches of uint8 images in shared memory.
+
+Worker processes map samples to uint8 CHW images and write them directly
+into a ring of preallocated batch buffers in shared memory, so only the
+sample sequence numbers go back through a queue. A full batch is converted
+to float32 and normalized in one vectorized pass, instead of normalizing
+every image in the workers and stacking them again in the feeder.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+import threading
+import multiprocessing
+import numpy as np
+from six.moves.queue import Full
+
+_END = 'end'
+_ERROR = 'error'
+
+
+class SharedBatchReader(object):
+    """Create a reader of batches [images, labels] from sample reader
+    'reader', where the images are normalized float32 with shape
+    [N, C, H, W] and the labels are int64 with shape [N, 1].
+
+    Args:
+        mapper (callable): map a sample to (uint8 CHW image, label), or to
+            (uint8 CHW image, ) if 'with_label' is False
+        reader (callable): reader of samples
+        batch_size (int): number of images in a batch
+        image_shape (list): [C, H, W] of the mapped images
+        num_workers (int): number of worker processes
+        ring_size (int): number of batch buffers, which is also the max
+            number of batches being assembled at the same time
+        mean (list): mean of channels, in range [0, 1]
+        std (list): std of channels, in range [0, 1]
+        drop_last (bool): whether to drop the last incomplete batch
+        with_label (bool): whether samples have labels
+    """
+
+    def __init__(self,
+                 mapper,
+                 reader,
+                 batch_size,
+                 image_shape,
+                 num_workers=8,
+                 ring_size=4,
+                 mean=None,
+                 std=None,
+                 drop_last=True,
+                 with_label=True):
+        self._mapper = mapper
+        self._reader = reader
+        self._batch_size = batch_size
+        self._image_shape = tuple(image_shape)
+        self._num_workers = num_workers
+        self._ring_size = ring_size
+        self._drop_last = drop_last
+        self._with_label = with_label
+
+        mean = [0.485, 0.456, 0.406] if mean is None else mean
+        std = [0.229, 0.224, 0.225] if std is None else std
+        # (x / 255 - mean) / std == x * scale - bias
+        shape = (1, -1, 1, 1)
+        self._scale = (1. / (255. * np.array(std))).reshape(shape).astype(
+            'float32')
+        self._bias = (np.array(mean) / np.array(std)).reshape(shape).astype(
+            'float32')
+
+        self._images = None
+        self._labels = None
+
+    def _alloc(self):
+        """allocate the ring of batch buffers in shared memory, which
+        should be done before forking workers"""
+        if self._images is not None:
+            return
+        image_size = int(np.prod(self._image_shape))
+        ring = self._ring_size * self._batch_size
+        self._images = multiprocessing.RawArray('B', ring * image_size)
+        self._labels = multiprocessing.RawArray('q', ring)
+
+    def _views(self):
+        images = np.frombuffer(
+            self._images, dtype='uint8').reshape((
+                self._ring_size, self._batch_size) + self._image_shape)
+        labels = np.frombuffer(
+            self._labels, dtype='int64').reshape(
+                (self._ring_size, self._batch_size, 1))
+        return images, labels
+
+    def _work(self, inq, outq):
+        # forked workers share the random state of the parent
+        np.random.seed()
+        random.seed()
+        images, labels = self._views()
+        while True:
+            item = inq.get()
+            if item is None:
+                break
+            seq, sample = item
+            slot, pos = divmod(seq, self._batch_size)
+            slot %= self._ring_size
+            try:
+                result = self._mapper(sample)
+                images[slot, pos] = result[0]
+                if self._with_label:
+                    labels[slot, pos, 0] = result[1]
+            except Exception as e:
+                outq.put((_ERROR, 'failed to map sample[%d], error: %s' %
+                          (seq, str(e))))
+                break
+            outq.put(seq)
+
+    def _feed(self, inq, outq, free_slots, stop):
+        def _put(item):
+            # workers may be terminated after 'stop' is set
+            while not stop.is_set():
+                try:
+                    inq.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        seq = 0
+        try:
+            for sample in self._reader():
+                if seq % self._batch_size == 0:
+                    # wait for a free batch buffer
+                    free_slots.acquire()
+                if not _put((seq, sample)):
+                    return
+                seq += 1
+        except Exception as e:
+            outq.put((_ERROR, 'failed to read sample[%d], error: %s' %
+                      (seq, str(e))))
+        finally:
+            for _ in range(self._num_workers):
+                _put(None)
+        outq.put((_END, seq))
+
+    def _normalize(self, images):
+        out = np.empty(images.shape, dtype='float32')
+        np.multiply(images, self._scale, out=out)
+        out -= self._bias
+        return out
+
+    def __call__(self):
+        self._alloc()
+        images, labels = self._views()
+        inq = multiprocessing.Queue(self._ring_size * self._batch_size)
+        outq = multiprocessing.Queue()
+        workers = []
+        for _ in range(self._num_workers):
+            w = multiprocessing.Process(target=self._work, args=(inq, outq))
+            w.daemon = True
+            w.start()
+            workers.append(w)
+
+        free_slots = threading.Semaphore(self._ring_size)
+        stop = threading.Event()
+        feeder = threading.Thread(
+            target=self._feed, args=(inq, outq, free_slots, stop))
+        feeder.daemon = True
+        feeder.start()
+
+        # number of mapped images in each batch buffer
+        filled = [0] * self._ring_size
+        batch_id = 0
+        total = None
+        try:
+            while True:
+                slot = batch_id % self._ring_size
+                start = batch_id * self._batch_size
+                if total is not None:
+                    size = min(self._batch_size, total - start)
+                    if size <= 0 or (self._drop_last and
+                                     size < self._batch_size):
+                        break
+                else:
+                    size = self._batch_size
+
+                if filled[slot] == size:
+                    batch = [self._normalize(images[slot, :size])]
+                    if self._with_label:
+                        batch.append(labels[slot, :size].copy())
+                    filled[slot] = 0
+                    free_slots.release()
+                    batch_id += 1
+                    yield batch
+                    continue
+
+                item = outq.get()
+                if isinstance(item, tuple):
+                    if item[0] == _ERROR:
+                        raise ValueError(item[1])
+                    total = item[1]
+                    continue
+                filled[(item // self._batch_size) % self._ring_size] += 1
+        finally:
+            stop.set()
+            # wake up the feeder if it waits for free buffers
+            for _ in range(self._ring_size):
+                free_slots.release()
+            for w in workers:
+                if w.is_alive():
+                    w.terminate()
+                w.join()
@@ -27,13 +27,13 @@ from ppdet.data.reader import Reader
 from ppdet.data.transform.operators import (
     DecodeImage, MixupImage, NormalizeBox, NormalizeImage, RandomDistort,
     RandomFlipImage, RandomInterpImage, ResizeImage, ExpandImage, CropImage,
-    Permute)
+    Permute, DistortNormalizePermute)
 from ppdet.data.transform.arrange_sample import (ArrangeRCNN, ArrangeTestRCNN,
                                                  ArrangeSSD, ArrangeTestSSD,
                                                  ArrangeYOLO, ArrangeTestYOLO)
 
 __all__ = [
-    'PadBatch', 'MultiScale', 'RandomShape', 'DataSet', 'CocoDataSet',
+    'PadBatch', 'MultiScale', 'RandomShape', 'BucketBatch', 'DataSet', 'CocoDataSet',
     'DataFeed', 'TrainFeed', 'EvalFeed', 'FasterRCNNTrainFeed',
     'MaskRCNNTrainFeed', 'FasterRCNNTestFeed', 'MaskRCNNTestFeed',
     'SSDTrainFeed', 'SSDEvalFeed', 'SSDTestFeed', 'YoloTrainFeed',
@@ -67,6 +67,9 @@ def create_reader(feed, max_iter=0):
         bufsize = feed.bufsize
     if getattr(feed, 'use_process', None) is not None:
         use_process = feed.use_process
+    ordered = False
+    if getattr(feed, 'ordered', None) is not None:
+        ordered = feed.ordered
 
     mode = feed.mode
     data_config = {
@@ -89,7 +92,8 @@ def create_reader(feed, max_iter=0):
         'WORKER_CONF': {
             'bufsize': bufsize,
             'worker_num': feed.num_workers,
-            'use_process': use_process
+            'use_process': use_process,
+            'ordered': ordered
         },
         'BATCH_SIZE': feed.batch_size,
         'DROP_LAST': feed.drop_last,
@@ -100,6 +104,10 @@ def create_reader(feed, max_iter=0):
     pad = [t for t in batch_transforms if isinstance(t, PadBatch)]
     rand_shape = [t for t in batch_transforms if isinstance(t, RandomShape)]
     multi_scale = [t for t in batch_transforms if isinstance(t, MultiScale)]
+    normalize = [
+        t for t in batch_transforms if isinstance(t, DistortNormalizePermute)
+    ]
+    bucket = [t for t in batch_transforms if isinstance(t, BucketBatch)]
 
     if any(pad):
         transform_config['IS_PADDING'] = True
@@ -109,12 +117,25 @@ def create_reader(feed, max_iter=0):
         transform_config['RANDOM_SHAPES'] = rand_shape[0].sizes
     if any(multi_scale):
         transform_config['MULTI_SCALES'] = multi_scale[0].scales
+    if any(bucket):
+        transform_config['BUCKET'] = {
+            'aspect_ratios': bucket[0].aspect_ratios,
+            'sizes': bucket[0].sizes
+        }
 
     if hasattr(inspect, 'getfullargspec'):
         argspec = inspect.getfullargspec
     else:
         argspec = inspect.getargspec
 
+    # images are normalized in batch instead of in sample transforms
+    if any(normalize):
+        argnames = argspec(DistortNormalizePermute.__init__).args
+        transform_config['NORMALIZE'] = {
+            k: v
+            for k, v in normalize[0].__dict__.items() if k in argnames
+        }
+
     ops = []
     for op in feed.sample_transforms:
         op_dict = op.__dict__.copy()
@@ -173,6 +194,24 @@ class RandomShape(object):
         self.sizes = sizes
 
 
+@serializable
+class BucketBatch(object):
+    """
+    Batch samples of similar shapes together, to reduce padding
+
+    Args:
+        aspect_ratios (list): list of float, thresholds of width / height
+            to split samples to buckets
+        sizes (list): list of int, thresholds of the longer side of image
+            to split samples to buckets
+    """
+
+    def __init__(self, aspect_ratios=[1.], sizes=[]):
+        super(BucketBatch, self).__init__()
+        self.aspect_ratios = aspect_ratios
+        self.sizes = sizes
+
+
 @serializable
 class DataSet(object):
     """
@@ -266,6 +305,10 @@ class DataFeed(object):
         shuffle (bool): if samples should be shuffled
         drop_last (bool): drop last batch if size is uneven
         num_workers (int): number of workers processes (or threads)
+        bufsize (int): size of queues used by workers
+        use_process (bool): use processes instead of threads as workers
+        ordered (bool): keep samples in the order of dataset when
+            using multiple workers
     """
     __category__ = 'data'
 
@@ -284,7 +327,8 @@ class DataFeed(object):
                  num_workers=2,
                  bufsize=10,
                  use_process=False,
-                 use_padded_im_info=False):
+                 use_padded_im_info=False,
+                 ordered=False):
         super(DataFeed, self).__init__()
         self.fields = fields
         self.image_shape = image_shape
@@ -301,6 +345,7 @@ class DataFeed(object):
         self.use_process = use_process
         self.dataset = dataset
         self.use_padded_im_info = use_padded_im_info
+        self.ordered = ordered
         if isinstance(dataset, dict):
             self.dataset = DataSet(**dataset)
 
@@ -355,7 +400,8 @@ class EvalFeed(DataFeed):
                  samples=-1,
                  drop_last=False,
                  with_background=True,
-                 num_workers=2):
+                 num_workers=2,
+                 ordered=False):
         super(EvalFeed, self).__init__(
             dataset,
             fields,
@@ -367,7 +413,8 @@ class EvalFeed(DataFeed):
             samples=samples,
             drop_last=drop_last,
             with_background=with_background,
-            num_workers=num_workers)
+            num_workers=num_workers,
+            ordered=ordered)
 
 
 @register
@@ -62,16 +62,22 @@ class Reader(object):
             worker_args = self._trans_conf[mode]['WORKER_CONF']
             worker_args = {k.lower(): v for k, v in worker_args.items()}
 
+        trans_conf = {k.lower(): v for k, v in self._trans_conf[mode].items()}
+        bucket = trans_conf.get('bucket', None)
+        if bucket is not None:
+            # images are still in HWC if normalized in batch
+            bucket = dict(bucket, channel_first='normalize' not in trans_conf)
+
         mapped_ds = map(sc, mapper, worker_args)
-        batched_ds = batch(mapped_ds, batchsize, drop_last)
+        batched_ds = batch(mapped_ds, batchsize, drop_last, bucket)
 
-        trans_conf = {k.lower(): v for k, v in self._trans_conf[mode].items()}
         need_keys = {
             'is_padding',
             'coarsest_stride',
             'random_shapes',
             'multi_scales',
             'use_padded_im_info',
+            'normalize',
         }
         bm_config = {
             key: value
@@ -97,6 +103,10 @@ class Reader(object):
                     n += 1
                     if maxit > 0 and n == maxit:
                         return
+                stats = batched_ds.stats()
+                if 'padding_fraction' in stats:
+                    logger.info('padding fraction of batches: {:.4f}'.format(
+                        stats['padding_fraction']))
                 batched_ds.reset()
                 if maxit <= 0:
                     return
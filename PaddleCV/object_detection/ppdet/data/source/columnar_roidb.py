@@ -0,0 +1,209 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# function:
+#    store roidb records in columns of numpy arrays, which can be
+#    saved to a directory and loaded back with memory mapping
+#
+# implementation notes:
+# - per-image fields('im_id', 'h', 'w') are stored in one array each
+# - per-instance fields('gt_bbox', 'gt_class', ...) of all records are
+#    concatenated, and 'inst_offsets' marks the instances of each record
+# - 'im_file' is stored as utf-8 bytes in a blob with offsets, and the
+#    other fields(eg: 'gt_poly') are pickled per record into another blob
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import six
+import logging
+import numpy as np
+
+if six.PY3:
+    import pickle
+else:
+    import cPickle as pickle
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.pkl'
+ROIDB_VERSION = 1
+
+
+def _to_blob(items):
+    """ concatenate bytes in 'items' to a blob with offsets
+    """
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(it) for it in items])
+    blob = np.frombuffer(b''.join(items), dtype=np.uint8)
+    return blob, offsets
+
+
+class ColumnarRoiDb(object):
+    """ a list-like container of roidb records stored in columns
+
+        every access by index builds a new record, so it can be modified
+        freely without 'copy.deepcopy', and the columns are memory-mapped
+        read-only when loaded from a directory, so they are shared by
+        all processes reading the same roidb
+    """
+    s_image_fields = ['im_id', 'h', 'w']
+    s_instance_fields = [
+        'gt_bbox', 'gt_class', 'gt_score', 'is_crowd', 'difficult'
+    ]
+
+    def __init__(self, columns, instance_fields, cname2cid=None):
+        """ Init
+
+        Args:
+            columns (dict): name to numpy array of columns
+            instance_fields (list): names of per-instance fields
+            cname2cid (dict): the label name to id dictionary
+        """
+        self._columns = columns
+        self._instance_fields = instance_fields
+        self.cname2cid = cname2cid
+        self._num = len(columns['im_file_offsets']) - 1
+
+    @classmethod
+    def from_records(cls, records, cname2cid=None):
+        """ build from a list of records loaded by 'loader.load'
+        """
+        assert len(records) > 0, 'no records to build ColumnarRoiDb'
+
+        def _is_instance_field(rec, k):
+            return k in rec and isinstance(rec[k], np.ndarray) \
+                and rec[k].shape[:1] == rec['gt_bbox'].shape[:1]
+
+        instance_fields = [
+            k for k in cls.s_instance_fields
+            if all(_is_instance_field(rec, k) for rec in records)
+        ]
+        stored = set(['im_file'] + cls.s_image_fields + instance_fields)
+
+        columns = {}
+        columns['im_file_data'], columns['im_file_offsets'] = _to_blob(
+            [rec['im_file'].encode('utf-8') for rec in records])
+        for k in cls.s_image_fields:
+            columns[k] = np.array([np.asarray(rec[k]).reshape(-1)[0]
+                                   for rec in records])
+
+        inst_num = [len(rec['gt_bbox']) for rec in records]
+        columns['inst_offsets'] = np.zeros(len(records) + 1, dtype=np.int64)
+        columns['inst_offsets'][1:] = np.cumsum(inst_num)
+        for k in instance_fields:
+            columns[k] = np.concatenate([rec[k] for rec in records], axis=0)
+
+        extras = [
+            pickle.dumps({k: v
+                          for k, v in rec.items() if k not in stored}, -1)
+            for rec in records
+        ]
+        columns['extra_data'], columns['extra_offsets'] = _to_blob(extras)
+        return cls(columns, instance_fields, cname2cid)
+
+    @classmethod
+    def load(cls, path, sample_num=-1, mmap=True):
+        """ load from directory 'path' which is saved by 'save'
+
+        Args:
+            path (str): directory of columns
+            sample_num (int): number of samples to load, -1 means all
+            mmap (bool): whether to memory-map the columns
+
+        Returns:
+            instance of ColumnarRoiDb
+        """
+        with open(os.path.join(path, META_FILE), 'rb') as f:
+            meta = pickle.load(f)
+        assert meta['version'] == ROIDB_VERSION, 'invalid version[%s] '\
+            'of columnar roidb[%s]' % (meta['version'], path)
+
+        mmap_mode = 'r' if mmap else None
+        columns = {}
+        for k in meta['columns']:
+            col = np.load(os.path.join(path, k + '.npy'), mmap_mode=mmap_mode)
+            # plain ndarray view is much faster to slice than np.memmap
+            columns[k] = col.view(np.ndarray)
+        roidb = cls(columns, meta['instance_fields'], meta['cname2cid'])
+        if sample_num > 0 and sample_num < len(roidb):
+            roidb = roidb.head(sample_num)
+        return roidb
+
+    def save(self, path):
+        """ save columns to directory 'path'
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        for k, v in self._columns.items():
+            np.save(os.path.join(path, k + '.npy'), v)
+
+        meta = {
+            'version': ROIDB_VERSION,
+            'columns': list(self._columns.keys()),
+            'instance_fields': self._instance_fields,
+            'cname2cid': self.cname2cid
+        }
+        with open(os.path.join(path, META_FILE), 'wb') as f:
+            pickle.dump(meta, f, 2)
+        logger.info('saved %d records to columnar roidb[%s]' %
+                    (self._num, path))
+
+    def head(self, num):
+        """ get a ColumnarRoiDb which contains the first 'num' records
+        """
+        num = min(num, self._num)
+        cols = self._columns
+        columns = dict(cols)
+        columns['im_file_offsets'] = cols['im_file_offsets'][:num + 1]
+        columns['extra_offsets'] = cols['extra_offsets'][:num + 1]
+        columns['inst_offsets'] = cols['inst_offsets'][:num + 1]
+        for k in self.s_image_fields:
+            columns[k] = cols[k][:num]
+        return ColumnarRoiDb(columns, self._instance_fields, self.cname2cid)
+
+    def __len__(self):
+        return self._num
+
+    def __getitem__(self, idx):
+        """ build a new record for 'idx'
+        """
+        if idx < 0:
+            idx += self._num
+        if idx < 0 or idx >= self._num:
+            raise IndexError('index[%d] out of range[%d]' % (idx, self._num))
+
+        cols = self._columns
+        start, end = cols['extra_offsets'][idx:idx + 2]
+        rec = pickle.loads(cols['extra_data'][start:end].tostring())
+
+        start, end = cols['im_file_offsets'][idx:idx + 2]
+        rec['im_file'] = cols['im_file_data'][start:end].tostring().decode(
+            'utf-8')
+        rec['im_id'] = cols['im_id'][idx:idx + 1].copy()
+        rec['h'] = cols['h'][idx].item()
+        rec['w'] = cols['w'][idx].item()
+
+        # instance fields are copied, for they may be modified in place
+        start, end = cols['inst_offsets'][idx:idx + 2]
+        for k in self._instance_fields:
+            rec[k] = cols[k][start:end].copy()
+        return rec
+
+    def __iter__(self):
+        for i in range(self._num):
+            yield self[i]
@@ -21,6 +21,9 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
+import uuid
+import shutil
+import hashlib
 
 import numpy as np
 import logging
@@ -28,6 +31,12 @@ import pickle as pkl
 
 logger = logging.getLogger(__name__)
 
+# parsed annotations are cached in this directory by default
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.cache/paddle/ppdet/roidb')
+
+# bump it when the parsing of annotations changes
+CACHE_VERSION = 1
+
 
 def check_records(records):
     """ check the fields of 'records' must contains some keys
@@ -92,7 +101,9 @@ def load(fname,
 
     Args:
         fnames (str): file name for data record, eg:
-            instances_val2017.json or COCO17_val2017.roidb
+            instances_val2017.json or COCO17_val2017.roidb, or directory
+            of columnar roidb saved by 'ColumnarRoiDb.save', in which
+            case an instance of 'ColumnarRoiDb' is returned as records
         samples (int): number of samples to load, default to all
         with_background (bool): whether load background as a class.
                                 default True.
@@ -115,7 +126,14 @@ def load(fname,
 
     """
 
-    if fname.endswith('.roidb'):
+    if os.path.isdir(fname):
+        from .columnar_roidb import ColumnarRoiDb
+        records = ColumnarRoiDb.load(fname, samples)
+        if with_cat2id:
+            return records, records.cname2cid
+        else:
+            return records
+    elif fname.endswith('.roidb'):
         records, cname2cid = load_roidb(fname, samples)
     elif fname.endswith('.json'):
         from . import coco_loader
@@ -135,3 +153,108 @@ def load(fname,
         return records, cname2cid
     else:
         return records
+
+
+def _update_with_file(md5, fname, bufsize=1 << 20):
+    with open(fname, 'rb') as f:
+        while True:
+            buf = f.read(bufsize)
+            if not buf:
+                break
+            md5.update(buf)
+
+
+def cache_key(fname,
+              samples=-1,
+              with_background=True,
+              use_default_label=None,
+              cname2cid=None):
+    """ get the key of cached records loaded from 'fname', which is
+        the md5 of the content of 'fname' and the loading arguments.
+
+        For VOC list files, the name, size and modify time of each xml
+        file are also hashed instead of their content, which is much
+        faster and changes if any of them is edited.
+    """
+    md5 = hashlib.md5()
+    args = [
+        CACHE_VERSION, samples, with_background, use_default_label,
+        sorted(cname2cid.items()) if cname2cid is not None else None
+    ]
+    md5.update(str(args).encode('utf-8'))
+    _update_with_file(md5, fname)
+    if not fname.endswith('.roidb') and not fname.endswith('.json'):
+        from . import voc_loader
+        for xml_file in voc_loader.list_xml_files(fname, samples):
+            st = os.stat(xml_file)
+            md5.update(('%s:%d:%d' % (xml_file, st.st_size,
+                                      int(st.st_mtime))).encode('utf-8'))
+    return md5.hexdigest()
+
+
+def load_cached(fname,
+                samples=-1,
+                with_background=True,
+                use_default_label=None,
+                cname2cid=None,
+                cache_dir=DEFAULT_CACHE_DIR):
+    """ Load data records from 'fname' like 'load', but the parsed
+        records are saved in 'cache_dir' as a columnar roidb, and loaded
+        by memory mapping in later runs if 'fname' is not changed
+
+    Args:
+        fname (str): same as 'load'
+        samples (int): same as 'load'
+        with_background (bool): same as 'load'
+        use_default_label (bool): same as 'load'
+        cname2cid (dict): same as 'load'
+        cache_dir (str): directory of cached records, None for no cache
+
+    Returns:
+        (ColumnarRoiDb, cname2cid)
+    """
+    from .columnar_roidb import ColumnarRoiDb
+    if os.path.isdir(fname) or cache_dir is None:
+        records, cname2cid = load(fname, samples, with_background, True,
+                                  use_default_label, cname2cid)
+        if not isinstance(records, ColumnarRoiDb):
+            records = ColumnarRoiDb.from_records(records, cname2cid)
+        return records, cname2cid
+
+    if not os.path.isfile(fname):
+        raise ValueError('invalid file type when load data from file[%s]' %
+                         (fname))
+
+    key = cache_key(fname, samples, with_background, use_default_label,
+                    cname2cid)
+    path = os.path.join(cache_dir, key)
+    if os.path.isdir(path):
+        try:
+            records = ColumnarRoiDb.load(path)
+            logger.info('loaded %d records of [%s] from cache[%s]' %
+                        (len(records), fname, path))
+            return records, records.cname2cid
+        except Exception as e:
+            logger.warn('failed to load cache[%s] with error: %s' %
+                        (path, str(e)))
+
+    records, cname2cid = load(fname, samples, with_background, True,
+                              use_default_label, cname2cid)
+    records = ColumnarRoiDb.from_records(records, cname2cid)
+
+    # save to a temp directory and rename it, so other processes
+    # never see a partial cache
+    tmp = '%s.%s.tmp' % (path, str(uuid.uuid4())[-6:])
+    try:
+        records.save(tmp)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+        # load it back to share the memory-mapped columns
+        records = ColumnarRoiDb.load(path)
+    except (IOError, OSError) as e:
+        logger.warn('failed to cache records of [%s] to [%s] with error: %s'
+                    % (fname, path, str(e)))
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+    return records, cname2cid
@@ -24,7 +24,6 @@ from __future__ import unicode_literals
 import os
 import random
 
-import copy
 import pickle as pkl
 from ..dataset import Dataset
 
@@ -42,7 +41,8 @@ class RoiDbSource(Dataset):
                  cname2cid=None,
                  use_default_label=None,
                  mixup_epoch=-1,
-                 with_background=True):
+                 with_background=True,
+                 cache_dir=None):
         """ Init
 
         Args:
@@ -56,6 +56,8 @@ class RoiDbSource(Dataset):
             mixup_epoch (int): parse mixup in first n epoch
             with_background (bool): whether load background 
                                     as a class
+            cache_dir (str): directory to cache parsed annotations,
+                None for 'loader.DEFAULT_CACHE_DIR', '' for no cache
         """
         super(RoiDbSource, self).__init__()
         self._epoch = -1
@@ -67,6 +69,7 @@ class RoiDbSource(Dataset):
             assert os.path.isdir(image_dir), 'invalid image directory[%s]' % (
                 image_dir)
         self._roidb = None
+        self._indexes = None
         self._pos = -1
         self._drained = False
         self._samples = samples
@@ -76,6 +79,7 @@ class RoiDbSource(Dataset):
         self._mixup_epoch = mixup_epoch
         self._with_background = with_background
         self.cname2cid = cname2cid
+        self._cache_dir = cache_dir
 
     def __str__(self):
         return 'RoiDbSource(fname:%s,epoch:%d,size:%d,pos:%d)' \
@@ -89,7 +93,9 @@ class RoiDbSource(Dataset):
         if self._pos >= self._samples:
             self._drained = True
             raise StopIteration('%s no more data' % (str(self)))
-        sample = copy.deepcopy(self._roidb[self._pos])
+        # records in ColumnarRoiDb are built when accessed,
+        # so there is no need to copy them
+        sample = self._roidb[self._indexes[self._pos]]
         if self._load_img:
             sample['image'] = self._load_image(sample['im_file'])
         else:
@@ -98,8 +104,8 @@ class RoiDbSource(Dataset):
         if self._epoch < self._mixup_epoch:
             mix_idx = random.randint(1, self._samples - 1)
             mix_pos = (mix_idx + self._pos) % self._samples
-            sample['mixup'] = copy.deepcopy(self._roidb[mix_pos])
-            if self._load_image:
+            sample['mixup'] = self._roidb[self._indexes[mix_pos]]
+            if self._load_img:
                 sample['mixup']['image'] = \
                         self._load_image(sample['mixup']['im_file'])
             else:
@@ -112,9 +118,12 @@ class RoiDbSource(Dataset):
         """ load data from file
         """
         from . import loader
-        records, cname2cid = loader.load(self._fname, self._samples,
-                                         self._with_background, True,
-                                         self.use_default_label, self.cname2cid)
+        cache_dir = self._cache_dir
+        if cache_dir is None:
+            cache_dir = loader.DEFAULT_CACHE_DIR
+        records, cname2cid = loader.load_cached(
+            self._fname, self._samples, self._with_background,
+            self.use_default_label, self.cname2cid, cache_dir or None)
         self.cname2cid = cname2cid
         return records
 
@@ -130,8 +139,10 @@ class RoiDbSource(Dataset):
             self._roidb = self._load()
 
         self._samples = len(self._roidb)
+        if self._indexes is None:
+            self._indexes = list(range(self._samples))
         if self._is_shuffle:
-            random.shuffle(self._roidb)
+            random.shuffle(self._indexes)
 
         if self._epoch < 0:
             self._epoch = 0
@@ -14,9 +14,130 @@
 
 import os
 import numpy as np
+import multiprocessing as mp
 
 import xml.etree.ElementTree as ET
 
+# xml files are parsed by a process pool if there are more than this
+PARALLEL_PARSE_MIN_FILES = 256
+
+
+def list_xml_files(anno_path, sample_num=-1):
+    """
+    List existing xml files of records in list file 'anno_path'
+    """
+    txt_file = anno_path
+    part = txt_file.split('ImageSets')
+    xml_path = os.path.join(part[0], 'Annotations')
+    assert os.path.isfile(txt_file) and \
+        os.path.isdir(xml_path), 'invalid xml path'
+
+    xml_files = []
+    with open(txt_file, 'r') as fr:
+        for line in fr:
+            if not line.strip():
+                continue
+            xml_file = os.path.join(xml_path, line.strip() + '.xml')
+            if not os.path.isfile(xml_file):
+                continue
+            xml_files.append(xml_file)
+            if sample_num > 0 and len(xml_files) >= sample_num:
+                break
+    return xml_files
+
+
+def _parse_xml(xml_file):
+    """
+    Parse one xml file to plain python objects, which are cheap to be
+    sent back from a worker process
+    """
+    tree = ET.parse(xml_file)
+    im_fname = tree.find('filename').text
+    im_id = None
+    if tree.find('id') is not None:
+        im_id = int(tree.find('id').text)
+    im_w = float(tree.find('size').find('width').text)
+    im_h = float(tree.find('size').find('height').text)
+    objs = []
+    for obj in tree.findall('object'):
+        bndbox = obj.find('bndbox')
+        objs.append((obj.find('name').text, int(obj.find('difficult').text),
+                     [
+                         float(bndbox.find('xmin').text),
+                         float(bndbox.find('ymin').text),
+                         float(bndbox.find('xmax').text),
+                         float(bndbox.find('ymax').text)
+                     ]))
+    return im_fname, im_id, im_w, im_h, objs
+
+
+def parse_xml_files(xml_files, num_workers=None):
+    """
+    Parse xml files in order, by a process pool if there are many
+    """
+    if num_workers is None:
+        num_workers = min(mp.cpu_count(), 8)
+    if num_workers <= 1 or len(xml_files) < PARALLEL_PARSE_MIN_FILES:
+        return [_parse_xml(f) for f in xml_files]
+
+    pool = mp.Pool(num_workers)
+    try:
+        return pool.map(_parse_xml, xml_files, chunksize=64)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _to_records(parsed, cname2cid, add_cname=False):
+    """
+    Build records from parsed xml files
+
+    Args:
+        parsed (list): results of '_parse_xml'
+        cname2cid (dict): the label name to id dictionary
+        add_cname (bool): whether to add new names to 'cname2cid',
+            otherwise KeyError is raised for them
+    """
+    records = []
+    for ct, (im_fname, im_id, im_w, im_h, objs) in enumerate(parsed):
+        im_id = np.array([ct if im_id is None else im_id])
+        gt_bbox = np.zeros((len(objs), 4), dtype=np.float32)
+        gt_class = np.zeros((len(objs), 1), dtype=np.int32)
+        gt_score = np.ones((len(objs), 1), dtype=np.float32)
+        is_crowd = np.zeros((len(objs), 1), dtype=np.int32)
+        difficult = np.zeros((len(objs), 1), dtype=np.int32)
+        for i, (cname, _difficult, (x1, y1, x2, y2)) in enumerate(objs):
+            if add_cname and cname not in cname2cid:
+                # the background's id is 0, so need to add 1.
+                cname2cid[cname] = len(cname2cid) + 1
+            elif cname not in cname2cid:
+                raise KeyError(
+                    'Not found cname[%s] in cname2cid when map it to cid.' %
+                    (cname))
+            gt_class[i][0] = cname2cid[cname]
+            x1 = max(0, x1)
+            y1 = max(0, y1)
+            x2 = min(im_w - 1, x2)
+            y2 = min(im_h - 1, y2)
+            gt_bbox[i] = [x1, y1, x2, y2]
+            is_crowd[i][0] = 0
+            difficult[i][0] = _difficult
+        voc_rec = {
+            'im_file': im_fname,
+            'im_id': im_id,
+            'h': im_h,
+            'w': im_w,
+            'is_crowd': is_crowd,
+            'gt_class': gt_class,
+            'gt_score': gt_score,
+            'gt_bbox': gt_bbox,
+            'gt_poly': [],
+            'difficult': difficult
+        }
+        if len(objs) != 0:
+            records.append(voc_rec)
+    return records
+
 
 def get_roidb(anno_path, sample_num=-1, cname2cid=None):
     """
@@ -47,84 +168,14 @@ def get_roidb(anno_path, sample_num=-1, cname2cid=None):
         'cname2id' is a dict to map category name to class id
     """
 
-    txt_file = anno_path
-    part = txt_file.split('ImageSets')
-    xml_path = os.path.join(part[0], 'Annotations')
-    assert os.path.isfile(txt_file) and \
-        os.path.isdir(xml_path), 'invalid xml path'
-
-    records = []
-    ct = 0
     existence = False if cname2cid is None else True
     if cname2cid is None:
         cname2cid = {}
 
     # mapping category name to class id
     # background:0, first_class:1, second_class:2, ...
-    with open(txt_file, 'r') as fr:
-        while True:
-            line = fr.readline()
-            if not line:
-                break
-            fname = line.strip() + '.xml'
-            xml_file = os.path.join(xml_path, fname)
-            if not os.path.isfile(xml_file):
-                continue
-            tree = ET.parse(xml_file)
-            im_fname = tree.find('filename').text
-            if tree.find('id') is None:
-                im_id = np.array([ct])
-            else:
-                im_id = np.array([int(tree.find('id').text)])
-
-            objs = tree.findall('object')
-            im_w = float(tree.find('size').find('width').text)
-            im_h = float(tree.find('size').find('height').text)
-            gt_bbox = np.zeros((len(objs), 4), dtype=np.float32)
-            gt_class = np.zeros((len(objs), 1), dtype=np.int32)
-            gt_score = np.ones((len(objs), 1), dtype=np.float32)
-            is_crowd = np.zeros((len(objs), 1), dtype=np.int32)
-            difficult = np.zeros((len(objs), 1), dtype=np.int32)
-            for i, obj in enumerate(objs):
-                cname = obj.find('name').text
-                if not existence and cname not in cname2cid:
-                    # the background's id is 0, so need to add 1.
-                    cname2cid[cname] = len(cname2cid) + 1
-                elif existence and cname not in cname2cid:
-                    raise KeyError(
-                        'Not found cname[%s] in cname2cid when map it to cid.' %
-                        (cname))
-                gt_class[i][0] = cname2cid[cname]
-                _difficult = int(obj.find('difficult').text)
-                x1 = float(obj.find('bndbox').find('xmin').text)
-                y1 = float(obj.find('bndbox').find('ymin').text)
-                x2 = float(obj.find('bndbox').find('xmax').text)
-                y2 = float(obj.find('bndbox').find('ymax').text)
-                x1 = max(0, x1)
-                y1 = max(0, y1)
-                x2 = min(im_w - 1, x2)
-                y2 = min(im_h - 1, y2)
-                gt_bbox[i] = [x1, y1, x2, y2]
-                is_crowd[i][0] = 0
-                difficult[i][0] = _difficult
-            voc_rec = {
-                'im_file': im_fname,
-                'im_id': im_id,
-                'h': im_h,
-                'w': im_w,
-                'is_crowd': is_crowd,
-                'gt_class': gt_class,
-                'gt_score': gt_score,
-                'gt_bbox': gt_bbox,
-                'gt_poly': [],
-                'difficult': difficult
-            }
-            if len(objs) != 0:
-                records.append(voc_rec)
-
-            ct += 1
-            if sample_num > 0 and ct >= sample_num:
-                break
+    parsed = parse_xml_files(list_xml_files(anno_path, sample_num))
+    records = _to_records(parsed, cname2cid, add_cname=not existence)
     assert len(records) > 0, 'not found any voc record in %s' % (anno_path)
     return [records, cname2cid]
 
@@ -159,16 +210,9 @@ def load(anno_path, sample_num=-1, use_default_label=True):
         'cname2id' is a dict to map category name to class id
     """
 
-    txt_file = anno_path
-    part = txt_file.split('ImageSets')
-    xml_path = os.path.join(part[0], 'Annotations')
-    assert os.path.isfile(txt_file) and \
-        os.path.isdir(xml_path), 'invalid xml path'
-
-    records = []
-    ct = 0
     cname2cid = {}
     if not use_default_label:
+        part = anno_path.split('ImageSets')
         label_path = os.path.join(part[0], 'ImageSets/Main/label_list.txt')
         with open(label_path, 'r') as fr:
             label_id = 1
@@ -180,63 +224,8 @@ def load(anno_path, sample_num=-1, use_default_label=True):
 
     # mapping category name to class id
     # background:0, first_class:1, second_class:2, ...
-    with open(txt_file, 'r') as fr:
-        while True:
-            line = fr.readline()
-            if not line:
-                break
-            fname = line.strip() + '.xml'
-            xml_file = os.path.join(xml_path, fname)
-            if not os.path.isfile(xml_file):
-                continue
-            tree = ET.parse(xml_file)
-            im_fname = tree.find('filename').text
-            if tree.find('id') is None:
-                im_id = np.array([ct])
-            else:
-                im_id = np.array([int(tree.find('id').text)])
-
-            objs = tree.findall('object')
-            im_w = float(tree.find('size').find('width').text)
-            im_h = float(tree.find('size').find('height').text)
-            gt_bbox = np.zeros((len(objs), 4), dtype=np.float32)
-            gt_class = np.zeros((len(objs), 1), dtype=np.int32)
-            gt_score = np.ones((len(objs), 1), dtype=np.float32)
-            is_crowd = np.zeros((len(objs), 1), dtype=np.int32)
-            difficult = np.zeros((len(objs), 1), dtype=np.int32)
-            for i, obj in enumerate(objs):
-                cname = obj.find('name').text
-                gt_class[i][0] = cname2cid[cname]
-                _difficult = int(obj.find('difficult').text)
-                x1 = float(obj.find('bndbox').find('xmin').text)
-                y1 = float(obj.find('bndbox').find('ymin').text)
-                x2 = float(obj.find('bndbox').find('xmax').text)
-                y2 = float(obj.find('bndbox').find('ymax').text)
-                x1 = max(0, x1)
-                y1 = max(0, y1)
-                x2 = min(im_w - 1, x2)
-                y2 = min(im_h - 1, y2)
-                gt_bbox[i] = [x1, y1, x2, y2]
-                is_crowd[i][0] = 0
-                difficult[i][0] = _difficult
-            voc_rec = {
-                'im_file': im_fname,
-                'im_id': im_id,
-                'h': im_h,
-                'w': im_w,
-                'is_crowd': is_crowd,
-                'gt_class': gt_class,
-                'gt_score': gt_score,
-                'gt_bbox': gt_bbox,
-                'gt_poly': [],
-                'difficult': difficult
-            }
-            if len(objs) != 0:
-                records.append(voc_rec)
-
-            ct += 1
-            if sample_num > 0 and ct >= sample_num:
-                break
+    parsed = parse_xml_files(list_xml_files(anno_path, sample_num))
+    records = _to_records(parsed, cname2cid)
     assert len(records) > 0, 'not found any voc record in %s' % (anno_path)
     return [records, cname2cid]
 
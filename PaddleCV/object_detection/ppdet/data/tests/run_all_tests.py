@@ -9,6 +9,10 @@ import test_operator
 import test_roidb_source
 import test_transformer
 import test_reader
+import test_shared_memory
+import test_post_map
+import test_parallel_map
+import test_batch
 
 if __name__ == '__main__':
     alltests = unittest.TestSuite([
@@ -19,6 +23,10 @@ if __name__ == '__main__':
             test_roidb_source.TestRoiDbSource,
             test_transformer.TestTransformer,
             test_reader.TestReader,
+            test_shared_memory.TestSharedMemory,
+            test_post_map.TestPostMap,
+            test_parallel_map.TestParallelMap,
+            test_batch.TestBatch,
         ]
     ])
 
@@ -0,0 +1,77 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import numpy as np
+
+import set_env
+from data import transform as tf
+from data.dataset import Dataset
+
+
+class ShapeSource(Dataset):
+    """ yields (CHW image, index) of the given (height, width) shapes
+    """
+
+    def __init__(self, shapes):
+        super(ShapeSource, self).__init__()
+        self._shapes = shapes
+        self._pos = 0
+
+    def next(self):
+        if self._pos >= len(self._shapes):
+            raise StopIteration()
+        h, w = self._shapes[self._pos]
+        self._pos += 1
+        return (np.ones((3, h, w), dtype='float32'), self._pos - 1)
+
+    def reset(self):
+        self._pos = 0
+
+    def size(self):
+        return len(self._shapes)
+
+    def drained(self):
+        return self._pos >= len(self._shapes)
+
+
+class TestBatch(unittest.TestCase):
+    """Test cases for transform.batch
+    """
+
+    def test_bucketed_batch(self):
+        """ test batching samples of similar shapes
+        """
+        batchsize = 2
+        # portrait and landscape images in turn
+        shapes = [shape for i in range(15)
+                  for shape in [(100, 60 + i), (60 + i, 100)]]
+        pad_config = {'is_padding': True, 'coarsest_stride': 32}
+
+        fractions = []
+        for bucket in [None, {'aspect_ratios': [1.]}]:
+            batched_ds = tf.batch(ShapeSource(shapes), batchsize, False, bucket)
+            batched_ds = tf.batch_map(batched_ds, pad_config)
+            idxs = []
+            for batch in batched_ds:
+                self.assertLessEqual(len(batch), batchsize)
+                idxs.extend(idx for _, idx in batch)
+            self.assertEqual(sorted(idxs), list(range(len(shapes))))
+            fractions.append(batched_ds.stats()['padding_fraction'])
+
+        self.assertLess(fractions[1], fractions[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,8 @@ from __future__ import print_function
 from __future__ import unicode_literals
 import os
 import time
+import shutil
+import tempfile
 import unittest
 import sys
 import logging
@@ -103,6 +105,73 @@ class TestLoader(unittest.TestCase):
         self.assertEqual(len(records), samples)
         self.assertGreater(len(cname2cid), 0)
 
+    def test_load_columnar_roidb(self):
+        """ test loading records saved in columnar roidb
+        """
+        anno_path = set_env.coco_data['VAL']['ANNO_FILE']
+        if not os.path.exists(anno_path):
+            logging.warn('not found %s, so skip this test' % (anno_path))
+            return
+
+        samples = 10
+        from data.source.loader import load
+        from data.source.columnar_roidb import ColumnarRoiDb
+        records, cname2cid = load(anno_path, samples, with_cat2id=True)
+
+        save_dir = tempfile.mkdtemp()
+        try:
+            roidb_dir = os.path.join(save_dir, 'val2017.roidb')
+            ColumnarRoiDb.from_records(records, cname2cid).save(roidb_dir)
+            columnar, columnar_cname2cid = load(
+                roidb_dir, samples, with_cat2id=True)
+            self.assertTrue(isinstance(columnar, ColumnarRoiDb))
+            self.assertEqual(len(columnar), samples)
+            self.assertEqual(columnar_cname2cid, cname2cid)
+            for rec, col_rec in zip(records, columnar):
+                self.assertEqual(sorted(rec.keys()), sorted(col_rec.keys()))
+                for k, v in rec.items():
+                    if isinstance(v, np.ndarray):
+                        self.assertTrue(np.array_equal(v, col_rec[k]))
+                    else:
+                        self.assertEqual(v, col_rec[k])
+        finally:
+            shutil.rmtree(save_dir)
+
+    def test_load_cached(self):
+        """ test parsed records are cached and invalidated by content
+        """
+        anno_path = set_env.coco_data['VAL']['ANNO_FILE']
+        if not os.path.exists(anno_path):
+            logging.warn('not found %s, so skip this test' % (anno_path))
+            return
+
+        samples = 10
+        from data.source.loader import load, load_cached
+        records, cname2cid = load(anno_path, samples, with_cat2id=True)
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            anno_copy = os.path.join(cache_dir, 'instances.json')
+            shutil.copy(anno_path, anno_copy)
+            for _ in range(2):
+                cached, cached_cname2cid = load_cached(
+                    anno_copy, samples, cache_dir=cache_dir)
+                self.assertEqual(len(cached), samples)
+                self.assertEqual(cached_cname2cid, cname2cid)
+                for rec, cached_rec in zip(records, cached):
+                    self.assertEqual(rec['im_file'], cached_rec['im_file'])
+                    self.assertTrue(
+                        np.array_equal(rec['gt_bbox'], cached_rec['gt_bbox']))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            # a changed file gets a new cache entry
+            with open(anno_copy, 'a') as f:
+                f.write(' ')
+            load_cached(anno_copy, samples, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 3)
+        finally:
+            shutil.rmtree(cache_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
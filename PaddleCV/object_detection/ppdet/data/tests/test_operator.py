@@ -2,6 +2,7 @@ import os
 import unittest
 import logging
 import numpy as np
+import cv2
 import set_env
 from data import transform as tf
 logging.basicConfig(level=logging.INFO)
@@ -138,6 +139,41 @@ class TestBase(unittest.TestCase):
         self.assertGreater(result['gt_bbox'].shape[0], 0)
         #self.assertGreater(result['gt_score'].shape[0], 0)
 
+    def test_decode_cache(self):
+        """test DecodeImage with decoded images cached and spilled
+        """
+        import shutil
+        import tempfile
+        tmp_dir = tempfile.mkdtemp()
+        ims = {}
+        for i in range(3):
+            im = np.random.randint(0, 256, size=(64, 48, 3), dtype='uint8')
+            ims[i] = os.path.join(tmp_dir, '%d.png' % i)
+            cv2.imwrite(ims[i], im)
+
+        # only 2 images can be kept in memory
+        spill_dir = os.path.join(tmp_dir, 'spill')
+        decoder = tf.DecodeImage(
+            cache_size=2 * 64 * 48 * 3 / (1024. * 1024), cache_dir=spill_dir)
+        plain = tf.DecodeImage()
+        try:
+            for _ in range(2):
+                for i in range(3):
+                    result = decoder({'im_file': ims[i]})
+                    expected = plain({'im_file': ims[i]})
+                    self.assertTrue(
+                        np.array_equal(result['image'], expected['image']))
+                    # cached image can not be modified by later operators
+                    result['image'][:] = 0
+
+            stats = decoder._cache.stats()
+            self.assertEqual(stats['misses'], 3)
+            self.assertEqual(stats['hits'] + stats['spill_hits'], 3)
+            self.assertGreater(stats['spilled'], 0)
+            self.assertLessEqual(stats['num'], 2)
+        finally:
+            shutil.rmtree(tmp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,103 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import time
+import unittest
+import numpy as np
+
+import set_env
+from data import transform as tf
+from data.dataset import Dataset
+
+
+class RangeSource(Dataset):
+    """ yields (reset times, index) for 'num' samples
+    """
+
+    def __init__(self, num):
+        super(RangeSource, self).__init__()
+        self._num = num
+        self._generation = -1
+        self._pos = 0
+
+    def next(self):
+        if self._pos >= self._num:
+            raise StopIteration()
+        self._pos += 1
+        return (self._generation, self._pos - 1)
+
+    def reset(self):
+        self._generation += 1
+        self._pos = 0
+
+    def size(self):
+        return self._num
+
+    def drained(self):
+        return self._pos >= self._num
+
+
+def slow_mapper(sample):
+    """ takes random time to map, so samples are mapped out of order
+    """
+    time.sleep(random.random() * 0.002)
+    return sample + (np.full((4, 4), sample[1], dtype='float32'), )
+
+
+class TestParallelMap(unittest.TestCase):
+    """Test cases for transform.parallel_map
+    """
+
+    def test_ordered_parallel_map(self):
+        """ test transformer.map with concurrent workers in ordered mode
+        """
+        num = 200
+        worker_conf = {'WORKER_NUM': 4, 'use_process': True, 'ordered': True}
+        mapped_ds = tf.map(RangeSource(num), slow_mapper, worker_conf)
+        for _ in range(2):
+            samples = [sample for sample in mapped_ds]
+            self.assertEqual([idx for _, idx, _ in samples], list(range(num)))
+            self.assertTrue(all((im == idx).all() for _, idx, im in samples))
+            self.assertTrue(mapped_ds.drained())
+            mapped_ds.reset()
+
+        stats = mapped_ds.stats()
+        self.assertEqual(stats['mapped_samples'], 2 * num)
+        self.assertEqual(
+            sum([ct for _, ct in stats['latency_hist']]),
+            stats['mapped_samples'])
+        mapped_ds.stop()
+
+    def test_parallel_map_reset(self):
+        """ test resetting transformer.map with concurrent workers in and
+            at the end of epochs
+        """
+        mapped_ds = tf.map(
+            RangeSource(20), lambda x: x, {'WORKER_NUM': 3,
+                                            'bufsize': 4})
+        for epoch in range(300):
+            if epoch % 3 == 2:
+                samples = [mapped_ds.next() for _ in range(epoch % 5)]
+            else:
+                samples = [sample for sample in mapped_ds]
+                self.assertEqual(len(samples), 20)
+            # no sample is left from the source of a previous epoch
+            self.assertTrue(all(g == epoch for g, _ in samples))
+            mapped_ds.reset()
+        mapped_ds.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import numpy as np
+
+import set_env
+from data import transform as tf
+from data.transform.post_map import build_post_map
+
+
+class TestPostMap(unittest.TestCase):
+    """Test cases for transform.post_map
+    """
+
+    def test_distort_normalize_permute(self):
+        """test DistortNormalizePermute and normalizing in batch
+        """
+        mean = [0.485, 0.456, 0.406]
+        std = [0.229, 0.224, 0.225]
+        ops_conf = [{
+            'op': 'NormalizeImage',
+            'mean': mean,
+            'std': std,
+            'is_channel_first': False
+        }, {
+            'op': 'Permute',
+            'to_bgr': True
+        }]
+        mapper = tf.build_mapper(ops_conf)
+        ims = [
+            np.random.randint(
+                0, 256, size=(h, w, 3), dtype='uint8')
+            for h, w in [(20, 30), (32, 17)]
+        ]
+        expected = [mapper({'image': im})['image'] for im in ims]
+
+        fused_conf = {'mean': mean, 'std': std, 'to_bgr': True}
+        fused = tf.DistortNormalizePermute(**fused_conf)
+        result = fused({'image': ims[0]})['image']
+        self.assertEqual(result.dtype, np.float32)
+        self.assertTrue(np.allclose(result, expected[0], atol=1e-5))
+
+        # images are padded to multiple of 'coarsest_stride'
+        post_map = build_post_map(
+            coarsest_stride=8, is_padding=True, normalize=fused_conf)
+        batch = post_map([(im, ) for im in ims])
+        for (result, ), exp in zip(batch, expected):
+            self.assertEqual(result.shape, (3, 32, 32))
+            c, h, w = exp.shape
+            self.assertTrue(np.allclose(result[:, :h, :w], exp, atol=1e-5))
+            self.assertEqual(np.count_nonzero(result[:, h:, :]), 0)
+            self.assertEqual(np.count_nonzero(result[:, :, w:]), 0)
+
+        # distortion keeps pixels in valid range
+        fused_conf.update({'is_distort': True, 'distort_prob': 1.})
+        fused = tf.DistortNormalizePermute(**fused_conf)
+        result = fused({'image': ims[1]})['image']
+        self.assertEqual(result.shape, expected[1].shape)
+        bgr_mean = np.array(mean[::-1])[:, np.newaxis, np.newaxis]
+        bgr_std = np.array(std[::-1])[:, np.newaxis, np.newaxis]
+        pixels = result * bgr_std + bgr_mean
+        self.assertTrue((pixels > -1e-5).all() and (pixels < 1 + 1e-5).all())
+
+    def test_normalize_in_batch(self):
+        """test normalizing in batch is the same as normalizing images
+           before padding and resizing
+        """
+        normalize = {
+            'mean': [0.485, 0.456, 0.406],
+            'std': [0.229, 0.224, 0.225],
+            'to_bgr': True
+        }
+        fused = tf.DistortNormalizePermute(**normalize)
+        configs = [{
+            'is_padding': True,
+            'coarsest_stride': 32,
+            'random_shapes': [50]
+        }, {
+            'is_padding': True,
+            'multi_scales': [0.7],
+            'use_padded_im_info': True
+        }, {
+            'is_padding': True,
+            'coarsest_stride': 8,
+            'random_shapes': [24],
+            'multi_scales': [1.3]
+        }, {
+            'random_shapes': [40]
+        }]
+        shapes = [(20, 30), (32, 17), (45, 45)]
+        for config in configs:
+            ims = [
+                np.random.randint(
+                    0, 256, size=(h, w, 3), dtype='uint8') for h, w in shapes
+            ]
+            infos = [np.array([h, w, 1.], dtype='float32') for h, w in shapes]
+            expected = build_post_map(**config)([
+                (fused.apply(im), info.copy()) for im, info in zip(ims, infos)
+            ])
+            batch = build_post_map(normalize=normalize, **config)(
+                [(im, info.copy()) for im, info in zip(ims, infos)])
+            for result, exp in zip(batch, expected):
+                self.assertEqual(result[0].shape, exp[0].shape)
+                self.assertTrue(np.allclose(result[0], exp[0], atol=1e-5))
+                self.assertEqual(
+                    np.array(result[1][0]).tolist(),
+                    np.array(exp[1][0]).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gc
+import random
+import unittest
+import numpy as np
+
+import set_env
+from data.transform.shared_queue.sharedmemory import SharedMemoryMgr
+from data.transform.shared_queue.sharedmemory import MemoryFullError
+from data.transform.shared_queue.sharedmemory import PageAllocator
+from data.transform.shared_queue.sharedmemory import LinearPageAllocator
+from data.transform.shared_queue import SharedQueue
+
+
+class TestSharedMemory(unittest.TestCase):
+    """Test cases for transform.shared_queue
+    """
+
+    def setUp(self):
+        """ setup
+        """
+        random.seed(0)
+        self.pagesize = 4 * 1024
+        self.pages = 256
+
+    def _random_malloc_free(self, allocator):
+        mgr = SharedMemoryMgr(
+            capacity=self.pagesize * self.pages,
+            pagesize=self.pagesize,
+            allocator=allocator)
+        owned = np.zeros(self.pages, dtype=bool)
+        bufs = []
+        for _ in range(3000):
+            if len(bufs) > 0 and random.random() < 0.5:
+                buf = bufs.pop(random.randrange(len(bufs)))
+                pos, num = buf._pos, buf.capacity() // self.pagesize
+                self.assertTrue(owned[pos:pos + num].all())
+                owned[pos:pos + num] = False
+                buf.free()
+                continue
+
+            size = random.randint(1, 16 * self.pagesize)
+            try:
+                buf = mgr.malloc(size, wait=False)
+            except MemoryFullError:
+                continue
+            pos, num = buf._pos, buf.capacity() // self.pagesize
+            self.assertFalse(owned[pos:pos + num].any())
+            owned[pos:pos + num] = True
+            bufs.append(buf)
+
+        for buf in bufs:
+            buf.free()
+        return mgr
+
+    def test_page_allocator(self):
+        """ test allocated pages never overlap and freed pages are coalesced
+        """
+        mgr = self._random_malloc_free(PageAllocator)
+        self.assertTrue(mgr._allocator.empty())
+
+        # all free pages should be merged to one run again
+        free_pages = self.pages - mgr._allocator._header_pages
+        buf = mgr.malloc(free_pages * self.pagesize, wait=False)
+        self.assertTrue(mgr._allocator.full())
+        self.assertRaises(MemoryFullError, mgr.malloc, 1, False)
+        buf.free()
+        self.assertTrue(mgr._allocator.empty())
+
+    def test_linear_page_allocator(self):
+        """ test the linear allocator for comparison
+        """
+        mgr = self._random_malloc_free(LinearPageAllocator)
+        self.assertTrue(mgr._allocator.empty())
+
+    def test_buffer_data(self):
+        """ test data put in buffer can be got back
+        """
+        mgr = SharedMemoryMgr(
+            capacity=self.pagesize * self.pages, pagesize=self.pagesize)
+        data = np.random.randint(
+            0, 255, size=3 * self.pagesize + 7, dtype='uint8').tostring()
+        buf = mgr.malloc(len(data))
+        buf.put(data)
+        self.assertEqual(buf.get(no_copy=False), data)
+        buf.free()
+
+    def test_queue_with_ndarray(self):
+        """ test ndarrays in sample are transported without pickle
+        """
+        sample = {
+            'image': np.random.rand(3, 20, 30).astype('float32'),
+            'gt_bbox': np.zeros((0, 4), dtype='float32'),
+            'flipped': np.arange(12).reshape((3, 4))[:, ::-1],
+            'im_file': 'a.jpg',
+            'mixup': {
+                'image': np.ones((5, 5), dtype='uint8')
+            },
+            'arranged': (np.float32(1.), [np.arange(3)]),
+        }
+        for no_copy in [True, False]:
+            queue = SharedQueue(
+                2,
+                memsize=self.pagesize * self.pages,
+                pagesize=self.pagesize,
+                no_copy=no_copy)
+            queue.put(sample)
+            out = queue.get()
+            self.assertTrue(np.array_equal(out['image'], sample['image']))
+            self.assertEqual(out['gt_bbox'].shape, (0, 4))
+            self.assertTrue(np.array_equal(out['flipped'], sample['flipped']))
+            self.assertEqual(out['im_file'], sample['im_file'])
+            self.assertTrue(
+                np.array_equal(out['mixup']['image'], sample['mixup'][
+                    'image']))
+            self.assertEqual(out['arranged'][0], sample['arranged'][0])
+            self.assertTrue(
+                np.array_equal(out['arranged'][1][0], sample['arranged'][1][
+                    0]))
+
+            allocator = queue._shared_mem._allocator
+            self.assertEqual(allocator.empty(), not no_copy)
+            del out
+            gc.collect()
+            # buffers of released samples are freed in next 'put' or 'get'
+            queue.put(None)
+            self.assertIsNone(queue.get())
+            self.assertTrue(allocator.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
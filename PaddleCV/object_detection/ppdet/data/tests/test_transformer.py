@@ -6,7 +6,7 @@ import logging
 import numpy as np
 
 import set_env
-from data import build_source
+from data.source import build_source
 from data import transform as tf
 
 logger = logging.getLogger(__name__)
@@ -0,0 +1,158 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# function:
+#   micro-benchmark for page allocators of 'SharedMemoryMgr'
+#
+# notes:
+#   every producer process keeps a few buffers alive(like samples
+#   waiting in a queue), and repeatedly frees the oldest one and
+#   mallocs a new one with a random size of a decoded image,
+#   eg: python benchmark_shared_memory.py --producers 8 16 32
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+
+import os
+import sys
+import time
+import random
+import multiprocessing as mp
+
+path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../')
+if path not in sys.path:
+    sys.path.insert(0, path)
+
+from data.transform.shared_queue.sharedmemory import SharedMemoryMgr
+from data.transform.shared_queue.sharedmemory import MemoryFullError
+from data.transform.shared_queue.sharedmemory import PageAllocator
+from data.transform.shared_queue.sharedmemory import LinearPageAllocator
+
+ALLOCATORS = {'freelist': PageAllocator, 'linear': LinearPageAllocator}
+
+
+def parse_args():
+    """ parse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark page allocators of SharedMemoryMgr')
+    parser.add_argument(
+        '--producers',
+        type=int,
+        nargs='+',
+        default=[8, 16, 32],
+        help='numbers of concurrent producer processes to test')
+    parser.add_argument(
+        '--iters',
+        type=int,
+        default=2000,
+        help='malloc/free pairs for each producer')
+    parser.add_argument(
+        '--memsize',
+        type=int,
+        default=1024,
+        help='size of shared memory in MB')
+    parser.add_argument(
+        '--pagesize', type=int, default=64, help='size of a page in KB')
+    parser.add_argument(
+        '--min_size',
+        type=int,
+        default=64,
+        help='min size of a sample in KB')
+    parser.add_argument(
+        '--max_size',
+        type=int,
+        default=4096,
+        help='max size of a sample in KB')
+    parser.add_argument(
+        '--inflight',
+        type=int,
+        default=4,
+        help='buffers kept alive by each producer')
+    return parser.parse_args()
+
+
+def _produce(mgr, args, seed, result_q):
+    random.seed(seed)
+    inflight = []
+    failed = 0
+    elapsed = 0.
+    for _ in range(args.iters):
+        size = random.randint(args.min_size, args.max_size) * 1024
+        st = time.time()
+        if len(inflight) >= args.inflight:
+            inflight.pop(0).free()
+        try:
+            inflight.append(mgr.malloc(size, wait=False))
+        except MemoryFullError:
+            failed += 1
+        elapsed += time.time() - st
+
+    for buf in inflight:
+        buf.free()
+    result_q.put((elapsed, failed))
+
+
+def run(allocator, producer_num, args):
+    """ run 'producer_num' producers which share one SharedMemoryMgr
+
+    Returns:
+        tuple of (wall time, malloc/free pairs per second,
+            average latency of a malloc/free pair in us, failed mallocs)
+    """
+    mgr = SharedMemoryMgr(
+        capacity=args.memsize * 1024 * 1024,
+        pagesize=args.pagesize * 1024,
+        allocator=ALLOCATORS[allocator])
+    result_q = mp.Queue()
+    workers = [
+        mp.Process(
+            target=_produce, args=(mgr, args, i, result_q))
+        for i in range(producer_num)
+    ]
+
+    st = time.time()
+    for w in workers:
+        w.start()
+    results = [result_q.get() for _ in workers]
+    for w in workers:
+        w.join()
+    cost = time.time() - st
+
+    failed = sum([r[1] for r in results])
+    ops = producer_num * args.iters / cost
+    latency = sum([r[0] for r in results]) / (producer_num * args.iters)
+    return cost, ops, latency * 1e6, failed
+
+
+def main():
+    args = parse_args()
+    print('%-10s %-10s %-10s %-14s %-14s %-10s' % ('allocator', 'producers',
+                                                  'time(s)', 'ops/s',
+                                                  'latency(us)', 'failed'))
+    for producer_num in args.producers:
+        for allocator in ['linear', 'freelist']:
+            cost, ops, latency, failed = run(allocator, producer_num, args)
+            print('%-10s %-10d %-10.3f %-14.1f %-14.1f %-10d' %
+                  (allocator, producer_num, cost, ops, latency, failed))
+
+
+if __name__ == "__main__":
+    if hasattr(mp, 'set_start_method'):
+        # workers need to inherit the shared memory
+        mp.set_start_method('fork')
+    main()
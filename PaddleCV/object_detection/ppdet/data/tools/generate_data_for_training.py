@@ -39,6 +39,7 @@ if path not in sys.path:
     sys.path.insert(0, path)
 
 from data.source import loader
+from data.source.columnar_roidb import ColumnarRoiDb
 
 
 def parse_args():
@@ -67,11 +68,29 @@ def parse_args():
         type=int,
         default=-1,
         help='number of samples to dump, default to all')
+    parser.add_argument(
+        '--columnar',
+        action='store_true',
+        help='save samples in a directory of memory-mappable columns '
+        'instead of a pickled file')
 
     args = parser.parse_args()
     return args
 
 
+def dump_roidb(roidb, cat2id, save_dir, dsname, columnar=False):
+    """ save records to '${save_dir}/${dsname}.roidb', which is a pickled
+        file, or a directory of columns if 'columnar' is True
+    """
+    roidb_fname = save_dir + "/%s.roidb" % (dsname)
+    if columnar:
+        ColumnarRoiDb.from_records(roidb, cat2id).save(roidb_fname)
+    else:
+        with open(roidb_fname, "wb") as fout:
+            pkl.dump((roidb, cat2id), fout)
+    return roidb_fname
+
+
 def dump_coco_as_pickle(args):
     """ Load COCO data, and then save it as pickled file.
 
@@ -87,9 +106,7 @@ def dump_coco_as_pickle(args):
     roidb, cat2id = loader.load(anno_path, samples, with_cat2id=True)
     samples = len(roidb)
     dsname = os.path.basename(anno_path).rstrip('.json')
-    roidb_fname = save_dir + "/%s.roidb" % (dsname)
-    with open(roidb_fname, "wb") as fout:
-        pkl.dump((roidb, cat2id), fout)
+    roidb_fname = dump_roidb(roidb, cat2id, save_dir, dsname, args.columnar)
 
     #for rec in roidb:
     #    sys.stderr.write('%s\n' % (rec['im_file']))
@@ -115,9 +132,7 @@ def dump_voc_as_pickle(args):
     samples = len(roidb)
     part = anno_path.split('/')
     dsname = part[-4]
-    roidb_fname = save_dir + "/%s.roidb" % (dsname)
-    with open(roidb_fname, "wb") as fout:
-        pkl.dump((roidb, cat2id), fout)
+    roidb_fname = dump_roidb(roidb, cat2id, save_dir, dsname, args.columnar)
     anno_path = os.path.join(anno_path.split('/train.txt')[0], 'label_list.txt')
     with open(anno_path, 'w') as fw:
         for key in cat2id.keys():
@@ -133,6 +148,9 @@ if __name__ == "__main__":
         python generate_data_for_training.py --type=json
             --annotation=./annotations/instances_val2017.json
             --save-dir=./roidb --samples=100
+
+        add '--columnar' to save a directory of memory-mappable columns,
+        which is faster to load and shared by all processes on a host
     """
     args = parse_args()
 
@@ -18,7 +18,7 @@ from __future__ import print_function
 import copy
 import logging
 
-from .transformer import MappedDataset, BatchedDataset
+from .transformer import MappedDataset, BatchedDataset, BucketedBatchedDataset
 from .post_map import build_post_map
 from .parallel_map import ParallelMappedDataset
 from .operators import BaseOperator, registered_ops
@@ -101,17 +101,22 @@ def map(ds, mapper, worker_args=None):
         return MappedDataset(ds, mapper)
 
 
-def batch(ds, batchsize, drop_last=False):
+def batch(ds, batchsize, drop_last=False, bucket=None):
     """
     Batch data samples to batches
     Args:
         batchsize (int): number of samples for a batch
         drop_last (bool): drop last few samples if not enough for a batch
+        bucket (dict): configs for batching samples of similar shapes,
+            see 'BucketedBatchedDataset', None for not bucketing
 
     Returns:
         a batched dataset
     """
 
+    if bucket is not None:
+        return BucketedBatchedDataset(
+            ds, batchsize, drop_last=drop_last, **bucket)
     return BatchedDataset(ds, batchsize, drop_last=drop_last)
 
 
@@ -0,0 +1,139 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# function:
+#    cache decoded images in memory with LRU eviction, and optionally
+#    spill the evicted images to a directory as '.npy' files which are
+#    memory-mapped when they are needed again
+#
+# notes:
+#    every worker process has it's own memory cache, but the spilled
+#    files are shared by all of them
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class DecodedImageCache(object):
+    """ LRU cache of decoded images with a budget in bytes
+
+    Args:
+        capacity (int): max bytes of images kept in memory
+        spill_dir (str): directory to save images evicted from memory,
+            None for not spilling
+    """
+
+    def __init__(self, capacity, spill_dir=None):
+        self._capacity = capacity
+        self._spill_dir = spill_dir
+        if spill_dir is not None and not os.path.exists(spill_dir):
+            try:
+                os.makedirs(spill_dir)
+            except OSError:
+                # maybe created by another process
+                assert os.path.isdir(spill_dir), \
+                    'failed to create spill dir[%s]' % (spill_dir)
+
+        self._images = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'spill_hits': 0, 'misses': 0, 'spilled': 0}
+
+    def _spill_path(self, key):
+        name = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return os.path.join(self._spill_dir, name + '.npy')
+
+    def _spill(self, key, im):
+        fname = self._spill_path(key)
+        if os.path.exists(fname):
+            return
+        # write to a temp file and rename it, so other processes
+        # never see a partial file
+        tmp = '%s.%s.tmp' % (fname, str(uuid.uuid4())[-6:])
+        try:
+            with open(tmp, 'wb') as f:
+                np.save(f, im)
+            os.rename(tmp, fname)
+            self._stats['spilled'] += 1
+        except (IOError, OSError) as e:
+            logger.warn('failed to spill image[%s] to [%s] with error: %s' %
+                        (key, fname, str(e)))
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def get(self, key):
+        """ get a copy of the image cached for 'key'
+
+        Returns:
+            np.ndarray or None if not found
+        """
+        with self._lock:
+            im = self._images.pop(key, None)
+            if im is not None:
+                # move to the most recently used end
+                self._images[key] = im
+                self._stats['hits'] += 1
+                return im.copy()
+
+        if self._spill_dir is not None:
+            fname = self._spill_path(key)
+            if os.path.exists(fname):
+                im = np.load(fname, mmap_mode='r')
+                self._stats['spill_hits'] += 1
+                return np.array(im)
+
+        self._stats['misses'] += 1
+        return None
+
+    def put(self, key, im):
+        """ cache a copy of image 'im' for 'key', and evict the least
+            recently used ones if out of capacity
+        """
+        evicted = []
+        with self._lock:
+            if key in self._images:
+                return
+            if im.nbytes <= self._capacity:
+                self._images[key] = im.copy()
+                self._size += im.nbytes
+            else:
+                evicted.append((key, im))
+
+            while self._size > self._capacity:
+                k, v = self._images.popitem(last=False)
+                self._size -= v.nbytes
+                evicted.append((k, v))
+
+        if self._spill_dir is not None:
+            for k, v in evicted:
+                self._spill(k, v)
+
+    def stats(self):
+        """ get counters of this cache
+        """
+        stats = dict(self._stats)
+        stats['size'] = self._size
+        stats['num'] = len(self._images)
+        return stats
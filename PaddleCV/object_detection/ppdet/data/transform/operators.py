@@ -30,6 +30,7 @@ from PIL import Image, ImageEnhance
 
 from ppdet.core.workspace import serializable
 
+from .decode_cache import DecodedImageCache
 from .op_helper import (satisfy_sample_constraint, filter_and_process,
                         generate_sample_bbox, clip_bbox)
 
@@ -77,23 +78,38 @@ class BaseOperator(object):
 
 @register_op
 class DecodeImage(BaseOperator):
-    def __init__(self, to_rgb=True, with_mixup=False):
+    def __init__(self,
+                 to_rgb=True,
+                 with_mixup=False,
+                 cache_size=0,
+                 cache_dir=None):
         """ Transform the image data to numpy format.
 
         Args:
             to_rgb (bool): whether to convert BGR to RGB
+            with_mixup (bool): whether to decode the mixup image
+            cache_size (int): memory budget in MB to cache decoded images
+                by 'im_file', 0 for not caching in memory
+            cache_dir (str): directory to spill decoded images evicted
+                from memory, None for not spilling
         """
 
         super(DecodeImage, self).__init__()
         self.to_rgb = to_rgb
         self.with_mixup = with_mixup
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
         if not isinstance(self.to_rgb, bool):
             raise TypeError("{}: input type is invalid.".format(self))
         if not isinstance(self.with_mixup, bool):
             raise TypeError("{}: input type is invalid.".format(self))
 
-    def __call__(self, sample, context=None):
-        """ load image if 'im_file' field is not empty but 'image' is"""
+        self._cache = None
+        if self.cache_size > 0 or self.cache_dir is not None:
+            self._cache = DecodedImageCache(self.cache_size * 1024 * 1024,
+                                            self.cache_dir)
+
+    def _decode(self, sample):
         if 'image' not in sample:
             with open(sample['im_file'], 'rb') as f:
                 sample['image'] = f.read()
@@ -103,6 +119,19 @@ class DecodeImage(BaseOperator):
         im = cv2.imdecode(data, 1)  # BGR mode, but need RGB mode
         if self.to_rgb:
             im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
+        return im
+
+    def __call__(self, sample, context=None):
+        """ load image if 'im_file' field is not empty but 'image' is"""
+        im = None
+        key = None
+        if self._cache is not None and 'im_file' in sample:
+            key = '%s:%s' % (sample['im_file'], self.to_rgb)
+            im = self._cache.get(key)
+        if im is None:
+            im = self._decode(sample)
+            if key is not None:
+                self._cache.put(key, im)
         sample['image'] = im
 
         if 'h' not in sample:
@@ -708,3 +737,142 @@ class RandomInterpImage(BaseOperator):
         """Resise the image numpy by random resizer."""
         resizer = random.choice(self.resizers)
         return resizer(sample, context)
+
+
+# matrices to convert between RGB and YIQ, which are used to rotate the hue
+RGB2YIQ = np.array([[0.299, 0.587, 0.114], [0.596, -0.274, -0.322],
+                    [0.211, -0.523, 0.312]])
+YIQ2RGB = np.linalg.inv(RGB2YIQ)
+
+
+@register_op
+class DistortNormalizePermute(BaseOperator):
+    def __init__(self,
+                 mean=[0.485, 0.456, 0.406],
+                 std=[1, 1, 1],
+                 is_scale=True,
+                 to_bgr=False,
+                 is_distort=False,
+                 brightness=[0.5, 1.5],
+                 contrast=[0.5, 1.5],
+                 saturation=[0.5, 1.5],
+                 hue=[-18, 18],
+                 distort_prob=0.5):
+        """
+        Fuse 'RandomDistort', 'NormalizeImage' and 'Permute' into one pass,
+        which converts a HWC image to a normalized CHW float32 image, and
+        can write the result to a preallocated buffer(eg: a slice of a batch)
+
+        Brightness, contrast, saturation and hue distortions are all linear
+        in RGB space, so they are applied in a random order like
+        'RandomDistort'(count=4, is_order=False), but composed to one 3x3
+        matrix with an offset, and the result is clipped only once.
+        Hue is rotated in YIQ space instead of HSV.
+
+        Args:
+            mean (list): the pixel mean
+            std (list): the pixel variance
+            is_scale (bool): whether to scale the image to [0, 1]
+            to_bgr (bool): whether to convert RGB to BGR
+            is_distort (bool): whether to distort the image
+            brightness/contrast/saturation (list): lower and upper
+                bound of the enhance factor
+            hue (list): lower and upper bound of the hue delta,
+                which is in [-128, 128) like the hue of PIL's HSV mode
+            distort_prob (float): probability of each distortion
+        """
+        super(DistortNormalizePermute, self).__init__()
+        self.mean = mean
+        self.std = std
+        self.is_scale = is_scale
+        self.to_bgr = to_bgr
+        self.is_distort = is_distort
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+        self.distort_prob = distort_prob
+        if not (isinstance(self.mean, list) and isinstance(self.std, list) and
+                isinstance(self.is_scale, bool) and
+                isinstance(self.to_bgr, bool)):
+            raise TypeError("{}: input type is invalid.".format(self))
+        if 0 in self.std:
+            raise ValueError('{}: std is invalid!'.format(self))
+
+        std = np.array(self.std, dtype=np.float64)
+        scale = 1. / 255 if self.is_scale else 1.
+        self._scale = (scale / std).astype(np.float32)
+        self._bias = (np.array(self.mean) / std).astype(np.float32)
+        self._channels = [2, 1, 0] if self.to_bgr else [0, 1, 2]
+
+    def _distort_matrix(self, im):
+        """ get a random affine transform 'y = m * x + offset' in RGB space
+        """
+        m = np.eye(3)
+        offset = np.zeros(3)
+        gray = RGB2YIQ[0]
+        channel_mean = None
+
+        steps = ['brightness', 'contrast', 'saturation', 'hue']
+        random.shuffle(steps)
+        for step in steps:
+            low, high = getattr(self, step)
+            delta = np.random.uniform(low, high)
+            if np.random.uniform(0, 1) >= self.distort_prob:
+                continue
+            step_offset = np.zeros(3)
+            if step == 'brightness':
+                step_m = delta * np.eye(3)
+            elif step == 'contrast':
+                # blend with the mean gray level of the distorted image
+                if channel_mean is None:
+                    channel_mean = np.array(cv2.mean(im)[:3])
+                mean_gray = gray.dot(m.dot(channel_mean) + offset)
+                step_m = delta * np.eye(3)
+                step_offset[:] = (1 - delta) * mean_gray
+            elif step == 'saturation':
+                # blend with the gray image
+                step_m = delta * np.eye(3) + (1 - delta) * np.outer(
+                    np.ones(3), gray)
+            else:
+                theta = delta * 2 * np.pi / 256
+                cos, sin = np.cos(theta), np.sin(theta)
+                rot = np.array([[1, 0, 0], [0, cos, sin], [0, -sin, cos]])
+                step_m = YIQ2RGB.dot(rot).dot(RGB2YIQ)
+            m = step_m.dot(m)
+            offset = step_m.dot(offset) + step_offset
+        return m, offset
+
+    def apply(self, im, out=None):
+        """ distort and normalize a HWC image 'im', and write the CHW
+            result to the top-left corner of 'out'
+
+        Args:
+            im (np.ndarray): image in HWC
+            out (np.ndarray): float32 buffer in CHW, which is not smaller
+                than 'im', a new one is created if it's None
+
+        Returns:
+            the buffer 'out'
+        """
+        h, w = im.shape[:2]
+        if out is None:
+            out = np.empty((3, h, w), dtype=np.float32)
+        if self.is_distort:
+            m, offset = self._distort_matrix(im)
+            affine = np.hstack([m, offset[:, np.newaxis]]).astype(np.float32)
+            im = cv2.transform(im.astype(np.float32, copy=False), affine)
+            np.clip(im, 0, 255, out=im)
+
+        for i, c in enumerate(self._channels):
+            dst = out[i, :h, :w]
+            np.multiply(im[:, :, c], self._scale[c], out=dst, casting='unsafe')
+            dst -= self._bias[c]
+        return out
+
+    def __call__(self, sample, context=None):
+        """ distort, normalize and permute the image
+        """
+        assert 'image' in sample, "image data not found"
+        sample['image'] = self.apply(sample['image'])
+        return sample
@@ -21,14 +21,24 @@ from __future__ import print_function
 
 import sys
 import six
+import time
 import uuid
 import logging
 import signal
 import threading
+from multiprocessing import RawArray
 from .transformer import ProxiedDataset
 
 logger = logging.getLogger(__name__)
 
+# upper bounds(in ms) of buckets in mapper latency histogram
+LATENCY_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float('inf')]
+
+# layout of stats for each consumer:
+#   [idle time, map time, mapped samples, histogram of latency]
+IDLE_TIME, MAP_TIME, MAPPED_NUM, LATENCY_HIST = 0, 1, 2, 3
+CONSUMER_STATS_SIZE = LATENCY_HIST + len(LATENCY_BUCKETS)
+
 
 class EndSignal(object):
     def __init__(self, errno=0, errmsg=''):
@@ -36,11 +46,26 @@ class EndSignal(object):
         self.errmsg = errmsg
 
 
+class EpochEnd(object):
+    """ notify that 'samples' samples are produced in epoch 'epoch'
+    """
+
+    def __init__(self, epoch, samples):
+        self.epoch = epoch
+        self.samples = samples
+
+
 class ParallelMappedDataset(ProxiedDataset):
     """
     Transform samples to mapped samples which is similar to 'basic.MappedDataset',
     but multiple workers (threads or processes) will be used
 
+    Samples are tagged with epoch id and sequence number by the producer.
+    If 'ordered' is set in 'worker_args', samples are returned in the same
+    order as they come from 'source', and at most 'reorder_window' samples
+    can be in flight so that a slow sample doesn't make the reorder buffer
+    grow unboundedly.
+
     Notes:
         this class is not thread-safe
     """
@@ -49,8 +74,15 @@ class ParallelMappedDataset(ProxiedDataset):
         super(ParallelMappedDataset, self).__init__(source)
         worker_args = {k.lower(): v for k, v in worker_args.items()}
 
-        args = {'bufsize': 100, 'worker_num': 8}
+        args = {
+            'bufsize': 100,
+            'worker_num': 8,
+            'ordered': False,
+            'reorder_window': None
+        }
         args.update(worker_args)
+        if args['reorder_window'] is None:
+            args['reorder_window'] = 2 * args['bufsize']
         self._worker_args = args
         self._started = False
         self._source = source
@@ -68,19 +100,24 @@ class ParallelMappedDataset(ProxiedDataset):
         if use_process:
             from .shared_queue import SharedQueue as Queue
             from multiprocessing import Process as Worker
-            from multiprocessing import Event
         else:
             if six.PY3:
                 from queue import Queue
             else:
                 from Queue import Queue
             from threading import Thread as Worker
-            from threading import Event
 
         self._inq = Queue(bufsize)
         self._outq = Queue(bufsize)
         consumer_num = self._worker_args['worker_num']
 
+        # stats of consumers are stored in shared memory, and each
+        # consumer only updates it's own part, so no lock is needed
+        self._consumer_stats = RawArray(str('d'),
+                                        consumer_num * CONSUMER_STATS_SIZE)
+        self._producer_stats = {'source_time': 0., 'blocked_time': 0.}
+        self._wait_time = 0.
+
         id = str(uuid.uuid4())[-3:]
         self._producer = threading.Thread(
             target=self._produce,
@@ -92,67 +129,168 @@ class ParallelMappedDataset(ProxiedDataset):
             p = Worker(
                 target=self._consume,
                 args=('consumer-' + id + '_' + str(i), self._inq, self._outq,
-                      self._mapper))
+                      self._mapper, i * CONSUMER_STATS_SIZE))
             self._consumers.append(p)
             p.daemon = True
 
+        self._ordered = self._worker_args['ordered']
+        self._window = threading.Semaphore(self._worker_args['reorder_window'])
+        self._reorder_buf = {}
+        self._next_seq = 0
+
         self._epoch = -1
-        self._feeding_ev = Event()
-        self._produced = 0  # produced sample in self._produce
+        # guards '_epoch' and the source, and wakes up the producer when a
+        # new epoch starts
+        self._feeding_cond = threading.Condition()
+        self._produced = -1  # samples produced in this epoch, -1 if unknown
         self._consumed = 0  # consumed sample in self.next
         self._stopped_consumers = 0
 
     def _produce(self, id, source, inq):
         """Fetch data from source and feed it to 'inq' queue"""
+        epoch = -1
+        seq = 0
+        ended = True
+        error = None
+        stats = self._producer_stats
         while True:
-            self._feeding_ev.wait()
-            if self._exit:
-                break
-            try:
-                inq.put(source.next())
-                self._produced += 1
-            except StopIteration:
-                self._feeding_ev.clear()
-                self._feeding_ev.wait()  # wait other guy to wake up me
-                logger.debug("producer[{}] starts new epoch".format(id))
-            except Exception as e:
-                msg = "producer[{}] failed with error: {}".format(id, str(e))
-                inq.put(EndSignal(-1, msg))
+            # samples are read from source with the lock held, so that they
+            # are always tagged with the epoch the source is reset for
+            with self._feeding_cond:
+                # wait other guy to start a new epoch and wake up me
+                while ended and epoch == self._epoch and not self._exit:
+                    self._feeding_cond.wait()
+                if self._exit:
+                    break
+                if epoch != self._epoch:
+                    epoch = self._epoch
+                    seq = 0
+                    ended = False
+                    logger.debug("producer[{}] starts epoch[{}]".format(
+                        id, epoch))
+                try:
+                    st = time.time()
+                    sample = source.next()
+                    stats['source_time'] += time.time() - st
+                except StopIteration:
+                    ended = True
+                except Exception as e:
+                    msg = "producer[{}] failed with error: {}".format(id,
+                                                                     str(e))
+                    error = EndSignal(-1, msg)
+
+            # put to 'inq' without the lock, which may block until the
+            # consumers and 'next' make room
+            if error is not None:
+                inq.put(error)
                 break
+            if ended:
+                inq.put(EpochEnd(epoch, seq))
+                continue
+            st = time.time()
+            if self._ordered:
+                self._window.acquire()
+            inq.put((epoch, seq, sample))
+            stats['blocked_time'] += time.time() - st
+            seq += 1
 
         logger.debug("producer[{}] exits".format(id))
 
-    def _consume(self, id, inq, outq, mapper):
+    def _consume(self, id, inq, outq, mapper, stats_pos):
         """Fetch data from 'inq', process it and put result to 'outq'"""
+        stats = self._consumer_stats
         while True:
+            st = time.time()
             sample = inq.get()
+            stats[stats_pos + IDLE_TIME] += time.time() - st
             if isinstance(sample, EndSignal):
                 sample.errmsg += "[consumer[{}] exits]".format(id)
                 outq.put(sample)
                 logger.debug("end signal received, " +
                              "consumer[{}] exits".format(id))
                 break
+            elif isinstance(sample, EpochEnd):
+                outq.put(sample)
+                continue
 
             try:
+                epoch, seq, sample = sample
+                st = time.time()
                 result = mapper(sample)
-                outq.put(result)
+                cost = time.time() - st
+                stats[stats_pos + MAP_TIME] += cost
+                stats[stats_pos + MAPPED_NUM] += 1
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if cost * 1000 <= bound:
+                        stats[stats_pos + LATENCY_HIST + i] += 1
+                        break
+                outq.put((epoch, seq, result))
             except Exception as e:
-                msg = 'failed to map consumer[%s], error: {}'.format(str(e), id)
+                msg = 'failed to map consumer[{}], error: {}'.format(id, str(e))
                 outq.put(EndSignal(-1, msg))
                 break
 
     def drained(self):
         assert self._epoch >= 0, "first epoch has not started yet"
-        return self._source.drained() and self._produced == self._consumed
+        return self._produced == self._consumed
 
     def stop(self):
         """ notify to exit
         """
         self._exit = True
-        self._feeding_ev.set()
+        with self._feeding_cond:
+            self._feeding_cond.notify_all()
         for _ in range(len(self._consumers)):
             self._inq.put(EndSignal(0, "notify consumers to exit"))
 
+    def stats(self):
+        """ get counters of each stage, which are useful to find out
+            whether the source or the mapper is the bottleneck
+
+        Returns:
+            a dict with structure:
+            {
+                'inq_depth': int, # samples waiting to be mapped
+                'outq_depth': int, # mapped samples waiting to be consumed
+                'reorder_depth': int, # samples waiting to be reordered
+                'source_time': float, # time used to read from source
+                'producer_blocked_time': float, # time blocked by 'inq'
+                'consumer_idle_time': float, # time consumers wait for 'inq'
+                'map_time': float, # time consumers used to map samples
+                'mapped_samples': int,
+                'latency_hist': list of (upper bound in ms, count),
+                'wait_time': float, # time 'next' waits for mapped samples
+            }
+        """
+
+        def _qsize(q):
+            try:
+                return q.qsize()
+            except NotImplementedError:
+                # not implemented on some platforms, eg: Mac OS X
+                return -1
+
+        consumer_num = len(self._consumers)
+        consumer_stats = [0.] * CONSUMER_STATS_SIZE
+        for i in range(consumer_num):
+            pos = i * CONSUMER_STATS_SIZE
+            for j in range(CONSUMER_STATS_SIZE):
+                consumer_stats[j] += self._consumer_stats[pos + j]
+
+        hist = consumer_stats[LATENCY_HIST:]
+        return {
+            'inq_depth': _qsize(self._inq),
+            'outq_depth': _qsize(self._outq),
+            'reorder_depth': len(self._reorder_buf),
+            'source_time': self._producer_stats['source_time'],
+            'producer_blocked_time': self._producer_stats['blocked_time'],
+            'consumer_idle_time': consumer_stats[IDLE_TIME],
+            'map_time': consumer_stats[MAP_TIME],
+            'mapped_samples': int(consumer_stats[MAPPED_NUM]),
+            'latency_hist': [(b, int(c)) for b, c in zip(LATENCY_BUCKETS, hist)],
+            'wait_time': self._wait_time,
+        }
+
     def next(self):
         """ get next transformed sample
         """
@@ -163,7 +301,13 @@ class ParallelMappedDataset(ProxiedDataset):
             raise StopIteration()
 
         while True:
+            if self._ordered and self._next_seq in self._reorder_buf:
+                sample = self._reorder_buf.pop(self._next_seq)
+                break
+
+            st = time.time()
             sample = self._outq.get()
+            self._wait_time += time.time() - st
             if isinstance(sample, EndSignal):
                 self._stopped_consumers += 1
                 if sample.errno != 0:
@@ -174,34 +318,61 @@ class ParallelMappedDataset(ProxiedDataset):
                     self._inq.put(sample)
                 else:
                     raise ValueError("all consumers exited, no more samples")
-            else:
-                self._consumed += 1
-                return sample
+                continue
+            elif isinstance(sample, EpochEnd):
+                if sample.epoch == self._epoch:
+                    self._produced = sample.samples
+                    if self.drained():
+                        raise StopIteration()
+                continue
+
+            epoch, seq, sample = sample
+            if epoch != self._epoch:
+                # left by an epoch which is reset before finished
+                if self._ordered:
+                    self._window.release()
+                continue
+
+            if not self._ordered:
+                break
+            self._reorder_buf[seq] = sample
+
+        if self._ordered:
+            self._next_seq += 1
+            self._window.release()
+        self._consumed += 1
+        return sample
 
     def reset(self):
         """ reset for a new epoch of samples
         """
         if self._epoch < 0:
-            self._epoch = 0
             for p in self._consumers:
                 p.start()
             self._producer.start()
         else:
             if not self.drained():
-                logger.warn("do not reset before epoch[%d] finishes".format(
-                    self._epoch))
-                self._produced = self._produced - self._consumed
-            else:
-                self._produced = 0
-
-            self._epoch += 1
+                logger.warn("do not reset before epoch[{}] finishes, "
+                            "samples left will be dropped".format(self._epoch))
+            logger.debug("stats of epoch[{}]: {}".format(self._epoch,
+                                                         self.stats()))
 
         assert self._stopped_consumers == 0, "some consumers already exited," \
             + " cannot start another epoch"
 
-        self._source.reset()
+        for _ in range(len(self._reorder_buf)):
+            self._window.release()
+        self._reorder_buf = {}
+        self._next_seq = 0
+
+        self._produced = -1
         self._consumed = 0
-        self._feeding_ev.set()
+        # reset the source before publishing the new epoch, so the producer
+        # never tags samples of the old source with it
+        with self._feeding_cond:
+            self._source.reset()
+            self._epoch += 1
+            self._feeding_cond.notify_all()
 
 
 # FIXME(dengkaipeng): fix me if you have better impliment
@@ -20,6 +20,8 @@ import logging
 import cv2
 import numpy as np
 
+from .operators import DistortNormalizePermute
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,7 +29,8 @@ def build_post_map(coarsest_stride=1,
                    is_padding=False,
                    random_shapes=[],
                    multi_scales=[],
-                   use_padded_im_info=False):
+                   use_padded_im_info=False,
+                   normalize=None):
     """
     Build a mapper for post-processing batches
 
@@ -40,12 +43,27 @@ def build_post_map(coarsest_stride=1,
                                           shapes, [] for not resize.
             multi_scales: (list of int): resize image by random
                                           scales, [] for not resize.
+            normalize (dict): params of 'DistortNormalizePermute', if set,
+                              images in batch are HWC and not normalized,
+                              they are padded and resized as without it,
+                              but only the sampled pixels are normalized
+                              into one preallocated batch buffer.
           }
     Returns:
         a mapper function which accept one argument 'batch' and
-        return the processed result
+        return the processed result, and it's 'stats' returns the
+        fraction of padding pixels in padded batches
     """
 
+    # pixels of padded images and pixels of padding in them
+    padding_stats = {'pixels': 0, 'padded': 0}
+
+    def _count_padding(shapes, max_shape):
+        total = len(shapes) * int(max_shape[0]) * int(max_shape[1])
+        padded = total - int(np.sum(np.prod(shapes, axis=1)))
+        padding_stats['pixels'] += total
+        padding_stats['padded'] += padded
+
     def padding_minibatch(batch_data):
         if len(batch_data) == 1 and coarsest_stride == 1:
             return batch_data
@@ -55,17 +73,116 @@ def build_post_map(coarsest_stride=1,
                 np.ceil(max_shape[1] / coarsest_stride) * coarsest_stride)
             max_shape[2] = int(
                 np.ceil(max_shape[2] / coarsest_stride) * coarsest_stride)
+        _count_padding([data[0].shape[1:3] for data in batch_data],
+                       max_shape[1:3])
+
+        # all images are padded in one batch tensor
+        batch_im = np.zeros(
+            (len(batch_data), ) + tuple(max_shape), dtype=np.float32)
         padding_batch = []
-        for data in batch_data:
+        for i, data in enumerate(batch_data):
             im_c, im_h, im_w = data[0].shape[:]
-            padding_im = np.zeros(
-                (im_c, max_shape[1], max_shape[2]), dtype=np.float32)
-            padding_im[:, :im_h, :im_w] = data[0]
+            batch_im[i, :, :im_h, :im_w] = data[0]
             if use_padded_im_info:
                 data[1][:2] = max_shape[1:3]
-            padding_batch.append((padding_im, ) + data[1:])
+            padding_batch.append((batch_im[i], ) + data[1:])
         return padding_batch
 
+    normalize_op = None
+    if normalize is not None:
+        normalize_op = DistortNormalizePermute(**normalize)
+
+    def _resize_index(index, size, scale):
+        """ resize an axis of 'size' pixels by nearest interpolation like
+            'cv2.resize', where the first 'len(index)' pixels are sampled
+            from the image by 'index' and the others are padding, return
+            the index of the image pixels and the size of the resized axis
+        """
+        new_size = int(np.rint(size * scale))
+        src = np.floor(np.arange(new_size) * (1. / scale)).astype(np.int64)
+        src = np.minimum(src, size - 1)
+        return index[src[src < len(index)]], new_size
+
+    def normalize_minibatch(batch_data):
+        """ pad, resize and normalize the HWC images like the path without
+            'normalize', the resizing only samples pixels of the images,
+            which are gathered once and normalized into the batch buffer
+        """
+        shapes = np.array([data[0].shape[:2] for data in batch_data])
+        # shapes of padded images, only the images are resized if not set
+        sizes = shapes.copy()
+        if is_padding and (len(batch_data) > 1 or coarsest_stride > 1):
+            max_shape = shapes.max(axis=0)
+            if coarsest_stride > 1:
+                max_shape = np.ceil(max_shape / coarsest_stride) * \
+                    coarsest_stride
+                max_shape = max_shape.astype('int32')
+            _count_padding(shapes, max_shape)
+            sizes[:] = max_shape
+            if use_padded_im_info:
+                for data in batch_data:
+                    data[1][:2] = max_shape
+
+        # rows and columns of padded images sampled from the images
+        indices = [[np.arange(h), np.arange(w)] for h, w in shapes]
+        scales = []
+
+        def _resize(scale_x, scale_y):
+            scales.append((scale_x, scale_y))
+            for index, size in zip(indices, sizes):
+                index[0], size[0] = _resize_index(index[0], size[0], scale_y)
+                index[1], size[1] = _resize_index(index[1], size[1], scale_x)
+
+        if len(random_shapes) > 0:
+            # same as 'random_shape'
+            shape = np.random.choice(random_shapes)
+            h, w = sizes[0]
+            _resize(float(shape) / w, float(shape) / h)
+        if len(multi_scales) > 0:
+            # same as 'multi_scale_resize'
+            scale = np.random.choice(multi_scales)
+            _resize(scale, scale)
+            batch_data = [(data[0], [tuple(size.tolist()), scale]) +
+                          tuple(data[2:])
+                          for data, size in zip(batch_data, sizes)]
+
+        # images of different shapes are not padded if 'is_padding' is
+        # not set, they are normalized to separate buffers
+        if (sizes == sizes[0]).all():
+            # only padded area need to be zeroed
+            filled = all(
+                len(rows) == size[0] and len(cols) == size[1]
+                for (rows, cols), size in zip(indices, sizes))
+            alloc = np.empty if filled else np.zeros
+            outs = alloc(
+                (len(batch_data), 3) + tuple(sizes[0]), dtype=np.float32)
+        else:
+            outs = [
+                np.empty(
+                    (3, ) + tuple(size), dtype=np.float32) for size in sizes
+            ]
+
+        normalized_batch = []
+        for data, (rows, cols), out in zip(batch_data, indices, outs):
+            im = data[0]
+            if len(scales) == 1 and all(
+                    int(np.rint(n * scale)) == len(index)
+                    for n, scale, index in zip(im.shape[:2], scales[0][::-1],
+                                               [rows, cols])):
+                # same pixels as resizing the image alone, which is faster
+                im = cv2.resize(
+                    im,
+                    None,
+                    None,
+                    fx=scales[0][0],
+                    fy=scales[0][1],
+                    interpolation=cv2.INTER_NEAREST)
+            elif len(scales) > 0:
+                im = im.take(rows, axis=0).take(cols, axis=1)
+            normalize_op.apply(im, out=out)
+            normalized_batch.append((out, ) + tuple(data[1:]))
+        return normalized_batch
+
     def random_shape(batch_data):
         # For YOLO: gt_bbox is normalized, is scale invariant.
         shape = np.random.choice(random_shapes)
@@ -102,6 +219,9 @@ def build_post_map(coarsest_stride=1,
 
     def _mapper(batch_data):
         try:
+            if normalize_op is not None:
+                return normalize_minibatch(batch_data)
+
             if is_padding:
                 batch_data = padding_minibatch(batch_data)
             if len(random_shapes) > 0:
@@ -115,4 +235,11 @@ def build_post_map(coarsest_stride=1,
 
         return batch_data
 
+    def _stats():
+        fraction = 0.
+        if padding_stats['pixels'] > 0:
+            fraction = padding_stats['padded'] / padding_stats['pixels']
+        return {'padding_fraction': fraction}
+
+    _mapper.stats = _stats
     return _mapper
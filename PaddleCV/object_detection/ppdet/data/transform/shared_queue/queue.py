@@ -19,12 +19,13 @@ from __future__ import unicode_literals
 
 import sys
 import six
+import struct
+import weakref
+import numpy as np
 if six.PY3:
     import pickle
-    from io import BytesIO as StringIO
 else:
     import cPickle as pickle
-    from cStringIO import StringIO
 
 import logging
 import traceback
@@ -41,12 +42,125 @@ class SharedQueueError(ValueError):
     pass
 
 
+# wire format of an object in shared buffer:
+#   [header length][pickled header][padding][ndarray payloads]
+# the header is the object whose ndarrays are replaced by '_NDArrayMeta',
+# and the payloads are raw bytes of these ndarrays
+HEADER_LEN_FMT = str('Q')
+HEADER_LEN_SIZE = struct.calcsize(HEADER_LEN_FMT)
+PAYLOAD_ALIGNMENT = 16
+
+
+def _align(size):
+    return (size + PAYLOAD_ALIGNMENT - 1) \
+        // PAYLOAD_ALIGNMENT * PAYLOAD_ALIGNMENT
+
+
+class _NDArrayMeta(object):
+    """ placeholder for an ndarray whose data is stored in payloads
+    """
+    __slots__ = ['offset', 'dtype', 'shape']
+
+    def __init__(self, offset, dtype, shape):
+        self.offset = offset
+        self.dtype = dtype
+        self.shape = shape
+
+    def __getstate__(self):
+        return (self.offset, self.dtype, self.shape)
+
+    def __setstate__(self, state):
+        self.offset, self.dtype, self.shape = state
+
+
+class _SharedPayload(np.ndarray):
+    """ view of the payloads in shared buffer, which is used as the
+        base of all ndarrays in one object and the buffer will be freed
+        after all of them are released
+    """
+    pass
+
+
+# weak references to '_SharedPayload' which are still in use
+_alive_payloads = {}
+# buffers whose payloads have been released, note that they are not freed
+# in the weakref callback which may be called by gc when the lock of
+# 'SharedMemoryMgr' is held
+_released_buffers = []
+
+
+def _hold_buffer(payload, buff):
+    def _release(ref):
+        del _alive_payloads[id(ref)]
+        _released_buffers.append(buff)
+
+    ref = weakref.ref(payload, _release)
+    _alive_payloads[id(ref)] = ref
+
+
+def _free_released_buffers():
+    while len(_released_buffers) > 0:
+        _released_buffers.pop().free()
+
+
+def _split_arrays(obj, arrays, offset):
+    """ replace ndarrays in 'obj' with '_NDArrayMeta' and collect them
+        to 'arrays', only dict, list and tuple are walked through
+
+    Returns:
+        tuple of (object with placeholders, payload size)
+    """
+    if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+        arrays.append(obj)
+        meta = _NDArrayMeta(offset, obj.dtype, obj.shape)
+        return meta, offset + _align(obj.nbytes)
+    elif type(obj) is dict:
+        out = {}
+        for k, v in obj.items():
+            out[k], offset = _split_arrays(v, arrays, offset)
+        return out, offset
+    elif type(obj) in [list, tuple]:
+        out = []
+        for v in obj:
+            v, offset = _split_arrays(v, arrays, offset)
+            out.append(v)
+        return type(obj)(out), offset
+    else:
+        return obj, offset
+
+
+def _merge_arrays(obj, payload, no_copy):
+    """ restore ndarrays in 'obj' from 'payload'
+    """
+    if isinstance(obj, _NDArrayMeta):
+        nbytes = int(np.prod(obj.shape)) * obj.dtype.itemsize
+        data = payload[obj.offset:obj.offset + nbytes]
+        arr = data.view(dtype=obj.dtype, type=np.ndarray).reshape(obj.shape)
+        return arr if no_copy else arr.copy()
+    elif type(obj) is dict:
+        return {k: _merge_arrays(v, payload, no_copy) for k, v in obj.items()}
+    elif type(obj) in [list, tuple]:
+        return type(obj)([_merge_arrays(v, payload, no_copy) for v in obj])
+    else:
+        return obj
+
+
 class SharedQueue(Queue):
     """ a Queue based on shared memory to communicate data between Process,
         and it's interface is compatible with 'multiprocessing.queues.Queue'
+
+        ndarrays in the object are not pickled but written to shared memory
+        directly, and they are restored as views on the shared memory
+        without copy if 'no_copy' is True, in which case the shared buffer
+        is freed after all these ndarrays are released
     """
 
-    def __init__(self, maxsize=0, mem_mgr=None, memsize=None, pagesize=None):
+    def __init__(self,
+                 maxsize=0,
+                 mem_mgr=None,
+                 memsize=None,
+                 pagesize=None,
+                 no_copy=True):
         """ init
         """
         if six.PY3:
@@ -59,15 +173,66 @@ class SharedQueue(Queue):
         else:
             self._shared_mem = SharedMemoryMgr(
                 capacity=memsize, pagesize=pagesize)
+        self._no_copy = no_copy
+
+    def _pack(self, obj):
+        """ write 'obj' to a new allocated shared buffer
+        """
+        _free_released_buffers()
+        arrays = []
+        obj, payload_size = _split_arrays(obj, arrays, 0)
+        header = pickle.dumps(obj, -1)
+        header_size = HEADER_LEN_SIZE + len(header)
+        payload_start = _align(header_size) if len(arrays) > 0 \
+            else header_size
+
+        buff = self._shared_mem.malloc(payload_start + payload_size)
+        try:
+            buff.put(struct.pack(HEADER_LEN_FMT, len(header)) + header)
+            if len(arrays) > 0:
+                buff.resize(payload_start + payload_size)
+                payload = buff.get(offset=payload_start, size=payload_size)
+                offset = 0
+                for arr in arrays:
+                    dst = payload[offset:offset + arr.nbytes]
+                    dst = dst.view(dtype=arr.dtype).reshape(arr.shape)
+                    np.copyto(dst, arr)
+                    offset += _align(arr.nbytes)
+        except Exception as e:
+            buff.free()
+            raise e
+        return buff
+
+    def _unpack(self, buff):
+        """ restore the object from 'buff'
+
+        Returns:
+            tuple of (object, whether 'buff' is still referenced by it)
+        """
+        _free_released_buffers()
+        data = buff.get()
+        header_len = struct.unpack(HEADER_LEN_FMT,
+                                   data[:HEADER_LEN_SIZE].tostring())[0]
+        header_size = HEADER_LEN_SIZE + header_len
+        obj = pickle.loads(data[HEADER_LEN_SIZE:header_size].tostring())
+        if header_size == buff.size():
+            return obj, False
+
+        payload = data[_align(header_size):]
+        if self._no_copy:
+            payload = payload.view(_SharedPayload)
+            obj = _merge_arrays(obj, payload, True)
+            _hold_buffer(payload, buff)
+            return obj, True
+        else:
+            return _merge_arrays(obj, payload, False), False
 
     def put(self, obj, **kwargs):
         """ put an object to this queue
         """
-        obj = pickle.dumps(obj, -1)
         buff = None
         try:
-            buff = self._shared_mem.malloc(len(obj))
-            buff.put(obj)
+            buff = self._pack(obj)
             super(SharedQueue, self).put(buff, **kwargs)
         except Exception as e:
             stack_info = traceback.format_exc()
@@ -85,8 +250,10 @@ class SharedQueue(Queue):
         buff = None
         try:
             buff = super(SharedQueue, self).get(**kwargs)
-            data = buff.get()
-            return pickle.load(StringIO(data))
+            obj, referenced = self._unpack(buff)
+            if referenced:
+                buff = None
+            return obj
         except Exception as e:
             stack_info = traceback.format_exc()
             err_msg = 'failed to get element from SharedQueue '\
@@ -197,6 +197,249 @@ class SharedBuffer(object):
 class PageAllocator(object):
     """ allocator used to malloc and free shared memory which
         is split into pages
+
+        free pages are kept as runs of continuous pages, and runs are
+        linked into segregated free lists by size class(floor(log2(pages))),
+        so 'malloc_page' and 'free_page' are O(1) amortized instead of
+        scanning the whole page status. every run records its length at its
+        first and last page(boundary tags), and a page status map is used
+        to coalesce adjacent free runs when pages are freed.
+
+        all the states are stored in the header pages of 'base', so the
+        allocator can be shared between processes which are forked after
+        it's created, and the caller should hold a lock when using it
+    """
+    s_allocator_header = 12
+
+    def __init__(self, base, total_pages, page_size):
+        """ init
+        """
+        self._magic_num = 1234321000 + random.randint(100, 999)
+        self._base = base
+        self._total_pages = total_pages
+        self._page_size = page_size
+        self._class_num = total_pages.bit_length()
+
+        # layout of header:
+        #   [magic|alloc_pos|used][heads][run_len][next][prev][status]
+        heads_off = self.s_allocator_header
+        runs_off = heads_off + 4 * self._class_num
+        next_off = runs_off + 4 * total_pages
+        prev_off = next_off + 4 * total_pages
+        status_off = prev_off + 4 * total_pages
+        header_bytes = status_off + total_pages
+
+        header_pages = int(math.ceil(header_bytes / page_size))
+        assert header_pages < total_pages, 'too small shared memory[%d] '\
+            'for %d pages' % (total_pages * page_size, total_pages)
+
+        self._header_pages = header_pages
+        self._free_pages = total_pages - header_pages
+        self._header_size = self._header_pages * page_size
+
+        self._heads = base[heads_off:runs_off].view(np.int32)
+        self._run_len = base[runs_off:next_off].view(np.int32)
+        self._next = base[next_off:prev_off].view(np.int32)
+        self._prev = base[prev_off:status_off].view(np.int32)
+        self._status = base[status_off:header_bytes]
+        self._reset()
+
+    def _dump_alloc_info(self, fname):
+        hpages, tpages, pos, used = self.header()
+        info = {
+            'magic_num': self._magic_num,
+            'header_pages': hpages,
+            'total_pages': tpages,
+            'pos': pos,
+            'used': used
+        }
+        info['alloc_flags'] = self.get_page_status(
+            0, tpages, ret_flag=True).encode()
+        fname = fname + '.' + str(uuid.uuid4())[:6]
+        with open(fname, 'wb') as f:
+            f.write(pickle.dumps(info, -1))
+        logger.warn('dump alloc info to file[%s]' % (fname))
+
+    def _reset(self):
+        header_info = struct.pack(
+            str('III'), self._magic_num, self._header_pages,
+            self._header_pages)
+        assert len(header_info) == self.s_allocator_header, \
+            'invalid size of header_info'
+
+        memcopy(self._base[0:self.s_allocator_header], header_info)
+        self._heads[:] = -1
+        self._next[:] = -1
+        self._prev[:] = -1
+        self._run_len[:] = 0
+        self.set_page_status(0, self._header_pages, '1')
+        self.set_page_status(self._header_pages, self._free_pages, '0')
+        self._insert_run(self._header_pages, self._free_pages)
+
+    def _size_class(self, page_num):
+        return page_num.bit_length() - 1
+
+    def _insert_run(self, start, page_num):
+        """ record a free run and push it to the front of it's free list
+        """
+        self._run_len[start] = page_num
+        self._run_len[start + page_num - 1] = page_num
+
+        cls = self._size_class(page_num)
+        head = int(self._heads[cls])
+        self._prev[start] = -1
+        self._next[start] = head
+        if head >= 0:
+            self._prev[head] = start
+        self._heads[cls] = start
+
+    def _remove_run(self, start):
+        """ unlink a free run from it's free list
+        """
+        prev = int(self._prev[start])
+        nxt = int(self._next[start])
+        if prev >= 0:
+            self._next[prev] = nxt
+        else:
+            self._heads[self._size_class(int(self._run_len[start]))] = nxt
+        if nxt >= 0:
+            self._prev[nxt] = prev
+        self._prev[start] = -1
+        self._next[start] = -1
+
+    def _find_run(self, page_num):
+        """ find a free run with at least 'page_num' pages
+        """
+        cls = self._size_class(page_num)
+        # runs in this class may be smaller than 'page_num', so check them
+        pos = int(self._heads[cls])
+        while pos >= 0:
+            if self._run_len[pos] >= page_num:
+                return pos
+            pos = int(self._next[pos])
+
+        # any run in larger classes is big enough
+        for cls in range(cls + 1, self._class_num):
+            if self._heads[cls] >= 0:
+                return int(self._heads[cls])
+        return -1
+
+    def header(self):
+        """ get header info of this allocator
+        """
+        header_str = self._base[0:self.s_allocator_header].tostring()
+        magic, pos, used = struct.unpack(str('III'), header_str)
+
+        assert magic == self._magic_num, \
+            'invalid header magic[%d] in shared memory' % (magic)
+        return self._header_pages, self._total_pages, pos, used
+
+    def empty(self):
+        """ are all allocatable pages available
+        """
+        header_pages, pages, pos, used = self.header()
+        return header_pages == used
+
+    def full(self):
+        """ are all allocatable pages used
+        """
+        header_pages, pages, pos, used = self.header()
+        return used == pages
+
+    def __str__(self):
+        header_pages, pages, pos, used = self.header()
+        desc = '{page_info[magic:%d,total:%d,used:%d,header:%d,alloc_pos:%d,pagesize:%d]}' \
+            % (self._magic_num, pages, used, header_pages, pos, self._page_size)
+        return 'PageAllocator:%s' % (desc)
+
+    def set_alloc_info(self, alloc_pos, used_pages):
+        """ set allocating position to new value
+        """
+        memcopy(self._base[4:12], struct.pack(str('II'), alloc_pos, used_pages))
+
+    def set_page_status(self, start, page_num, status):
+        """ set pages from 'start' to 'end' with new same status 'status'
+        """
+        assert status in ['0', '1'], 'invalid status[%s] for page status '\
+            'in allocator[%s]' % (status, str(self))
+        end = start + page_num
+        assert start >= 0 and end <= self._total_pages, 'invalid end[%d] of pages '\
+            'in allocator[%s]' % (end, str(self))
+        self._status[start:end] = 1 if status == '1' else 0
+
+    def get_page_status(self, start, page_num, ret_flag=False):
+        end = start + page_num
+        assert start >= 0 and end <= self._total_pages, 'invalid end[%d] of pages '\
+            'in allocator[%s]' % (end, str(self))
+        status = self._status[start:end]
+        if ret_flag:
+            return (status + ord('0')).tostring().decode()
+
+        used_num = int(np.count_nonzero(status))
+        if used_num == page_num:
+            return (page_num, 1)
+        else:
+            return (page_num - used_num, 0)
+
+    def malloc_page(self, page_num):
+        assert page_num > 0, 'invalid page_num[%d] to malloc' % (page_num)
+        header_pages, pages, pos, used = self.header()
+        start = self._find_run(page_num)
+        if start < 0:
+            free_pages = pages - used
+            if free_pages == 0:
+                err_msg = 'all pages have been used:%s' % (str(self))
+            else:
+                err_msg = 'not found continuous %d pages in %d free pages' \
+                    % (page_num, free_pages)
+            err_msg = 'failed to malloc %d pages for reason[%s] and allocator status[%s]' \
+                % (page_num, err_msg, str(self))
+            raise MemoryFullError(err_msg)
+
+        run_len = int(self._run_len[start])
+        self._remove_run(start)
+        if run_len > page_num:
+            self._insert_run(start + page_num, run_len - page_num)
+
+        self._status[start:start + page_num] = 1
+        self.set_alloc_info(start, used + page_num)
+        return start
+
+    def free_page(self, start, page_num):
+        """ free 'page_num' pages start from 'start'
+        """
+        page_status = self.get_page_status(start, page_num)
+        assert page_status == (page_num, 1), \
+            'invalid status[%s] when free [%d, %d]' \
+                % (str(page_status), start, page_num)
+        self._status[start:start + page_num] = 0
+        _, _, pos, used = self.header()
+        self.set_alloc_info(pos, used - page_num)
+
+        # coalesce with the free runs just before and after it
+        if start > self._header_pages and self._status[start - 1] == 0:
+            prev_len = int(self._run_len[start - 1])
+            start -= prev_len
+            page_num += prev_len
+            self._remove_run(start)
+
+        end = start + page_num
+        if end < self._total_pages and self._status[end] == 0:
+            next_len = int(self._run_len[end])
+            page_num += next_len
+            self._remove_run(end)
+
+        self._insert_run(start, page_num)
+
+
+class LinearPageAllocator(object):
+    """ allocator used to malloc and free shared memory which
+        is split into pages, free pages are found by linearly
+        scanning the page status from the last allocated position
+
+        note that:
+            this is the original allocator which is kept for comparison,
+            and 'PageAllocator' should be preferred
     """
     s_allocator_header = 12
 
@@ -319,7 +562,7 @@ class PageAllocator(object):
             # maybe flags already has some '0' pages,
             # so just check 'page_num - len(flags)' pages
             flags += self.get_page_status(
-                pos, page_num - len(flags), ret_flag=True)
+                pos + len(flags), page_num - len(flags), ret_flag=True)
 
             if flags.count('0') == page_num:
                 break
@@ -392,11 +635,20 @@ class SharedMemoryMgr(object):
             id)
         return cls.s_memory_mgrs[id]
 
-    def __init__(self, capacity=None, pagesize=None):
+    def __init__(self, capacity=None, pagesize=None, allocator=None):
         """ init
+
+            Args:
+                capacity (int): size of shared memory in bytes
+                pagesize (int): size of a page in bytes
+                allocator (class): class of page allocator,
+                    default to 'PageAllocator'
         """
         logger.debug('create SharedMemoryMgr')
 
+        self._allocator_cls = PageAllocator if allocator is None \
+            else allocator
+
         pagesize = 64 * 1024 if pagesize is None else pagesize
         assert type(pagesize) is int, "invalid type of pagesize[%s]" \
             % (str(pagesize))
@@ -428,8 +680,8 @@ class SharedMemoryMgr(object):
             self._shared_mem, dtype='uint8', count=self._cap)
         self._locker.acquire()
         try:
-            self._allocator = PageAllocator(self._base, self._total_pages,
-                                            self._page_size)
+            self._allocator = self._allocator_cls(
+                self._base, self._total_pages, self._page_size)
         finally:
             self._locker.release()
 
@@ -16,12 +16,33 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import bisect
 import numpy as np
 import functools
-import collections
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
 from ..dataset import Dataset
 
 
+def _empty(x):
+    if isinstance(x, np.ndarray) and x.size == 0:
+        return True
+    elif isinstance(x, Sequence) and len(x) == 0:
+        return True
+    else:
+        return False
+
+
+def _has_empty(items):
+    if any(x is None for x in items):
+        return True
+    if any(_empty(x) for x in items):
+        return True
+    return False
+
+
 class ProxiedDataset(Dataset):
     """proxy method called to 'self._ds' when if not defined"""
 
@@ -57,6 +78,13 @@ class MappedDataset(ProxiedDataset):
         sample = self._ds.next()
         return self._mapper(sample)
 
+    def stats(self):
+        """ get stats of the mapper if it provides
+        """
+        if hasattr(self._mapper, 'stats'):
+            return self._mapper.stats()
+        return {}
+
 
 class BatchedDataset(ProxiedDataset):
     """
@@ -75,27 +103,11 @@ class BatchedDataset(ProxiedDataset):
 
     def next(self):
         """proxy to self._ds.next"""
-
-        def empty(x):
-            if isinstance(x, np.ndarray) and x.size == 0:
-                return True
-            elif isinstance(x, collections.Sequence) and len(x) == 0:
-                return True
-            else:
-                return False
-
-        def has_empty(items):
-            if any(x is None for x in items):
-                return True
-            if any(empty(x) for x in items):
-                return True
-            return False
-
         batch = []
         for _ in range(self._batchsz):
             try:
                 out = self._ds.next()
-                while has_empty(out):
+                while _has_empty(out):
                     out = self._ds.next()
                 batch.append(out)
             except StopIteration:
@@ -104,3 +116,84 @@ class BatchedDataset(ProxiedDataset):
                 else:
                     raise StopIteration
         return batch
+
+
+class BucketedBatchedDataset(BatchedDataset):
+    """
+    Batching samples of similar shapes, to reduce padding in a batch
+
+    Samples are put to buckets by aspect ratio and size of the image,
+    and a batch is returned once a bucket is full. When 'ds' is drained,
+    samples left in buckets are batched in order of buckets.
+
+    Args:
+        ds (instance of Dataset): dataset to be batched
+        batchsize (int): sample number for each batch
+        drop_last (bool): drop last samples when not enough for one batch
+        aspect_ratios (list of float): thresholds of width / height
+            to split buckets
+        sizes (list of int): thresholds of max(height, width)
+            to split buckets
+        channel_first (bool): whether the image, which is the first
+            field of a sample, is in CHW
+    """
+
+    def __init__(self,
+                 ds,
+                 batchsize,
+                 drop_last=False,
+                 aspect_ratios=[1.],
+                 sizes=[],
+                 channel_first=True):
+        super(BucketedBatchedDataset, self).__init__(ds, batchsize,
+                                                     drop_last)
+        self._aspect_ratios = sorted(aspect_ratios)
+        self._sizes = sorted(sizes)
+        self._channel_first = channel_first
+        self._buckets = {}
+        self._leftover = None
+
+    def _bucket_id(self, sample):
+        shape = sample[0].shape
+        h, w = shape[1:3] if self._channel_first else shape[:2]
+        return (bisect.bisect(self._aspect_ratios, float(w) / h),
+                bisect.bisect(self._sizes, max(h, w)))
+
+    def _next_leftover(self):
+        if len(self._leftover) >= self._batchsz or \
+                (not self._drop_last and len(self._leftover) > 0):
+            batch = self._leftover[:self._batchsz]
+            self._leftover = self._leftover[self._batchsz:]
+            return batch
+        raise StopIteration
+
+    def next(self):
+        """proxy to self._ds.next"""
+        if self._leftover is not None:
+            return self._next_leftover()
+
+        while True:
+            try:
+                out = self._ds.next()
+            except StopIteration:
+                self._leftover = []
+                for k in sorted(self._buckets.keys()):
+                    self._leftover.extend(self._buckets[k])
+                self._buckets = {}
+                return self._next_leftover()
+
+            if _has_empty(out):
+                continue
+            key = self._bucket_id(out)
+            bucket = self._buckets.setdefault(key, [])
+            bucket.append(out)
+            if len(bucket) == self._batchsz:
+                del self._buckets[key]
+                return bucket
+
+    def reset(self):
+        """ drop samples in buckets and reset 'ds'
+        """
+        self._buckets = {}
+        self._leftover = None
+        self._ds.reset()
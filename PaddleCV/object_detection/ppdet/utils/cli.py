@@ -61,6 +61,12 @@ def parse_args():
         action='store_true',
         default=False,
         help="Whether perform evaluation in train")
+    parser.add_argument(
+        "--eval_workers",
+        default=None,
+        type=int,
+        help="The number of processes to encode masks for COCO evaluation, if not set, min(cpu_count, 8) is used, 0 for encoding in main process."
+    )
     parser.add_argument(
         "-o", "--opt", nargs=REMAINDER, help="set configuration options")
     args = parser.parse_args()
@@ -19,9 +19,13 @@ from __future__ import unicode_literals
 
 import os
 import sys
+import six
 import json
+import threading
+import collections
 import cv2
 import numpy as np
+import multiprocessing as mp
 from pycocotools.coco import COCO
 from pycocotools.cocoeval import COCOeval
 import pycocotools.mask as mask_util
@@ -30,56 +34,218 @@ import logging
 logger = logging.getLogger(__name__)
 
 __all__ = [
-    'bbox_eval', 'mask_eval', 'bbox2out', 'mask2out', 'get_category_info'
+    'bbox_eval', 'mask_eval', 'bbox2out', 'mask2out', 'get_category_info',
+    'COCOResultWriter'
 ]
 
 
 def bbox_eval(results, anno_file, outfile, with_background=True):
-    assert 'bbox' in results[0]
+    """
+    Evaluate bbox results, if 'results' is None, they are already
+    saved to 'outfile' by 'COCOResultWriter'.
+    """
     assert outfile.endswith('.json')
-
     coco_gt = COCO(anno_file)
-    cat_ids = coco_gt.getCatIds()
+    if results is not None:
+        assert 'bbox' in results[0]
+        cat_ids = coco_gt.getCatIds()
 
-    # when with_background = True, mapping category to classid, like:
-    #   background:0, first_class:1, second_class:2, ...
-    clsid2catid = dict(
-        {i + int(with_background): catid
-         for i, catid in enumerate(cat_ids)})
+        # when with_background = True, mapping category to classid, like:
+        #   background:0, first_class:1, second_class:2, ...
+        clsid2catid = dict(
+            {i + int(with_background): catid
+             for i, catid in enumerate(cat_ids)})
 
-    xywh_results = bbox2out(results, clsid2catid)
-    with open(outfile, 'w') as f:
-        json.dump(xywh_results, f)
+        xywh_results = bbox2out(results, clsid2catid)
+        with open(outfile, 'w') as f:
+            json.dump(xywh_results, f)
 
-    logger.info("Start evaluate...")
-    coco_dt = coco_gt.loadRes(outfile)
-    coco_ev = COCOeval(coco_gt, coco_dt, 'bbox')
-    coco_ev.evaluate()
-    coco_ev.accumulate()
-    coco_ev.summarize()
+    cocoapi_eval(coco_gt, outfile, 'bbox')
     # flush coco evaluation result
     sys.stdout.flush()
 
 
-def mask_eval(results, anno_file, outfile, resolution, thresh_binarize=0.5):
-    assert 'mask' in results[0]
+def mask_eval(results,
+              anno_file,
+              outfile,
+              resolution,
+              thresh_binarize=0.5,
+              num_workers=None):
+    """
+    Evaluate mask results, if 'results' is None, they are already
+    saved to 'outfile' by 'COCOResultWriter'.
+    """
     assert outfile.endswith('.json')
-
     coco_gt = COCO(anno_file)
-    clsid2catid = {i + 1: v for i, v in enumerate(coco_gt.getCatIds())}
+    if results is not None:
+        assert 'mask' in results[0]
+        clsid2catid = {i + 1: v for i, v in enumerate(coco_gt.getCatIds())}
+
+        if num_workers is None:
+            num_workers = min(mp.cpu_count(), 8)
+        segm_results = mask2out(results, clsid2catid, resolution,
+                                thresh_binarize, num_workers)
+        with open(outfile, 'w') as f:
+            json.dump(segm_results, f)
+
+    cocoapi_eval(coco_gt, outfile, 'segm')
 
-    segm_results = mask2out(results, clsid2catid, resolution, thresh_binarize)
-    with open(outfile, 'w') as f:
-        json.dump(segm_results, f)
 
+def cocoapi_eval(coco_gt, jsonfile, style):
+    """
+    Evaluate results saved in 'jsonfile' with COCO API
+
+    Args:
+        coco_gt (COCO): ground truth
+        jsonfile (str): file of results in COCO format
+        style (str): 'bbox' or 'segm'
+    """
     logger.info("Start evaluate...")
-    coco_dt = coco_gt.loadRes(outfile)
-    coco_ev = COCOeval(coco_gt, coco_dt, 'segm')
+    coco_dt = coco_gt.loadRes(jsonfile)
+    coco_ev = COCOeval(coco_gt, coco_dt, style)
     coco_ev.evaluate()
     coco_ev.accumulate()
     coco_ev.summarize()
 
 
+class COCOResultWriter(object):
+    """
+    Convert results of batches to COCO format and append them to json
+    files in a background thread while evaluating, so that outputs of
+    all batches are not kept in memory, and the conversion overlaps
+    with running the program.
+
+    Args:
+        outfiles (dict): json files to save, eg: {'bbox': 'bbox.json',
+            'mask': 'mask.json'}, 'mask' can be omitted without masks
+        clsid2catid (dict): class id to category id
+        resolution (int): resolution of masks
+        thresh_binarize (float): threshold to binarize masks
+        queue_size (int): max batches waiting to be converted
+        num_workers (int): number of processes to paste and encode masks
+            of batches in parallel, 0 for encoding in the writer thread,
+            default min(cpu_count, 8)
+    """
+
+    def __init__(self,
+                 outfiles,
+                 clsid2catid,
+                 resolution=None,
+                 thresh_binarize=0.5,
+                 queue_size=16,
+                 num_workers=None):
+        if six.PY3:
+            from queue import Queue
+        else:
+            from Queue import Queue
+        self._outfiles = outfiles
+        self._clsid2catid = clsid2catid
+        self._resolution = resolution
+        self._thresh_binarize = thresh_binarize
+        self._queue = Queue(queue_size)
+        self._files = {}
+        self._counts = {}
+        self._error = None
+        if num_workers is None:
+            num_workers = min(mp.cpu_count(), 8)
+        # masks of a batch (usually 1 image) are encoded by a pool created
+        # once here, and batches are encoded concurrently and written in
+        # order, at most '_max_pending' batches are being encoded
+        self._pool = None
+        if num_workers > 0 and resolution is not None \
+                and 'mask' in outfiles:
+            self._pool = mp.Pool(num_workers)
+        self._pending = collections.deque()
+        self._max_pending = 2 * num_workers
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _write(self, key, items):
+        if key not in self._files:
+            self._files[key] = open(self._outfiles[key], 'w')
+            self._files[key].write('[')
+            self._counts[key] = 0
+        if len(items) == 0:
+            return
+        f = self._files[key]
+        if self._counts[key] > 0:
+            f.write(', ')
+        # dump the list and strip the brackets
+        f.write(json.dumps(items)[1:-1])
+        self._counts[key] += len(items)
+
+    def _write_masks(self, wait_all=False):
+        """ write encoded masks of batches in order, wait for the earliest
+            batch if too many are being encoded or 'wait_all' is set
+        """
+        while self._pending and (wait_all or self._pending[0].ready() or
+                                 len(self._pending) > self._max_pending):
+            segms = self._pending.popleft().get()
+            self._write('mask', [segm for job in segms for segm in job])
+
+    def _run(self):
+        while True:
+            res = self._queue.get()
+            if self._error is not None:
+                if res is None:
+                    break
+                continue
+            try:
+                if res is None:
+                    self._write_masks(wait_all=True)
+                    break
+                self._write('bbox', bbox2out([res], self._clsid2catid))
+                if 'mask' in res and 'mask' in self._outfiles:
+                    if self._pool is None:
+                        self._write('mask',
+                                    mask2out([res], self._clsid2catid,
+                                             self._resolution,
+                                             self._thresh_binarize))
+                    else:
+                        jobs = _mask_jobs([res], self._clsid2catid,
+                                          self._resolution,
+                                          self._thresh_binarize)
+                        self._pending.append(
+                            self._pool.map_async(_masks_to_segms, jobs))
+                        self._write_masks()
+            except Exception as e:
+                logger.warn("failed to convert results with error: {}".format(
+                    str(e)))
+                self._error = e
+
+    def add(self, res):
+        """ add outputs of one batch, which is a dict like the item of
+            'results' of 'bbox_eval', it's blocked if too many batches
+            are waiting to be converted
+        """
+        self._queue.put(res)
+
+    def close(self):
+        """ wait for all batches to be converted and close files
+
+        Returns:
+            dict of number of results saved to each file
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._pool is not None:
+            if self._error is not None:
+                self._pool.terminate()
+            else:
+                self._pool.close()
+            self._pool.join()
+        # bbox file is always saved even if there is no result
+        if 'bbox' not in self._files:
+            self._write('bbox', [])
+        for f in self._files.values():
+            f.write(']')
+            f.close()
+        if self._error is not None:
+            raise self._error
+        return dict(self._counts)
+
+
 def bbox2out(results, clsid2catid):
     xywh_res = []
     for t in results:
@@ -89,33 +255,107 @@ def bbox2out(results, clsid2catid):
         if bboxes.shape == (1, 1) or bboxes is None:
             continue
 
-        k = 0
-        for i in range(len(lengths)):
-            num = lengths[i]
-            im_id = int(im_ids[i][0])
-            for j in range(num):
-                dt = bboxes[k]
-                clsid, score, xmin, ymin, xmax, ymax = dt.tolist()
-                catid = clsid2catid[clsid]
-                w = xmax - xmin + 1
-                h = ymax - ymin + 1
-                bbox = [xmin, ymin, w, h]
-                coco_res = {
-                    'image_id': im_id,
-                    'category_id': catid,
-                    'bbox': bbox,
-                    'score': score
-                }
-                xywh_res.append(coco_res)
-                k += 1
+        # convert all detections of a batch at once, in float64 to keep
+        # the same values as converting them one by one in python
+        num = int(np.sum(lengths))
+        dts = np.array(bboxes[:num], dtype=np.float64)
+        image_ids = np.repeat(im_ids[:len(lengths), 0], lengths)
+        catids = [clsid2catid[c] for c in dts[:, 0].astype(np.int64).tolist()]
+        xywh = dts[:, 2:6]
+        xywh[:, 2:4] = xywh[:, 2:4] - xywh[:, 0:2] + 1
+        xywh_res.extend([{
+            'image_id': im_id,
+            'category_id': catid,
+            'bbox': bbox,
+            'score': score
+        } for im_id, catid, bbox, score in zip(
+            image_ids.astype(np.int64).tolist(), catids,
+            xywh.tolist(), dts[:, 1].tolist())])
     return xywh_res
 
 
-def mask2out(results, clsid2catid, resolution, thresh_binarize=0.5):
-    scale = (resolution + 2.0) / resolution
-
+def _crop_to_rle(crop, x0, y0, im_h, im_w):
+    """
+    Get the uncompressed RLE of an im_h x im_w mask, which is all zero
+    except 'crop' at (x0, y0), without pasting 'crop' to a full mask.
+    """
+    crop_h, crop_w = crop.shape
+    if crop_h == 0 or crop_w == 0 or not crop.any():
+        return [im_h * im_w]
+
+    # zero rows are padded to stand for the area out of the crop in
+    # each column, and a zero column is padded to end the last run,
+    # then runs are counted in column-major order
+    top = int(y0 > 0)
+    bottom = int(y0 + crop_h < im_h)
+    padded = np.zeros((top + crop_h + bottom, crop_w + 1), dtype=np.uint8)
+    padded[top:top + crop_h, :crop_w] = crop
+    flat = padded.ravel(order='F')
+    changes = np.flatnonzero(np.diff(flat, prepend=np.uint8(0)))
+
+    # map changes to positions in the full mask, the padded rows
+    # can only be entered from 1 to 0, which starts at row 0 and
+    # 'y0 + crop_h' of the full mask respectively
+    cols, rows = np.divmod(changes, padded.shape[0])
+    full_rows = rows - top + y0
+    if top:
+        full_rows[rows == 0] = 0
+    if bottom:
+        full_rows[rows == padded.shape[0] - 1] = y0 + crop_h
+    positions = (cols + x0) * im_h + full_rows
+    positions = positions[positions < im_h * im_w]
+    bounds = np.concatenate([[0], positions, [im_h * im_w]])
+    return np.diff(bounds).tolist()
+
+
+def _masks_to_segms(args):
+    """
+    Paste and RLE-encode masks of one image, which can be run by a
+    process pool.
+    """
+    im_id, im_h, im_w, boxes, masks, catids, scores, thresh_binarize = args
+    resolution = masks.shape[-1]
+    padded_mask = np.zeros(
+        (resolution + 2, resolution + 2), dtype=np.float32)
     segm_res = []
+    for j in range(len(boxes)):
+        xmin, ymin, xmax, ymax = boxes[j].tolist()
+        padded_mask[1:-1, 1:-1] = masks[j]
+
+        w = max(xmax - xmin + 1, 1)
+        h = max(ymax - ymin + 1, 1)
+
+        # only the part of resized mask in image is binarized and encoded
+        x0 = max(xmin, 0)
+        x1 = min(xmax + 1, im_w)
+        y0 = max(ymin, 0)
+        y1 = min(ymax + 1, im_h)
+        resized_mask = cv2.resize(padded_mask, (w, h))
+        crop = resized_mask[(y0 - ymin):(y1 - ymin), (x0 - xmin):(x1 - xmin)]
+        crop = (crop > thresh_binarize).astype(np.uint8)
+
+        counts = _crop_to_rle(crop, x0, y0, im_h, im_w)
+        segm = mask_util.frPyObjects({
+            'counts': counts,
+            'size': [im_h, im_w]
+        }, im_h, im_w)
+        segm['counts'] = segm['counts'].decode('utf8')
+        segm_res.append({
+            'image_id': im_id,
+            'category_id': catids[j],
+            'segmentation': segm,
+            'score': scores[j]
+        })
+    return segm_res
 
+
+def _mask_jobs(results, clsid2catid, resolution, thresh_binarize):
+    """
+    Collect the arguments of '_masks_to_segms' for every image in results.
+    """
+    scale = (resolution + 2.0) / resolution
+
+    jobs = []
     # for each batch
     for t in results:
         bboxes = t['bbox'][0]
@@ -128,65 +368,56 @@ def mask2out(results, clsid2catid, resolution, thresh_binarize=0.5):
             continue
 
         masks = t['mask'][0]
-        im_shape = t['im_shape'][0][0]
+        im_shapes = t['im_shape'][0]
 
         s = 0
         # for each sample
         for i in range(len(lengths)):
             num = lengths[i]
             im_id = int(im_ids[i][0])
+            im_h = int(im_shapes[i][0])
+            im_w = int(im_shapes[i][1])
 
             bbox = bboxes[s:s + num][:, 2:]
-            clsid_scores = bboxes[s:s + num][:, 0:2]
-            mask = masks[s:s + num]
+            clsids = bboxes[s:s + num][:, 0].astype(np.int32)
+            scores = bboxes[s:s + num][:, 1].tolist()
+            # only the mask of predicted class is needed
+            mask = masks[s:s + num][np.arange(num), clsids]
             s += num
 
-            im_h = int(im_shape[0])
-            im_w = int(im_shape[1])
-
-            expand_bbox = expand_boxes(bbox, scale)
-            expand_bbox = expand_bbox.astype(np.int32)
-
-            padded_mask = np.zeros(
-                (resolution + 2, resolution + 2), dtype=np.float32)
-
-            for j in range(num):
-                xmin, ymin, xmax, ymax = expand_bbox[j].tolist()
-                clsid, score = clsid_scores[j].tolist()
-                clsid = int(clsid)
-                padded_mask[1:-1, 1:-1] = mask[j, clsid, :, :]
-
-                catid = clsid2catid[clsid]
-
-                w = xmax - xmin + 1
-                h = ymax - ymin + 1
-                w = np.maximum(w, 1)
-                h = np.maximum(h, 1)
-
-                resized_mask = cv2.resize(padded_mask, (w, h))
-                resized_mask = np.array(
-                    resized_mask > thresh_binarize, dtype=np.uint8)
-                im_mask = np.zeros((im_h, im_w), dtype=np.uint8)
-
-                x0 = max(xmin, 0)
-                x1 = min(xmax + 1, im_w)
-                y0 = max(ymin, 0)
-                y1 = min(ymax + 1, im_h)
-
-                im_mask[y0:y1, x0:x1] = resized_mask[(y0 - ymin):(y1 - ymin), (
-                    x0 - xmin):(x1 - xmin)]
-                segm = mask_util.encode(
-                    np.array(
-                        im_mask[:, :, np.newaxis], order='F'))[0]
-                catid = clsid2catid[clsid]
-                segm['counts'] = segm['counts'].decode('utf8')
-                coco_res = {
-                    'image_id': im_id,
-                    'category_id': catid,
-                    'segmentation': segm,
-                    'score': score
-                }
-                segm_res.append(coco_res)
+            expand_bbox = expand_boxes(bbox, scale).astype(np.int32)
+            catids = [clsid2catid[c] for c in clsids.tolist()]
+            jobs.append((im_id, im_h, im_w, expand_bbox, mask, catids, scores,
+                         thresh_binarize))
+    return jobs
+
+
+def mask2out(results,
+             clsid2catid,
+             resolution,
+             thresh_binarize=0.5,
+             num_workers=0):
+    """
+    Convert mask results to COCO format.
+
+    Args:
+        num_workers (int): number of processes to paste and encode masks,
+            0 for encoding in current process
+    """
+    jobs = _mask_jobs(results, clsid2catid, resolution, thresh_binarize)
+    if num_workers > 0 and len(jobs) > 1:
+        pool = mp.Pool(num_workers)
+        try:
+            segms = pool.map(_masks_to_segms, jobs, chunksize=16)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        segms = [_masks_to_segms(job) for job in jobs]
+
+    segm_res = []
+    for segm in segms:
+        segm_res.extend(segm)
     return segm_res
 
 
@@ -21,7 +21,9 @@ import numpy as np
 
 import paddle.fluid as fluid
 
-__all__ = ['parse_fetches', 'eval_run', 'eval_results']
+__all__ = [
+    'parse_fetches', 'create_result_writer', 'eval_run', 'eval_results'
+]
 
 logger = logging.getLogger(__name__)
 
@@ -54,9 +56,41 @@ def parse_fetches(fetches, prog=None, extra_keys=None):
     return keys, values, cls
 
 
-def eval_run(exe, compile_program, pyreader, keys, values, cls):
+def _coco_outfiles(args):
+    outfiles = {'bbox': 'bbox.json', 'mask': 'mask.json'}
+    if args.savefile:
+        outfiles = {k: '{}_{}'.format(args.savefile, v)
+                    for k, v in outfiles.items()}
+    return outfiles
+
+
+def create_result_writer(feed, args, cfg):
+    """
+    Create a writer to convert and save results while running evaluation
+    program, return None if the metric doesn't support it.
+    """
+    if cfg['metric'] != 'COCO':
+        return None
+    from ppdet.utils.coco_eval import COCOResultWriter, get_category_info
+    anno_file = getattr(feed.dataset, 'annotation', None)
+    with_background = getattr(feed, 'with_background', True)
+    clsid2catid, _ = get_category_info(anno_file, with_background)
+    resolution = None
+    if 'MaskHead' in cfg:
+        resolution = cfg['MaskHead']['resolution']
+    return COCOResultWriter(
+        _coco_outfiles(args),
+        clsid2catid,
+        resolution,
+        num_workers=args.eval_workers)
+
+
+def eval_run(exe, compile_program, pyreader, keys, values, cls, writer=None):
     """
     Run evaluation program, return program outputs.
+
+    If 'writer' is set, outputs of every batch are passed to it instead
+    of being kept in the returned list.
     """
     iter_id = 0
     results = []
@@ -77,7 +111,10 @@ def eval_run(exe, compile_program, pyreader, keys, values, cls):
                 k: (np.array(v), v.recursive_sequence_lengths())
                 for k, v in zip(keys, outs)
             }
-            results.append(res)
+            if writer is not None:
+                writer.add(res)
+            else:
+                results.append(res)
             if iter_id % 100 == 0:
                 logger.info('Test iter {}'.format(iter_id))
             iter_id += 1
@@ -88,23 +125,31 @@ def eval_run(exe, compile_program, pyreader, keys, values, cls):
     return results
 
 
-def eval_results(results, feed, args, cfg):
+def eval_results(results, feed, args, cfg, writer=None):
     """Evaluation for evaluation program results"""
     metric = cfg['metric']
     if metric == 'COCO':
         from ppdet.utils.coco_eval import bbox_eval, mask_eval
         anno_file = getattr(feed.dataset, 'annotation', None)
         with_background = getattr(feed, 'with_background', True)
-        savefile = 'bbox.json'
-        if args.savefile:
-            savefile = '{}_bbox.json'.format(args.savefile)
-        bbox_eval(results, anno_file, savefile, with_background)
+        outfiles = _coco_outfiles(args)
+        if writer is not None:
+            # results are already saved by writer
+            counts = writer.close()
+            bbox_eval(None, anno_file, outfiles['bbox'], with_background)
+            if 'mask' in counts:
+                mask_eval(None, anno_file, outfiles['mask'],
+                          cfg['MaskHead']['resolution'])
+            return
+
+        bbox_eval(results, anno_file, outfiles['bbox'], with_background)
         if 'mask' in results[0]:
-            savefile = 'mask.json'
-            if args.savefile:
-                savefile = '{}_mask.json'.format(args.savefile)
-            mask_eval(results, anno_file, savefile,
-                      cfg['MaskHead']['resolution'])
+            mask_eval(
+                results,
+                anno_file,
+                outfiles['mask'],
+                cfg['MaskHead']['resolution'],
+                num_workers=args.eval_workers)
     else:
         res = np.mean(results[-1]['accum_map'][0])
         logger.info('Test mAP: {}'.format(res))
@@ -0,0 +1,175 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# function:
+#   benchmark converting detection results to COCO format, comparing
+#   'bbox2out'/'mask2out' with the per-detection conversion which pastes
+#   every mask to a full image before encoding, on synthetic results
+#   like those of Mask R-CNN on COCO val, eg:
+#     python tools/benchmark_coco_eval.py --images 500 --workers 0 4 8
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+import cv2
+import numpy as np
+import pycocotools.mask as mask_util
+
+from ppdet.utils.coco_eval import bbox2out, mask2out, expand_boxes
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark COCO result conversion')
+    parser.add_argument(
+        '--images', type=int, default=500, help='number of images')
+    parser.add_argument(
+        '--dets', type=int, default=100, help='detections per image')
+    parser.add_argument(
+        '--classes', type=int, default=81, help='number of classes')
+    parser.add_argument(
+        '--resolution', type=int, default=28, help='resolution of masks')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        default=[0, 4, 8],
+        help='numbers of processes for mask2out to test')
+    return parser.parse_args()
+
+
+def make_results(args, seed=0):
+    """ make fake results with one image in each batch
+    """
+    rng = np.random.RandomState(seed)
+    # masks are shared by all images to save memory
+    mask = rng.rand(args.dets, args.classes, args.resolution,
+                    args.resolution).astype('float32')
+    results = []
+    for i in range(args.images):
+        im_h, im_w = rng.randint(400, 641), rng.randint(400, 641)
+        xy = rng.rand(args.dets, 2) * [im_w - 2, im_h - 2]
+        wh = rng.rand(args.dets, 2) * [im_w, im_h] / 2 + 1
+        xy2 = np.minimum(xy + wh, [im_w - 1, im_h - 1])
+        clsid = rng.randint(1, args.classes, (args.dets, 1))
+        score = rng.rand(args.dets, 1)
+        bbox = np.hstack([clsid, score, xy, xy2]).astype('float32')
+        results.append({
+            'bbox': (bbox, [[args.dets]]),
+            'im_id': (np.array([[i]]), []),
+            'im_shape': (np.array([[im_h, im_w, 1.]]), []),
+            'mask': (mask, []),
+        })
+    return results
+
+
+def bbox2out_loop(results, clsid2catid):
+    """ convert boxes one by one
+    """
+    xywh_res = []
+    for t in results:
+        bboxes = t['bbox'][0]
+        im_id = int(t['im_id'][0][0][0])
+        for dt in bboxes:
+            clsid, score, xmin, ymin, xmax, ymax = dt.tolist()
+            xywh_res.append({
+                'image_id': im_id,
+                'category_id': clsid2catid[clsid],
+                'bbox': [xmin, ymin, xmax - xmin + 1, ymax - ymin + 1],
+                'score': score
+            })
+    return xywh_res
+
+
+def mask2out_full(results, clsid2catid, resolution, thresh_binarize=0.5):
+    """ paste every mask to a full image and encode it
+    """
+    scale = (resolution + 2.0) / resolution
+    padded_mask = np.zeros((resolution + 2, resolution + 2), dtype=np.float32)
+    segm_res = []
+    for t in results:
+        bboxes = t['bbox'][0]
+        masks = t['mask'][0]
+        im_id = int(t['im_id'][0][0][0])
+        im_h, im_w = [int(s) for s in t['im_shape'][0][0][:2]]
+        expand_bbox = expand_boxes(bboxes[:, 2:], scale).astype(np.int32)
+        for j in range(len(bboxes)):
+            xmin, ymin, xmax, ymax = expand_bbox[j].tolist()
+            clsid, score = int(bboxes[j, 0]), float(bboxes[j, 1])
+            padded_mask[1:-1, 1:-1] = masks[j, clsid]
+            w = max(xmax - xmin + 1, 1)
+            h = max(ymax - ymin + 1, 1)
+            resized = cv2.resize(padded_mask, (w, h)) > thresh_binarize
+            im_mask = np.zeros((im_h, im_w), dtype=np.uint8)
+            x0, x1 = max(xmin, 0), min(xmax + 1, im_w)
+            y0, y1 = max(ymin, 0), min(ymax + 1, im_h)
+            im_mask[y0:y1, x0:x1] = resized[(y0 - ymin):(y1 - ymin), (
+                x0 - xmin):(x1 - xmin)]
+            segm = mask_util.encode(
+                np.array(
+                    im_mask[:, :, np.newaxis], order='F'))[0]
+            segm['counts'] = segm['counts'].decode('utf8')
+            segm_res.append({
+                'image_id': im_id,
+                'category_id': clsid2catid[clsid],
+                'segmentation': segm,
+                'score': score
+            })
+    return segm_res
+
+
+def timeit(func, *args, **kwargs):
+    st = time.time()
+    out = func(*args, **kwargs)
+    return time.time() - st, out
+
+
+def main():
+    args = parse_args()
+    results = make_results(args)
+    clsid2catid = {i: i for i in range(args.classes)}
+    dets = args.images * args.dets
+
+    print('%-24s %-10s %-12s %-10s' % ('method', 'time(s)', 'dets/s',
+                                       'speedup'))
+
+    def report(name, cost, base):
+        print('%-24s %-10.3f %-12.1f %-10.2f' %
+              (name, cost, dets / cost, base / cost))
+
+    base, expected = timeit(bbox2out_loop, results, clsid2catid)
+    report('bbox2out(loop)', base, base)
+    cost, out = timeit(bbox2out, results, clsid2catid)
+    assert out == expected, 'results of bbox2out mismatch'
+    report('bbox2out', cost, base)
+
+    base, expected = timeit(mask2out_full, results, clsid2catid,
+                            args.resolution)
+    report('mask2out(full mask)', base, base)
+    for workers in args.workers:
+        cost, out = timeit(
+            mask2out,
+            results,
+            clsid2catid,
+            args.resolution,
+            num_workers=workers)
+        assert out == expected, 'results of mask2out mismatch'
+        report('mask2out(workers=%d)' % workers, cost, base)
+
+
+if __name__ == '__main__':
+    main()
@@ -21,7 +21,8 @@ import multiprocessing
 
 import paddle.fluid as fluid
 
-from ppdet.utils.eval_utils import parse_fetches, eval_run, eval_results
+from ppdet.utils.eval_utils import (parse_fetches, eval_run, eval_results,
+                                    create_result_writer)
 import ppdet.utils.checkpoint as checkpoint
 from ppdet.utils.cli import parse_args
 from ppdet.modeling.model_input import create_feeds
@@ -101,9 +102,11 @@ def main():
     keys, values, cls = parse_fetches(fetches, eval_prog, extra_keys)
 
     # 6. Run
-    results = eval_run(exe, compile_program, pyreader, keys, values, cls)
+    writer = create_result_writer(eval_feed, args, cfg)
+    results = eval_run(exe, compile_program, pyreader, keys, values, cls,
+                       writer)
     # Evaluation
-    eval_results(results, eval_feed, args, cfg)
+    eval_results(results, eval_feed, args, cfg, writer)
 
 
 if __name__ == '__main__':
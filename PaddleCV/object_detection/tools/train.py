@@ -27,7 +27,8 @@ from paddle import fluid
 from ppdet.core.workspace import load_config, merge_config, create
 from ppdet.data.data_feed import create_reader
 
-from ppdet.utils.eval_utils import parse_fetches, eval_run, eval_results
+from ppdet.utils.eval_utils import (parse_fetches, eval_run, eval_results,
+                                    create_result_writer)
 from ppdet.utils.stats import TrainingStats
 from ppdet.utils.cli import parse_args
 import ppdet.utils.checkpoint as checkpoint
@@ -155,10 +156,11 @@ def main():
 
             if args.eval:
                 # Run evaluation
+                writer = create_result_writer(eval_feed, args, cfg)
                 results = eval_run(exe, eval_compile_program, eval_pyreader,
-                                   eval_keys, eval_values, eval_cls)
+                                   eval_keys, eval_values, eval_cls, writer)
                 # Evaluation
-                eval_results(results, eval_feed, args, cfg)
+                eval_results(results, eval_feed, args, cfg, writer)
 
     checkpoint.save(exe, train_prog, os.path.join(save_dir, "model_final"))
     train_pyreader.reset()
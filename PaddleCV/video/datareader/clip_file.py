@@ -0,0 +1,92 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Indexed clip file, which stores the encoded frames of a video with their
+offsets, so that a reader reads only the bytes of the sampled frames instead
+of unpickling all frames of the video.
+
+Layout of a clip file, in little endian:
+    magic 'CLIP', version (uint32), frame number N (uint32), label (int64),
+    length of vid (uint32), vid (utf-8),
+    N + 1 offsets of frames relative to the frame data (uint64),
+    frame data
+"""
+
+import mmap
+import struct
+import numpy as np
+
+MAGIC = b'CLIP'
+VERSION = 1
+_HEADER = struct.Struct('<4sIIqI')
+
+
+def write_clip(path, vid, label, frames):
+    """ write encoded 'frames' of video 'vid' to a clip file """
+    if not isinstance(vid, bytes):
+        vid = vid.encode('utf-8')
+    offsets = np.zeros(len(frames) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(frame) for frame in frames])
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(frames), label, len(vid)))
+        f.write(vid)
+        f.write(offsets.tobytes())
+        for frame in frames:
+            f.write(frame)
+
+
+class ClipFile(object):
+    """
+    Read frames of a clip file by memory mapping it, eg:
+
+        with ClipFile(path) as clip:
+            frames = [clip[i] for i in indices]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num, label, vid_len = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not a clip file of version {}'.format(
+                path, VERSION))
+        pos = _HEADER.size
+        self.vid = self._mm[pos:pos + vid_len].decode('utf-8')
+        self.label = label
+        pos += vid_len
+        self._offsets = np.frombuffer(
+            self._mm[pos:pos + (num + 1) * 8], dtype='<u8').astype('int64')
+        self._data = pos + (num + 1) * 8
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        """ bytes of the idx-th encoded frame """
+        start = self._data + self._offsets[idx]
+        end = self._data + self._offsets[idx + 1]
+        return self._mm[start:end]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -14,6 +14,7 @@
 
 import sys
 from .reader_utils import DataReader
+from .feature_store import FeatureStore
 try:
     import cPickle as pickle
     from cStringIO import StringIO
@@ -34,6 +35,8 @@ class FeatureReader(DataReader):
     dataset cfg: num_classes
                  batch_size
                  list
+                 format: pkl (default) or store, the list of store is a
+                         list of prefixes of feature stores
                  NextVlad only: eigen_file
     """
 
@@ -47,10 +50,13 @@ class FeatureReader(DataReader):
         self.filelist = cfg[mode.upper()]['filelist']
         self.eigen_file = cfg.MODEL.get('eigen_file', None)
         self.seg_num = cfg.MODEL.get('seg_num', None)
+        self.format = cfg.MODEL.get('format', 'pkl')
 
     def create_reader(self):
         fl = open(self.filelist).readlines()
         fl = [line.strip() for line in fl if line.strip() != '']
+        if self.format == 'store':
+            return self._store_reader(fl)
         if self.mode == 'train':
             random.shuffle(fl)
 
@@ -102,6 +108,87 @@ class FeatureReader(DataReader):
 
         return reader
 
+    def _store_reader(self, prefixes):
+        stores = [FeatureStore(prefix) for prefix in prefixes]
+        # store and record index of all records
+        store_ids = np.concatenate(
+            [np.full(len(s), i, dtype='int32') for i, s in enumerate(stores)])
+        record_ids = np.concatenate(
+            [np.arange(len(s), dtype='int64') for s in stores])
+
+        def reader():
+            order = np.arange(len(record_ids))
+            if self.mode == 'train':
+                # shuffle records across stores every epoch
+                np.random.shuffle(order)
+            batch = []
+            for k in order:
+                store = stores[store_ids[k]]
+                idx = record_ids[k]
+                rgb, audio = store.features(idx)
+                if self.name == 'ATTENTIONCLUSTER':
+                    sample_inds = generate_random_idx(rgb.shape[0],
+                                                      self.seg_num)
+                    rgb = rgb[sample_inds]
+                    audio = audio[sample_inds]
+                if self.mode != 'infer':
+                    batch.append((rgb, audio, store.label(idx)))
+                else:
+                    batch.append((rgb, audio, store.video(idx)))
+                if len(batch) == self.batch_size:
+                    yield self._make_batch(batch)
+                    batch = []
+
+        return reader
+
+    def _make_batch(self, batch):
+        """
+        convert a batch of uint8 features to float32, the features are
+        dequantized in one pass for the whole batch
+        """
+        rgbs = [sample[0] for sample in batch]
+        audios = [sample[1] for sample in batch]
+        if self.name != 'NEXTVLAD':
+            rgbs = dequantize_batch(
+                rgbs, max_quantized_value=2., min_quantized_value=-2.)
+            audios = dequantize_batch(
+                audios, max_quantized_value=2., min_quantized_value=-2.)
+        else:
+            rgbs = [rgb.astype('float32') for rgb in rgbs]
+            audios = [audio.astype('float32') for audio in audios]
+
+        if self.mode != 'infer':
+            one_hot_labels = np.zeros(
+                (len(batch), self.num_classes), dtype='float32')
+            for i, sample in enumerate(batch):
+                one_hot_labels[i, sample[2]] = 1
+            targets = list(one_hot_labels)
+        else:
+            targets = [sample[2] for sample in batch]
+
+        return list(zip(rgbs, audios, targets))
+
+
+def dequantize_batch(feat_vectors,
+                     max_quantized_value=2.,
+                     min_quantized_value=-2.):
+    """
+    Dequantize a list of features from the byte format to float32, in one
+    vectorized pass over all of them
+    """
+
+    assert max_quantized_value > min_quantized_value
+    quantized_range = max_quantized_value - min_quantized_value
+    scalar = quantized_range / 255.0
+    bias = (quantized_range / 512.0) + min_quantized_value
+
+    sections = np.cumsum([len(feat) for feat in feat_vectors])[:-1]
+    feats = np.concatenate(feat_vectors)
+    out = np.empty(feats.shape, dtype='float32')
+    np.multiply(feats, np.float32(scalar), out=out)
+    out += np.float32(bias)
+    return np.split(out, sections)
+
 
 def dequantize(feat_vector, max_quantized_value=2., min_quantized_value=-2.):
     """
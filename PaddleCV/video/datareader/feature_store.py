@@ -0,0 +1,143 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Feature store of youtube-8M, which keeps the quantized uint8 frame features
+of all videos in one memory mapped file, so that records are read one by one
+in any order instead of loading whole pickle files.
+
+A store with prefix P consists of:
+    P.feat      the records, every record is nframes rows of rgb features
+                followed by nframes rows of audio features, in uint8
+    P.meta.npz  offsets: byte offsets of the N records and the end, int64
+                nframes: frame number of records, int32
+                label_offsets: offsets of the labels of records, int64
+                labels: labels of all records, int32
+                videos: ids of videos
+                dims: dims of rgb and audio features
+"""
+
+import os
+import numpy as np
+
+RGB_DIM = 1024
+AUDIO_DIM = 128
+
+
+class FeatureStoreWriter(object):
+    """
+    Append records to a feature store, eg:
+
+        with FeatureStoreWriter(prefix) as writer:
+            for record in records:
+                writer.write(record['video'], record['feature'],
+                             record['audio'], record['label'],
+                             record['nframes'])
+    """
+
+    def __init__(self, prefix, dims=(RGB_DIM, AUDIO_DIM)):
+        self.prefix = prefix
+        self.dims = dims
+        self._feat = open(prefix + '.feat', 'wb')
+        self._offsets = [0]
+        self._nframes = []
+        self._label_offsets = [0]
+        self._labels = []
+        self._videos = []
+
+    def write(self, video, rgb, audio, label, nframes):
+        rgb = np.ascontiguousarray(rgb[:nframes], dtype='uint8')
+        audio = np.ascontiguousarray(audio[:nframes], dtype='uint8')
+        assert rgb.shape == (nframes, self.dims[0]) and \
+            audio.shape == (nframes, self.dims[1]), \
+            "features of video {} are not of {} frames".format(video, nframes)
+        self._feat.write(rgb.tobytes())
+        self._feat.write(audio.tobytes())
+        self._offsets.append(self._offsets[-1] + rgb.nbytes + audio.nbytes)
+        self._nframes.append(nframes)
+        self._labels.extend(label)
+        self._label_offsets.append(len(self._labels))
+        self._videos.append(video)
+
+    def close(self):
+        if self._feat is None:
+            return
+        self._feat.close()
+        self._feat = None
+        with open(self.prefix + '.meta.npz', 'wb') as f:
+            np.savez(
+                f,
+                offsets=np.array(self._offsets, dtype='int64'),
+                nframes=np.array(self._nframes, dtype='int32'),
+                label_offsets=np.array(self._label_offsets, dtype='int64'),
+                labels=np.array(self._labels, dtype='int32'),
+                videos=np.array(self._videos, dtype='S'),
+                dims=np.array(self.dims, dtype='int64'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FeatureStore(object):
+    """
+    Read records of a feature store, the feature file is memory mapped on
+    the first read of every process.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with np.load(prefix + '.meta.npz') as meta:
+            self.offsets = meta['offsets']
+            self.nframes = meta['nframes']
+            self.label_offsets = meta['label_offsets']
+            self.labels = meta['labels']
+            self.videos = meta['videos']
+            self.dims = [int(d) for d in meta['dims']]
+        self._data = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self.nframes)
+
+    def _mmap(self):
+        if self._pid != os.getpid():
+            # an empty file can not be memory mapped
+            if self.offsets[-1] > 0:
+                self._data = np.memmap(
+                    self.prefix + '.feat', dtype='uint8', mode='r')
+            else:
+                self._data = np.zeros(0, dtype='uint8')
+            self._pid = os.getpid()
+        return self._data
+
+    def features(self, idx):
+        """ uint8 rgb and audio features of record idx, in shape
+            [nframes, dim], which are views of the memory mapped file
+        """
+        data = self._mmap()
+        n = int(self.nframes[idx])
+        start = int(self.offsets[idx])
+        mid = start + n * self.dims[0]
+        rgb = data[start:mid].reshape((n, self.dims[0]))
+        audio = data[mid:mid + n * self.dims[1]].reshape((n, self.dims[1]))
+        return rgb, audio
+
+    def label(self, idx):
+        return self.labels[self.label_offsets[idx]:self.label_offsets[idx +
+                                                                      1]]
+
+    def video(self, idx):
+        return self.videos[idx]
@@ -16,8 +16,12 @@ import os
 import sys
 import cv2
 import math
+import bisect
 import random
+import threading
 import functools
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 try:
     import cPickle as pickle
     from cStringIO import StringIO
@@ -30,16 +34,26 @@ from PIL import Image, ImageEnhance
 import logging
 
 from .reader_utils import DataReader
+from .clip_file import ClipFile
 
 logger = logging.getLogger(__name__)
 python_ver = sys.version_info
 
+# about the number of videos in kinetics-400 train set, every cached video
+# takes a few hundred bytes
+KEYFRAME_CACHE_SIZE = 250000
+# OpenCV seeks to the keyframe before this many frames ahead of the target,
+# and decodes the frames from there
+SEEK_PREROLL = 16
+
 
 class KineticsReader(DataReader):
     """
-    Data reader for kinetics dataset of two format mp4 and pkl.
+    Data reader for kinetics dataset of three format mp4, pkl and clip.
     1. mp4, the original format of kinetics400
     2. pkl, the mp4 was decoded previously and stored as pkl
+    3. clip, the frames in pkl are stored with their offsets, so that only
+       the sampled frames are read and decoded
     In both case, load the data, and then get the frame data in the form of numpy and label as an integer.
      dataset cfg: format
                   num_classes
@@ -52,6 +66,8 @@ class KineticsReader(DataReader):
                   image_std
                   batch_size
                   list
+                  keyframe_cache_size
+                  decode_threads
     """
 
     def __init__(self, name, mode, cfg):
@@ -67,6 +83,13 @@ class KineticsReader(DataReader):
         self.num_reader_threads = self.get_config_from_sec(mode, 'num_reader_threads')
         self.buf_size = self.get_config_from_sec(mode, 'buf_size')
         self.enable_ce = self.get_config_from_sec(mode, 'enable_ce')
+        # threads to decode frames of a clip, 0 to decode in reader threads
+        self.decode_threads = self.get_config_from_sec(mode, 'decode_threads',
+                                                       0)
+        # frame counts and keyframes of mp4 videos, kept over epochs
+        self.keyframe_cache = KeyframeIndexCache(
+            self.get_config_from_sec(mode, 'keyframe_cache_size',
+                                     KEYFRAME_CACHE_SIZE))
 
         self.img_mean = np.array(cfg.MODEL.image_mean).reshape(
             [3, 1, 1]).astype(np.float32)
@@ -120,7 +143,8 @@ class KineticsReader(DataReader):
             # when infer, we store vid as label
             label = int(sample[1])
             try:
-                imgs = mp4_loader(mp4_path, seg_num, seglen, mode)
+                imgs = sparse_mp4_loader(mp4_path, seg_num, seglen, mode,
+                                         self.keyframe_cache)
                 if len(imgs) < 1:
                     logger.error('{} frame length {} less than 1.'.format(mp4_path,
                                                                           len(imgs)))
@@ -161,6 +185,52 @@ class KineticsReader(DataReader):
                          short_size, target_size, img_mean, img_std)
 
 
+        def decode_clip(sample, mode, seg_num, seglen, short_size, target_size,
+                        img_mean, img_std):
+            clip_path = sample[0]
+            try:
+                vid, label, frames = clip_loader(clip_path, seg_num, seglen,
+                                                 mode, decode_pool)
+                if frames is None:
+                    logger.error('{} frame length {} less than 1.'.format(
+                        clip_path, 0))
+                    return None, None
+            except:
+                logger.info('Error when loading {}'.format(clip_path))
+                return None, None
+
+            if mode == 'train' or mode == 'valid' or mode == 'test':
+                ret_label = label
+            elif mode == 'infer':
+                ret_label = vid
+
+            return stacked_imgs_transform(frames, ret_label, mode, seg_num, seglen, \
+                         short_size, target_size, img_mean, img_std)
+
+
+        def stacked_imgs_transform(frames, label, mode, seg_num, seglen,
+                                   short_size, target_size, img_mean, img_std):
+            # same as imgs_transform, on frames of shape [N, H, W, 3]
+            frames = stacked_group_scale(frames, short_size)
+
+            if mode == 'train':
+                if self.name == "TSM":
+                    frames = stacked_group_multi_scale_crop(frames, short_size)
+                frames = stacked_group_random_crop(frames, target_size)
+                frames = stacked_group_random_flip(frames)
+            else:
+                frames = stacked_group_center_crop(frames, target_size)
+
+            imgs = np.ascontiguousarray(
+                frames.transpose((0, 3, 1, 2)), dtype='float32')
+            imgs *= 1. / 255
+            imgs -= img_mean
+            imgs /= img_std
+            imgs = np.reshape(imgs, (seg_num, seglen * 3, target_size, target_size))
+
+            return imgs, label
+
+
         def imgs_transform(imgs, label, mode, seg_num, seglen, short_size, target_size,
                            img_mean, img_std):
             imgs = group_scale(imgs, short_size)
@@ -196,10 +266,15 @@ class KineticsReader(DataReader):
                     pickle_path = line.strip()
                     yield [pickle_path]
 
+        decode_pool = None
         if format == 'pkl':
             decode_func = decode_pickle
         elif format == 'mp4':
             decode_func = decode_mp4
+        elif format == 'clip':
+            decode_func = decode_clip
+            if self.decode_threads > 0:
+                decode_pool = ThreadPool(self.decode_threads)
         else:
             raise "Not implemented format {}".format(format)
 
@@ -216,6 +291,57 @@ class KineticsReader(DataReader):
         return paddle.reader.xmap_readers(mapper, reader, num_threads, buf_size)
 
 
+def _sample_crop_size(im_size, input_size, scales, max_distort, fix_crop,
+                      more_fix_crop):
+    """ get random crop size and offset """
+    image_w, image_h = im_size[0], im_size[1]
+
+    base_size = min(image_w, image_h)
+    crop_sizes = [int(base_size * x) for x in scales]
+    crop_h = [input_size[1] if abs(x - input_size[1]) < 3 else x for x in crop_sizes]
+    crop_w = [input_size[0] if abs(x - input_size[0]) < 3 else x for x in crop_sizes]
+
+    pairs = []
+    for i, h in enumerate(crop_h):
+        for j, w in enumerate(crop_w):
+            if abs(i - j) <= max_distort:
+                pairs.append((w, h))
+
+    crop_pair = random.choice(pairs)
+    if not fix_crop:
+        w_offset = random.randint(0, image_w - crop_pair[0])
+        h_offset = random.randint(0, image_h - crop_pair[1])
+    else:
+        w_step = (image_w - crop_pair[0]) / 4
+        h_step = (image_h - crop_pair[1]) / 4
+
+        ret = list()
+        ret.append((0, 0))  # upper left
+        if w_step != 0:
+            ret.append((4 * w_step, 0))  # upper right
+        if h_step != 0:
+            ret.append((0, 4 * h_step))  # lower left
+        if h_step != 0 and w_step != 0:
+            ret.append((4 * w_step, 4 * h_step))  # lower right
+        if h_step != 0 or w_step != 0:
+            ret.append((2 * w_step, 2 * h_step))  # center
+
+        if more_fix_crop:
+            ret.append((0, 2 * h_step))  # center left
+            ret.append((4 * w_step, 2 * h_step))  # center right
+            ret.append((2 * w_step, 4 * h_step))  # lower center
+            ret.append((2 * w_step, 0 * h_step))  # upper center
+
+            ret.append((1 * w_step, 1 * h_step))  # upper left quarter
+            ret.append((3 * w_step, 1 * h_step))  # upper right quarter
+            ret.append((1 * w_step, 3 * h_step))  # lower left quarter
+            ret.append((3 * w_step, 3 * h_step))  # lower righ quarter
+
+        w_offset, h_offset = random.choice(ret)
+
+    return crop_pair[0], crop_pair[1], w_offset, h_offset
+
+
 def group_multi_scale_crop(img_group, target_size, scales=None, \
         max_distort=1, fix_crop=True, more_fix_crop=True):
     scales = scales if scales is not None else [1, .875, .75, .66]
@@ -223,56 +349,8 @@ def group_multi_scale_crop(img_group, target_size, scales=None, \
 
     im_size = img_group[0].size
 
-    # get random crop offset
-    def _sample_crop_size(im_size):
-        image_w, image_h = im_size[0], im_size[1]
-
-        base_size = min(image_w, image_h)
-        crop_sizes = [int(base_size * x) for x in scales]
-        crop_h = [input_size[1] if abs(x - input_size[1]) < 3 else x for x in crop_sizes]
-        crop_w = [input_size[0] if abs(x - input_size[0]) < 3 else x for x in crop_sizes]
-
-        pairs = []
-        for i, h in enumerate(crop_h):
-            for j, w in enumerate(crop_w):
-                if abs(i - j) <= max_distort:
-                    pairs.append((w, h))
-
-        crop_pair = random.choice(pairs)
-        if not fix_crop:
-            w_offset = random.randint(0, image_w - crop_pair[0])
-            h_offset = random.randint(0, image_h - crop_pair[1])
-        else:
-            w_step = (image_w - crop_pair[0]) / 4
-            h_step = (image_h - crop_pair[1]) / 4
-
-            ret = list()
-            ret.append((0, 0))  # upper left
-            if w_step != 0:
-                ret.append((4 * w_step, 0))  # upper right
-            if h_step != 0:
-                ret.append((0, 4 * h_step))  # lower left
-            if h_step != 0 and w_step != 0:
-                ret.append((4 * w_step, 4 * h_step))  # lower right
-            if h_step != 0 or w_step != 0:
-                ret.append((2 * w_step, 2 * h_step))  # center
-
-            if more_fix_crop:
-                ret.append((0, 2 * h_step))  # center left
-                ret.append((4 * w_step, 2 * h_step))  # center right
-                ret.append((2 * w_step, 4 * h_step))  # lower center
-                ret.append((2 * w_step, 0 * h_step))  # upper center
-
-                ret.append((1 * w_step, 1 * h_step))  # upper left quarter
-                ret.append((3 * w_step, 1 * h_step))  # upper right quarter
-                ret.append((1 * w_step, 3 * h_step))  # lower left quarter
-                ret.append((3 * w_step, 3 * h_step))  # lower righ quarter
-
-            w_offset, h_offset = random.choice(ret)
-
-        return crop_pair[0], crop_pair[1], w_offset, h_offset
-
-    crop_w, crop_h, offset_w, offset_h = _sample_crop_size(im_size)
+    crop_w, crop_h, offset_w, offset_h = _sample_crop_size(
+        im_size, input_size, scales, max_distort, fix_crop, more_fix_crop)
     crop_img_group = [img.crop((offset_w, offset_h, offset_w + crop_w, offset_h + crop_h)) for img in img_group]
     ret_img_group = [img.resize((input_size[0], input_size[1]), Image.BILINEAR) for img in crop_img_group]
 
@@ -343,6 +421,92 @@ def group_scale(imgs, target_size):
     return resized_imgs
 
 
+def resize_frames(frames, size):
+    """ resize stacked frames of shape [N, H, W, C] to 'size' (w, h) with
+        few cv2.resize calls, by taking frames as channels of an image
+    """
+    n, h, w, c = frames.shape
+    # cv2 supports at most 512 channels
+    step = max(512 // c, 1)
+    out = []
+    for i in range(0, n, step):
+        chunk = frames[i:i + step]
+        m = len(chunk)
+        img = chunk.transpose((1, 2, 0, 3)).reshape((h, w, m * c))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+        out.append(img.reshape((size[1], size[0], m, c)).transpose((2, 0, 1,
+                                                                     3)))
+    return out[0] if len(out) == 1 else np.concatenate(out)
+
+
+def stacked_group_multi_scale_crop(frames, target_size, scales=None, \
+        max_distort=1, fix_crop=True, more_fix_crop=True):
+    """ group_multi_scale_crop for stacked frames of shape [N, H, W, 3] """
+    scales = scales if scales is not None else [1, .875, .75, .66]
+    input_size = [target_size, target_size]
+
+    im_size = (frames.shape[2], frames.shape[1])
+
+    crop_w, crop_h, offset_w, offset_h = _sample_crop_size(
+        im_size, input_size, scales, max_distort, fix_crop, more_fix_crop)
+    # rounded as PIL crop does
+    x1, y1 = int(round(offset_w)), int(round(offset_h))
+    crop = frames[:, y1:y1 + crop_h, x1:x1 + crop_w]
+
+    return resize_frames(crop, (input_size[0], input_size[1]))
+
+
+def stacked_group_random_crop(frames, target_size):
+    """ group_random_crop for stacked frames of shape [N, H, W, 3] """
+    h, w = frames.shape[1:3]
+    th, tw = target_size, target_size
+
+    assert (w >= target_size) and (h >= target_size), \
+          "image width({}) and height({}) should be larger than crop size".format(w, h, target_size)
+
+    x1 = random.randint(0, w - tw)
+    y1 = random.randint(0, h - th)
+
+    return frames[:, y1:y1 + th, x1:x1 + tw]
+
+
+def stacked_group_random_flip(frames):
+    """ group_random_flip for stacked frames of shape [N, H, W, 3] """
+    v = random.random()
+    if v < 0.5:
+        return frames[:, :, ::-1]
+    else:
+        return frames
+
+
+def stacked_group_center_crop(frames, target_size):
+    """ group_center_crop for stacked frames of shape [N, H, W, 3] """
+    h, w = frames.shape[1:3]
+    th, tw = target_size, target_size
+    assert (w >= target_size) and (h >= target_size), \
+         "image width({}) and height({}) should be larger than crop size".format(w, h, target_size)
+    x1 = int(round((w - tw) / 2.))
+    y1 = int(round((h - th) / 2.))
+
+    return frames[:, y1:y1 + th, x1:x1 + tw]
+
+
+def stacked_group_scale(frames, target_size):
+    """ group_scale for stacked frames of shape [N, H, W, 3] """
+    h, w = frames.shape[1:3]
+    if (w <= h and w == target_size) or (h <= w and h == target_size):
+        return frames
+
+    if w < h:
+        ow = target_size
+        oh = int(target_size * 4.0 / 3.0)
+    else:
+        oh = target_size
+        ow = int(target_size * 4.0 / 3.0)
+
+    return resize_frames(frames, (ow, oh))
+
+
 def imageloader(buf):
     if isinstance(buf, str):
         img = Image.open(StringIO(buf))
@@ -353,10 +517,21 @@ def imageloader(buf):
 
 
 def video_loader(frames, nsample, seglen, mode):
-    videolen = len(frames)
-    average_dur = int(videolen / nsample)
-
     imgs = []
+    for idx in sample_indices(len(frames), nsample, seglen, mode, seglen):
+        imgbuf = frames[idx]
+        img = imageloader(imgbuf)
+        imgs.append(img)
+
+    return imgs
+
+
+def sample_indices(videolen, nsample, seglen, mode, center_len=1):
+    """ indices of 'nsample' segments of 'seglen' frames each, segments
+        are centered as if they had 'center_len' frames when not training
+    """
+    average_dur = int(videolen / nsample)
+    indices = []
     for i in range(nsample):
         idx = 0
         if mode == 'train':
@@ -369,7 +544,7 @@ def video_loader(frames, nsample, seglen, mode):
                 idx = i
         else:
             if average_dur >= seglen:
-                idx = (average_dur - seglen) // 2
+                idx = (average_dur - center_len) // 2
                 idx += i * average_dur
             elif average_dur >= 1:
                 idx += i * average_dur
@@ -377,11 +552,9 @@ def video_loader(frames, nsample, seglen, mode):
                 idx = i
 
         for jj in range(idx, idx + seglen):
-            imgbuf = frames[int(jj % videolen)]
-            img = imageloader(imgbuf)
-            imgs.append(img)
+            indices.append(int(jj % videolen))
 
-    return imgs
+    return indices
 
 
 def mp4_loader(filepath, nsample, seglen, mode):
@@ -395,30 +568,166 @@ def mp4_loader(filepath, nsample, seglen, mode):
             continue
         img = frame[:, :, ::-1]
         sampledFrames.append(img)
-    average_dur = int(len(sampledFrames) / nsample)
     imgs = []
-    for i in range(nsample):
-        idx = 0
-        if mode == 'train':
-            if average_dur >= seglen:
-                idx = random.randint(0, average_dur - seglen)
-                idx += i * average_dur
-            elif average_dur >= 1:
-                idx += i * average_dur
-            else:
-                idx = i
-        else:
-            if average_dur >= seglen:
-                idx = (average_dur - 1) // 2
-                idx += i * average_dur
-            elif average_dur >= 1:
-                idx += i * average_dur
-            else:
-                idx = i
-
-        for jj in range(idx, idx + seglen):
-            imgbuf = sampledFrames[int(jj % len(sampledFrames))]
-            img = Image.fromarray(imgbuf, mode='RGB')
-            imgs.append(img)
+    for idx in sample_indices(len(sampledFrames), nsample, seglen, mode):
+        img = Image.fromarray(sampledFrames[idx], mode='RGB')
+        imgs.append(img)
 
     return imgs
+
+
+class KeyframeIndexCache(object):
+    """
+    LRU cache of the frame count and the keyframe indices of videos, so
+    that the packets of a video are scanned only once over epochs.
+    It is shared by the reader threads.
+    """
+
+    def __init__(self, capacity=KEYFRAME_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, filepath):
+        # a changed video file is scanned again
+        stat = os.stat(filepath)
+        return (filepath, stat.st_size, stat.st_mtime)
+
+    def get(self, filepath):
+        """ return (frame count, keyframe indices) of the video, the
+            keyframe indices are None if they are unknown
+        """
+        key = self._key(filepath)
+        with self._lock:
+            index = self._entries.pop(key, None)
+            if index is not None:
+                self._entries[key] = index
+                return index
+        index = scan_keyframes(filepath)
+        self.put(filepath, index, key)
+        return index
+
+    def put(self, filepath, index, key=None):
+        key = self._key(filepath) if key is None else key
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = index
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def scan_keyframes(filepath):
+    """
+    Get the frame count and the keyframe indices of a video by reading its
+    packets without decoding them, the keyframe indices are None if the
+    packets can not be read by this version of OpenCV.
+    """
+    if hasattr(cv2, 'CAP_PROP_LRF_HAS_KEY_FRAME'):
+        cap = cv2.VideoCapture(filepath, cv2.CAP_FFMPEG,
+                               [cv2.CAP_PROP_FORMAT, -1])
+        if cap.isOpened():
+            videolen = 0
+            keyframes = []
+            while cap.grab():
+                if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keyframes.append(videolen)
+                videolen += 1
+            cap.release()
+            if videolen > 0 and keyframes:
+                return videolen, np.array(keyframes, dtype='int32')
+    cap = cv2.VideoCapture(filepath)
+    videolen = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return videolen, None
+
+
+def read_frames(cap, indices, keyframes=None):
+    """
+    Decode the frames at sorted 'indices' of an opened video, return a dict
+    from index to frame, or None if some frame can not be read. Seek to a
+    frame if decoding from its keyframe skips frames after the current
+    position, otherwise grab the frames before it without converting them.
+    """
+    frames = {}
+    pos = 0
+    for idx in indices:
+        if keyframes is not None:
+            k = bisect.bisect_right(keyframes, max(idx - SEEK_PREROLL, 0)) - 1
+            if k >= 0 and keyframes[k] > pos:
+                # seeking decodes less frames than grabbing from pos
+                if not cap.set(cv2.CAP_PROP_POS_FRAMES, idx):
+                    return None
+                pos = idx
+        while pos < idx:
+            if not cap.grab():
+                return None
+            pos += 1
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        pos += 1
+        frames[idx] = frame[:, :, ::-1]
+    return frames
+
+
+def sparse_mp4_loader(filepath, nsample, seglen, mode, index_cache=None):
+    """
+    Sample the same frames as mp4_loader, but decode only the sampled
+    frames instead of keeping all frames of the video. Fall back to
+    mp4_loader if some sampled frame can not be read, eg. the frame count
+    in the header is wrong.
+    """
+    if index_cache is not None:
+        videolen, keyframes = index_cache.get(filepath)
+    else:
+        videolen, keyframes = scan_keyframes(filepath)
+    if videolen < 1:
+        return mp4_loader(filepath, nsample, seglen, mode)
+
+    indices = sample_indices(videolen, nsample, seglen, mode)
+    cap = cv2.VideoCapture(filepath)
+    frames = read_frames(cap, sorted(set(indices)), keyframes)
+    cap.release()
+    if frames is None:
+        logger.info('Failed to seek frames of {}, decode all frames'.format(
+            filepath))
+        imgs = mp4_loader(filepath, nsample, seglen, mode)
+        if index_cache is not None:
+            # frames are sampled from all decoded frames next time
+            index_cache.put(filepath, (0, None))
+        return imgs
+
+    return [Image.fromarray(frames[idx], mode='RGB') for idx in indices]
+
+
+def decode_frame(buf):
+    """ decode an encoded frame to RGB ndarray """
+    img = cv2.imdecode(np.frombuffer(buf, dtype='uint8'), cv2.IMREAD_COLOR)
+    return img[:, :, ::-1]
+
+
+def clip_loader(filepath, nsample, seglen, mode, pool=None):
+    """
+    Sample the same frames as video_loader from a clip file, only the
+    sampled frames are read and decoded, in thread pool 'pool' if it is
+    not None. Return vid, label and the stacked frames of shape
+    [nsample * seglen, H, W, 3].
+    """
+    with ClipFile(filepath) as clip:
+        if len(clip) < 1:
+            return clip.vid, clip.label, None
+        indices = sample_indices(len(clip), nsample, seglen, mode, seglen)
+        uniq = sorted(set(indices))
+        bufs = [clip[idx] for idx in uniq]
+        vid, label = clip.vid, clip.label
+    if pool is not None:
+        decoded = pool.map(decode_frame, bufs)
+    else:
+        decoded = [decode_frame(buf) for buf in bufs]
+    pos = dict(zip(uniq, range(len(uniq))))
+    frames = np.stack([decoded[pos[idx]] for idx in indices])
+
+    return vid, label, frames
@@ -21,6 +21,7 @@ import cv2
 import logging
 
 from .reader_utils import DataReader
+from .kinetics_reader import read_frames
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +40,9 @@ class NonlocalReader(DataReader):
                 sample_rate
                 video_length
                 jitter_scales
+                use_shared_memory
+                num_slots
+                timing_interval
                 Test only cfg: num_test_clips
                                use_multi_crop
     """
@@ -56,6 +60,8 @@ class NonlocalReader(DataReader):
                 "number of reader threads({}) should be a positive integer".format(num_reader_threads)
         if num_reader_threads == 1:
             reader_func = make_reader
+        elif cfg[mode.upper()].get('use_shared_memory', False):
+            reader_func = make_shared_memory_reader
         else:
             reader_func = make_multi_reader
 
@@ -68,6 +74,9 @@ class NonlocalReader(DataReader):
         dataset_args['min_size'] = cfg[mode.upper()]['jitter_scales'][0]
         dataset_args['max_size'] = cfg[mode.upper()]['jitter_scales'][1]
         dataset_args['num_reader_threads'] = num_reader_threads
+        dataset_args['num_slots'] = cfg[mode.upper()].get('num_slots', None)
+        dataset_args['timing_interval'] = cfg[mode.upper()].get(
+            'timing_interval', 0)
         filelist = cfg[mode.upper()]['filelist']
         batch_size = cfg[mode.upper()]['batch_size']
 
@@ -117,6 +126,19 @@ def video_fast_get_frame(video_path,
         frame_gaps = float(frame_cnt) / float(sample_times)
         use_start_frm = int(frame_gaps * start_frm) % frame_cnt
 
+    # only the sampled frames are decoded and converted if the frame count
+    # is right, otherwise decode all frames
+    indices = [(use_start_frm + idx * sampling_rate) % frame_cnt
+               for idx in range(length)] if frame_cnt > 0 else []
+    frames = read_frames(cap, sorted(set(indices))) if indices else None
+    if frames is not None:
+        for idx in range(length):
+            video_output[idx] = frames[indices[idx]]
+        cap.release()
+        return video_output
+
+    cap.release()
+    cap = cv2.VideoCapture(video_path)
     for i in range(frame_cnt):
         ret, frame = cap.read()
         # maybe first frame is empty
@@ -161,7 +183,8 @@ def crop_mirror_transform(rgbdata,
                           cropsize=224,
                           use_mirror=True,
                           center_crop=False,
-                          spatial_pos=-1):
+                          spatial_pos=-1,
+                          out=None):
     channel, length, height, width = rgbdata.shape
     assert height >= cropsize, "crop size should not be larger than video height"
     assert width >= cropsize, "crop size should not be larger than video width"
@@ -178,10 +201,7 @@ def crop_mirror_transform(rgbdata,
     else:
         h_off = np.random.randint(0, height - cropsize)
         w_off = np.random.randint(0, width - cropsize)
-    outdata = np.zeros(
-        (channel, length, cropsize, cropsize), dtype=rgbdata.dtype)
-    outdata[:, :, :, :] = rgbdata[:, :, h_off:h_off + cropsize, w_off:w_off +
-                                  cropsize]
+    outdata = rgbdata[:, :, h_off:h_off + cropsize, w_off:w_off + cropsize]
     # apply mirror
     mirror_indicator = (np.random.rand() > 0.5)
     mirror_me = use_mirror and mirror_indicator
@@ -189,10 +209,100 @@ def crop_mirror_transform(rgbdata,
         mirror_me = (int(spatial_pos / 3) > 0)
     if mirror_me:
         outdata = outdata[:, :, :, ::-1]
-    # substract mean and divide std
-    outdata = outdata.astype(np.float32)
-    outdata = (outdata - mean) / std
-    return outdata
+    # substract mean and divide std, into 'out' if it is given
+    if out is None:
+        out = np.empty((channel, length, cropsize, cropsize), dtype=np.float32)
+    out[...] = outdata
+    out -= np.float32(mean)
+    out /= np.float32(std)
+    return out
+
+
+class StageTimer(object):
+    """
+    Accumulate the time of the reader stages, and log the average time per
+    clip every 'interval' batches and at the end of a pass, 0 to log only at
+    the end.
+    """
+    STAGES = ('decode', 'resize', 'crop_mirror', 'transfer')
+
+    def __init__(self, name, interval=0):
+        self.name = name
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        self.times = dict((stage, 0.) for stage in self.STAGES)
+        self.clips = 0
+        self.batches = 0
+
+    def add(self, times, clips=1):
+        for stage, t in times.items():
+            self.times[stage] += t
+        self.clips += clips
+
+    def add_batch(self):
+        self.batches += 1
+        if self.interval > 0 and self.batches % self.interval == 0:
+            self.log()
+
+    def log(self):
+        if self.clips == 0:
+            return
+        logger.info('{} reader, {} clips, ms per clip: {}'.format(
+            self.name, self.clips, ', '.join('{} {:.2f}'.format(
+                stage, self.times[stage] * 1000. / self.clips)
+                                          for stage in self.STAGES)))
+
+
+def process_clip(line, sample_times, is_training, dataset_args, out=None):
+    """
+    Decode, resize, crop and mirror the clip of a line in filelist, the
+    result is written into 'out' if it is given. Return the clip, label
+    and time of stages, or None if the video can not be loaded.
+    """
+    line_items = line.split(' ')
+    fn = line_items[0]
+    label = int(line_items[1])
+    if len(line_items) > 2:
+        start_frm = int(line_items[2])
+        spatial_pos = int(line_items[3])
+        in_sample_times = sample_times
+    else:
+        start_frm = -1
+        spatial_pos = -1
+        in_sample_times = 1
+    label = np.array([label]).astype(np.int64)
+    times = {}
+    # 1, get rgb data for fixed length of frames
+    start = time.time()
+    try:
+        rgbdata = video_fast_get_frame(fn, \
+                     sampling_rate = dataset_args['sample_rate'], length = dataset_args['video_length'], \
+                     start_frm = start_frm, sample_times = in_sample_times)
+    except:
+        logger.info('Error when loading {}, just skip this file'.format(fn))
+        return None
+    times['decode'] = time.time() - start
+    # add prepocessing
+    # 2, reszie to randomly scale between [min_size, max_size] when training, or cgf.TEST.SCALE when inference
+    start = time.time()
+    min_size = dataset_args['min_size']
+    max_size = dataset_args['max_size']
+    rgbdata = apply_resize(rgbdata, min_size, max_size)
+    # transform [length, height, width, channel] to [channel, length, height, width]
+    rgbdata = np.transpose(rgbdata, [3, 0, 1, 2])
+    times['resize'] = time.time() - start
+
+    # 3 crop, mirror and transform
+    start = time.time()
+    rgbdata = crop_mirror_transform(rgbdata, mean = dataset_args['image_mean'], \
+                     std = dataset_args['image_std'], cropsize = dataset_args['crop_size'], \
+                     use_mirror = is_training, center_crop = (not is_training), \
+                     spatial_pos = spatial_pos, out = out)
+    times['crop_mirror'] = time.time() - start
+
+    return rgbdata, label, times
 
 
 def make_reader(filelist, batch_size, sample_times, is_training, shuffle,
@@ -204,48 +314,22 @@ def make_reader(filelist, batch_size, sample_times, is_training, shuffle,
         if shuffle:
             random.shuffle(fl)
 
+        timer = StageTimer('single process', dataset_args['timing_interval'])
         batch_out = []
         for line in fl:
-            # start_time = time.time()
-            line_items = line.split(' ')
-            fn = line_items[0]
-            label = int(line_items[1])
-            if len(line_items) > 2:
-                start_frm = int(line_items[2])
-                spatial_pos = int(line_items[3])
-                in_sample_times = sample_times
-            else:
-                start_frm = -1
-                spatial_pos = -1
-                in_sample_times = 1
-            label = np.array([label]).astype(np.int64)
-            # 1, get rgb data for fixed length of frames
-            try:
-                rgbdata = video_fast_get_frame(fn, \
-                             sampling_rate = dataset_args['sample_rate'], length = dataset_args['video_length'], \
-                             start_frm = start_frm, sample_times = in_sample_times)
-            except:
-                logger.info('Error when loading {}, just skip this file'.format(
-                    fn))
+            result = process_clip(line, sample_times, is_training,
+                                  dataset_args)
+            if result is None:
                 continue
-            # add prepocessing
-            # 2, reszie to randomly scale between [min_size, max_size] when training, or cgf.TEST.SCALE when inference
-            min_size = dataset_args['min_size']
-            max_size = dataset_args['max_size']
-            rgbdata = apply_resize(rgbdata, min_size, max_size)
-            # transform [length, height, width, channel] to [channel, length, height, width]
-            rgbdata = np.transpose(rgbdata, [3, 0, 1, 2])
-
-            # 3 crop, mirror and transform
-            rgbdata = crop_mirror_transform(rgbdata, mean = dataset_args['image_mean'], \
-                             std = dataset_args['image_std'], cropsize = dataset_args['crop_size'], \
-                             use_mirror = is_training, center_crop = (not is_training), \
-                             spatial_pos = spatial_pos)
+            rgbdata, label, times = result
+            timer.add(times)
 
             batch_out.append((rgbdata, label))
             if len(batch_out) == batch_size:
+                timer.add_batch()
                 yield batch_out
                 batch_out = []
+        timer.log()
 
     return reader
 
@@ -254,46 +338,21 @@ def make_multi_reader(filelist, batch_size, sample_times, is_training, shuffle,
                       **dataset_args):
     def read_into_queue(flq, queue):
         batch_out = []
+        batch_times = {}
         for line in flq:
-            line_items = line.split(' ')
-            fn = line_items[0]
-            label = int(line_items[1])
-            if len(line_items) > 2:
-                start_frm = int(line_items[2])
-                spatial_pos = int(line_items[3])
-                in_sample_times = sample_times
-            else:
-                start_frm = -1
-                spatial_pos = -1
-                in_sample_times = 1
-            label = np.array([label]).astype(np.int64)
-            # 1, get rgb data for fixed length of frames
-            try:
-                rgbdata = video_fast_get_frame(fn, \
-                             sampling_rate = dataset_args['sample_rate'], length = dataset_args['video_length'], \
-                             start_frm = start_frm, sample_times = in_sample_times)
-            except:
-                logger.info('Error when loading {}, just skip this file'.format(
-                    fn))
+            result = process_clip(line, sample_times, is_training,
+                                  dataset_args)
+            if result is None:
                 continue
-            # add prepocessing
-            # 2, reszie to randomly scale between [min_size, max_size] when training, or cgf.TEST.SCALE when inference
-            min_size = dataset_args['min_size']
-            max_size = dataset_args['max_size']
-            rgbdata = apply_resize(rgbdata, min_size, max_size)
-            # transform [length, height, width, channel] to [channel, length, height, width]
-            rgbdata = np.transpose(rgbdata, [3, 0, 1, 2])
-
-            # 3 crop, mirror and transform
-            rgbdata = crop_mirror_transform(rgbdata, mean = dataset_args['image_mean'], \
-                             std = dataset_args['image_std'], cropsize = dataset_args['crop_size'], \
-                             use_mirror = is_training, center_crop = (not is_training), \
-                             spatial_pos = spatial_pos)
+            rgbdata, label, times = result
+            for stage, t in times.items():
+                batch_times[stage] = batch_times.get(stage, 0.) + t
 
             batch_out.append((rgbdata, label))
             if len(batch_out) == batch_size:
-                queue.put(batch_out)
+                queue.put((batch_out, batch_times))
                 batch_out = []
+                batch_times = {}
         queue.put(None)
 
     def queue_reader():
@@ -325,14 +384,147 @@ def make_multi_reader(filelist, batch_size, sample_times, is_training, shuffle,
             p_list[i].start()
         reader_num = len(reader_lists)
         finish_num = 0
+        timer = StageTimer('multi process', dataset_args['timing_interval'])
         while finish_num < reader_num:
+            start = time.time()
             sample = queue.get()
+            # time of waiting for and unpickling a batch
+            timer.add({'transfer': time.time() - start}, 0)
             if sample is None:
                 finish_num += 1
             else:
-                yield sample
+                timer.add(sample[1], len(sample[0]))
+                timer.add_batch()
+                yield sample[0]
+        timer.log()
         for i in range(len(p_list)):
             if p_list[i].is_alive():
                 p_list[i].join()
 
     return queue_reader
+
+
+def make_shared_memory_reader(filelist, batch_size, sample_times, is_training,
+                              shuffle, **dataset_args):
+    """
+    Reader whose worker processes write processed clips directly into a pool
+    of slots in shared memory, so only slot ids go through the queues
+    instead of pickled clips. The clips in a batch are views of the slots,
+    which are valid until the next batch is read, so callers must feed or
+    copy them before that, as the DataFeeder in train.py (through
+    py_reader), test.py and infer.py does, rather than keep references. The
+    labels are copies, which can be kept across batches.
+    """
+    n = dataset_args['num_reader_threads']
+    cropsize = dataset_args['crop_size']
+    clip_shape = (3, dataset_args['video_length'], cropsize, cropsize)
+    # the slots of the batch being consumed, the batch being assembled and
+    # the clips being processed by workers
+    num_slots = dataset_args['num_slots'] or 2 * batch_size + n
+    assert num_slots >= 2 * batch_size, \
+        "num_slots({}) should be at least twice of batch_size({})".format(
+            num_slots, batch_size)
+    clip_size = int(np.prod(clip_shape))
+    clips = multiprocessing.RawArray('f', num_slots * clip_size)
+    labels = multiprocessing.RawArray('q', num_slots)
+
+    def _views():
+        clip_views = np.frombuffer(
+            clips, dtype=np.float32).reshape((num_slots, ) + clip_shape)
+        label_views = np.frombuffer(labels, dtype=np.int64).reshape(
+            (num_slots, 1))
+        return clip_views, label_views
+
+    def read_into_slots(task_queue, free_slots, done_queue):
+        # forked workers share the random state of the parent
+        np.random.seed()
+        random.seed()
+        clip_views, label_views = _views()
+        while True:
+            line = task_queue.get()
+            if line is None:
+                break
+            slot = free_slots.get()
+            try:
+                result = process_clip(
+                    line,
+                    sample_times,
+                    is_training,
+                    dataset_args,
+                    out=clip_views[slot])
+            except Exception as e:
+                logger.info('Error when processing {}: {}, just skip it'.format(
+                    line, e))
+                result = None
+            if result is None:
+                free_slots.put(slot)
+                continue
+            label_views[slot] = result[1]
+            done_queue.put((slot, result[2]))
+        done_queue.put(None)
+
+    def shared_memory_reader():
+        fl = open(filelist).readlines()
+        fl = [line.strip() for line in fl if line.strip() != '']
+
+        if shuffle:
+            random.shuffle(fl)
+
+        task_queue = multiprocessing.Queue()
+        for line in fl:
+            task_queue.put(line)
+        for i in range(n):
+            task_queue.put(None)
+        free_slots = multiprocessing.Queue()
+        for slot in range(num_slots):
+            free_slots.put(slot)
+        done_queue = multiprocessing.Queue()
+
+        p_list = []
+        for i in range(n):
+            p = multiprocessing.Process(
+                target=read_into_slots,
+                args=(task_queue, free_slots, done_queue))
+            p.daemon = True
+            p.start()
+            p_list.append(p)
+
+        clip_views, label_views = _views()
+        timer = StageTimer('shared memory', dataset_args['timing_interval'])
+        finish_num = 0
+        batch_slots = []
+        consumed_slots = []
+        try:
+            while finish_num < n:
+                start = time.time()
+                item = done_queue.get()
+                timer.add({'transfer': time.time() - start}, 0)
+                if item is None:
+                    finish_num += 1
+                    continue
+                slot, times = item
+                timer.add(times)
+                batch_slots.append(slot)
+                if len(batch_slots) == batch_size:
+                    # the last batch has been consumed
+                    for slot in consumed_slots:
+                        free_slots.put(slot)
+                    consumed_slots = batch_slots
+                    batch_slots = []
+                    timer.add_batch()
+                    # labels (video ids in infer mode) are copied since
+                    # callers may keep them after the batch
+                    yield [(clip_views[slot], label_views[slot].copy())
+                           for slot in consumed_slots]
+            timer.log()
+        finally:
+            # do not wait for the queues to be flushed to the terminated
+            # workers
+            task_queue.cancel_join_thread()
+            free_slots.cancel_join_thread()
+            for p in p_list:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+
+    return shared_memory_reader
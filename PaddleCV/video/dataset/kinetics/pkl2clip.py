@@ -0,0 +1,66 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+import os
+import sys
+from multiprocessing import Pool
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../datareader'))
+from clip_file import write_clip
+
+# example command line: python pkl2clip.py train.list $Target_dir train_clip.list 8
+#
+# train.list is the list of pkl files generated by video2pkl.py, every pkl file
+# is converted to a clip file in $Target_dir, which is read by the readers with
+# format "clip", and train_clip.list is the list of clip files
+
+assert (len(sys.argv) == 5)
+
+pkl_list = sys.argv[1]
+target_dir = sys.argv[2]
+clip_list = sys.argv[3]
+num_threads = int(sys.argv[4])
+
+
+def generate_clip(pkl_path):
+    with open(pkl_path, 'rb') as f:
+        if sys.version_info < (3, 0):
+            vid, label, frames = pickle.load(f)
+        else:
+            vid, label, frames = pickle.load(f, encoding='bytes')
+    if isinstance(vid, bytes):
+        vid = vid.decode('utf-8')
+
+    name = os.path.splitext(os.path.basename(pkl_path))[0]
+    output_clip = os.path.join(target_dir, name + '.clip')
+    write_clip(output_clip, vid, label, frames)
+    return output_clip
+
+
+with open(pkl_list) as f:
+    pkl_paths = [line.strip() for line in f if line.strip()]
+
+pool = Pool(processes=num_threads)
+clip_paths = pool.map(generate_clip, pkl_paths)
+pool.close()
+pool.join()
+
+with open(clip_list, 'w') as f:
+    for clip_path in clip_paths:
+        f.write(os.path.abspath(clip_path) + '\n')
@@ -0,0 +1,65 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+import os
+import sys
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../datareader'))
+from feature_store import FeatureStoreWriter
+
+# example command line: python pkl2store.py train.list ./store/train
+#
+# train.list is the list of pkl files generated by tf2pkl.py, all records in
+# them are packed to the feature store with prefix ./store/train, which is
+# read by the readers with format "store"
+
+assert (len(sys.argv) == 3)
+pkl_list = sys.argv[1]
+prefix = sys.argv[2]
+
+
+def load_pkl(pkl_path):
+    with open(pkl_path, 'rb') as f:
+        if sys.version_info < (3, 0):
+            return pickle.load(f)
+        else:
+            return pickle.load(f, encoding='bytes')
+
+
+def field(record, name):
+    # keys are bytes if the pkl was dumped by python2
+    return record[name.encode('utf-8')] if name.encode(
+        'utf-8') in record else record[name]
+
+
+with open(pkl_list) as f:
+    pkl_paths = [line.strip() for line in f if line.strip()]
+
+num_records = 0
+with FeatureStoreWriter(prefix) as writer:
+    for i, pkl_path in enumerate(pkl_paths):
+        for record in load_pkl(pkl_path):
+            writer.write(
+                field(record, 'video'),
+                field(record, 'feature'),
+                field(record, 'audio'),
+                field(record, 'label'), int(field(record, 'nframes')))
+            num_records += 1
+        print('{}/{} files, {} records'.format(i + 1, len(pkl_paths),
+                                               num_records))
@@ -0,0 +1,116 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from metrics.youtube8m import eval_util
+from metrics.youtube8m import average_precision_calculator as ap_calculator
+from metrics.youtube8m import mean_average_precision_calculator as map_calculator
+from metrics.youtube8m import streaming_average_precision_calculator as streaming_calculator
+
+
+def random_batches(num_batches, batch_size, num_class, seed=0):
+    rng = np.random.RandomState(seed)
+    batches = []
+    for _ in range(num_batches):
+        labels = (rng.rand(batch_size, num_class) < 0.05).astype('float32')
+        # predictions are higher for positives, with no equal scores
+        predictions = rng.rand(batch_size, num_class) + labels * 0.3
+        batches.append((predictions.astype('float32'), labels))
+    return batches
+
+
+class TestYoutube8mMetrics(unittest.TestCase):
+    """Test the numpy calculators against the heap based calculators
+    """
+
+    def test_ap_at_n(self):
+        rng = np.random.RandomState(1)
+        predictions = rng.rand(500)
+        actuals = (rng.rand(500) < 0.2).astype('float32')
+        for n in [None, 1, 20, 1000]:
+            expected = ap_calculator.AveragePrecisionCalculator.ap_at_n(
+                predictions, actuals, n=n, total_num_positives=150)
+            ap = streaming_calculator.ap_at_n(
+                predictions, actuals, n=n, total_num_positives=150)
+            self.assertAlmostEqual(ap, expected, places=10)
+        self.assertEqual(
+            streaming_calculator.ap_at_n(predictions, np.zeros(500)), 0)
+
+    def test_bounded_ap_calculator(self):
+        expected = ap_calculator.AveragePrecisionCalculator(top_n=30)
+        calculator = streaming_calculator.StreamingAveragePrecisionCalculator(
+            top_n=30)
+        rng = np.random.RandomState(2)
+        for _ in range(10):
+            predictions = rng.rand(40)
+            actuals = (rng.rand(40) < 0.3).astype('float32')
+            expected.accumulate(predictions, actuals)
+            calculator.accumulate(predictions, actuals)
+        self.assertLessEqual(calculator.heap_size, 60)
+        self.assertEqual(calculator.num_accumulated_positives,
+                         expected.num_accumulated_positives)
+        self.assertAlmostEqual(
+            calculator.peek_ap_at_n(), expected.peek_ap_at_n(), places=10)
+
+    def test_calculate_gap(self):
+        predictions, labels = random_batches(1, 200, 50)[0]
+        gap_calculator = ap_calculator.AveragePrecisionCalculator()
+        sparse_predictions, sparse_labels, num_positives = \
+            eval_util.top_k_by_class(predictions, labels, 20)
+        gap_calculator.accumulate(
+            eval_util.flatten(sparse_predictions),
+            eval_util.flatten(sparse_labels), sum(num_positives))
+        self.assertAlmostEqual(
+            eval_util.calculate_gap(predictions, labels),
+            gap_calculator.peek_ap_at_n(),
+            places=10)
+
+    def test_evaluation_metrics(self):
+        num_class, top_k = 50, 5
+        map_expected = map_calculator.MeanAveragePrecisionCalculator(num_class)
+        gap_expected = ap_calculator.AveragePrecisionCalculator()
+        metrics = eval_util.EvaluationMetrics(num_class, top_k)
+        for predictions, labels in random_batches(6, 64, num_class):
+            sparse_predictions, sparse_labels, num_positives = \
+                eval_util.top_k_by_class(predictions, labels, top_k)
+            map_expected.accumulate(sparse_predictions, sparse_labels,
+                                    num_positives)
+            gap_expected.accumulate(
+                eval_util.flatten(sparse_predictions),
+                eval_util.flatten(sparse_labels), sum(num_positives))
+            metrics.accumulate(np.zeros(len(labels)), predictions, labels)
+
+        result = metrics.get()
+        np.testing.assert_allclose(
+            result['aps'], map_expected.peek_map_at_n(), rtol=0, atol=1e-10)
+        self.assertAlmostEqual(
+            result['gap'], gap_expected.peek_ap_at_n(), places=10)
+
+        metrics.clear()
+        self.assertTrue(metrics.map_calculator.is_empty())
+        self.assertEqual(metrics.global_ap_calculator.peek_ap_at_n(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
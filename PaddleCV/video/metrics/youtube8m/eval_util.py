@@ -17,6 +17,7 @@ import numpy
 
 from . import mean_average_precision_calculator as map_calculator
 from . import average_precision_calculator as ap_calculator
+from . import streaming_average_precision_calculator as streaming_calculator
 
 
 def flatten(l):
@@ -84,12 +85,13 @@ def calculate_gap(predictions, actuals, top_k=20):
   Returns:
     float: The global average precision.
   """
-    gap_calculator = ap_calculator.AveragePrecisionCalculator()
-    sparse_predictions, sparse_labels, num_positives = top_k_by_class(
+    _, sparse_predictions, sparse_labels, num_positives = top_k_sparse(
         predictions, actuals, top_k)
-    gap_calculator.accumulate(
-        flatten(sparse_predictions), flatten(sparse_labels), sum(num_positives))
-    return gap_calculator.peek_ap_at_n()
+    return streaming_calculator.ap_at_n(
+        sparse_predictions,
+        sparse_labels,
+        n=None,
+        total_num_positives=num_positives.sum())
 
 
 def top_k_by_class(predictions, labels, k=20):
@@ -130,6 +132,34 @@ def top_k_by_class(predictions, labels, k=20):
     return out_predictions, out_labels, out_true_positives
 
 
+def top_k_sparse(predictions, labels, k=20):
+    """Extracts the top k predictions for each video, as flat numpy arrays.
+
+  Args:
+    predictions: A numpy matrix containing the outputs of the model.
+      Dimensions are 'batch' x 'num_classes'.
+    labels: A numpy matrix containing the ground truth labels.
+      Dimensions are 'batch' x 'num_classes'.
+    k: the top k entries to preserve in each prediction.
+
+  Returns:
+    A tuple (classes, predictions, labels, true_positives). 'classes',
+    'predictions' and 'labels' are numpy arrays of the 'batch' x k top
+    entries. 'true_positives' is a numpy array of the number of true
+    positives for each class in the ground truth.
+
+  Raises:
+    ValueError: An error occurred when the k is not a positive integer.
+  """
+    if k <= 0:
+        raise ValueError("k must be a positive integer.")
+    k = min(k, predictions.shape[1])
+    classes = numpy.argpartition(predictions, -k, axis=1)[:, -k:]
+    rows = numpy.arange(predictions.shape[0])[:, None]
+    return (classes.ravel(), predictions[rows, classes].ravel(),
+            labels[rows, classes].ravel(), numpy.sum(labels, axis=0))
+
+
 def top_k_triplets(predictions, labels, k=20):
     """Get the top_k for a 1-d numpy array. Returns a sparse list of tuples in
   (prediction, class) format"""
@@ -156,9 +186,11 @@ class EvaluationMetrics(object):
         self.sum_hit_at_one = 0.0
         self.sum_perr = 0.0
         self.sum_loss = 0.0
-        self.map_calculator = map_calculator.MeanAveragePrecisionCalculator(
-            num_class)
-        self.global_ap_calculator = ap_calculator.AveragePrecisionCalculator()
+        self.map_calculator = \
+            streaming_calculator.StreamingMeanAveragePrecisionCalculator(
+                num_class)
+        self.global_ap_calculator = \
+            streaming_calculator.StreamingAveragePrecisionCalculator()
         self.top_k = top_k
         self.num_examples = 0
 
@@ -187,13 +219,12 @@ class EvaluationMetrics(object):
         mean_loss = numpy.mean(loss)
 
         # Take the top 20 predictions.
-        sparse_predictions, sparse_labels, num_positives = top_k_by_class(
-            predictions, labels, self.top_k)
-        self.map_calculator.accumulate(sparse_predictions, sparse_labels,
-                                       num_positives)
+        classes, sparse_predictions, sparse_labels, num_positives = \
+            top_k_sparse(predictions, labels, self.top_k)
+        self.map_calculator.accumulate_sparse(classes, sparse_predictions,
+                                              sparse_labels, num_positives)
         self.global_ap_calculator.accumulate(
-            flatten(sparse_predictions),
-            flatten(sparse_labels), sum(num_positives))
+            sparse_predictions, sparse_labels, num_positives.sum())
 
         self.num_examples += batch_size
         self.sum_hit_at_one += mean_hit_at_one * batch_size
@@ -0,0 +1,306 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Calculate the average precision and mean average precision with numpy.
+
+The calculators have the same interface and results as the ones in
+average_precision_calculator.py and mean_average_precision_calculator.py,
+but keep the accumulated predictions in numpy arrays instead of python
+heaps. The predictions of all classes are kept together, with the top n of
+every class selected in one sort when the buffers grow large, and all APs
+are computed in a vectorized pass.
+
+Predictions with equal scores are ranked in the order they are accumulated,
+while the original calculators rank them in a shuffled order, so the APs
+may differ only when some scores are equal.
+"""
+
+import numbers
+
+import numpy
+
+
+def class_average_precisions(classes,
+                             predictions,
+                             actuals,
+                             num_positives,
+                             num_class,
+                             n=None):
+    """Calculate the non-interpolated average precision at n of every class.
+
+  Args:
+    classes: a numpy 1-D array storing the classes of the predictions.
+    predictions: a numpy 1-D array storing the sparse prediction scores.
+    actuals: a numpy 1-D array storing the ground truth labels. Any value
+      larger than 0 will be treated as positives, otherwise as negatives.
+    num_positives: a numpy 1-D array storing the number of positives of
+      every class.
+    num_class: the number of classes.
+    n: the top n items of every class to be considered in ap@n, or None.
+
+  Returns:
+    A numpy 1-D array of the average precision at n of every class.
+  """
+    classes = numpy.asarray(classes, dtype='int64')
+    predictions = numpy.asarray(predictions)
+    actuals = numpy.asarray(actuals)
+    if len(predictions) != len(actuals) or len(predictions) != len(classes):
+        raise ValueError("the shape of predictions and actuals does not match.")
+
+    order, rank = _rank_by_class(classes, predictions, num_class)
+    classes = classes[order]
+    positives = actuals[order] > 0
+    if n is not None:
+        keep = rank < n
+        classes, positives, rank = classes[keep], positives[keep], rank[keep]
+
+    # number of positives ranked before or at every item in its class
+    poscount = numpy.cumsum(positives)
+    starts = numpy.searchsorted(classes, numpy.arange(num_class))
+    before = numpy.concatenate([[0], poscount])[starts]
+    poscount = poscount - before[classes]
+    precisions = numpy.where(positives, poscount / (rank + 1.0), 0.0)
+    ap_sums = numpy.bincount(classes, weights=precisions, minlength=num_class)
+
+    numpos = numpy.asarray(num_positives, dtype='float64')
+    if n is not None:
+        numpos = numpy.minimum(numpos, n)
+    aps = numpy.zeros(num_class, dtype='float64')
+    valid = numpos > 0
+    aps[valid] = ap_sums[valid] / numpos[valid]
+    return aps
+
+
+def ap_at_n(predictions, actuals, n=20, total_num_positives=None):
+    """Same as AveragePrecisionCalculator.ap_at_n, vectorized with numpy."""
+    if n is not None:
+        if not isinstance(n, int) or n <= 0:
+            raise ValueError("n must be 'None' or a positive integer."
+                             " It was '%s'." % n)
+    actuals = numpy.asarray(actuals)
+    if total_num_positives is None:
+        total_num_positives = numpy.size(numpy.where(actuals > 0))
+    return class_average_precisions(
+        numpy.zeros(len(actuals), dtype='int64'), predictions, actuals,
+        [total_num_positives], 1, n)[0]
+
+
+def _rank_by_class(classes, predictions, num_class):
+    """ sort items by class and descending prediction, items with equal
+        predictions keep their order. Returns the order and the rank of
+        the sorted items in their classes
+    """
+    order = numpy.lexsort((-predictions, classes))
+    sorted_classes = classes[order]
+    starts = numpy.searchsorted(sorted_classes, numpy.arange(num_class))
+    rank = numpy.arange(len(order)) - starts[sorted_classes]
+    return order, rank
+
+
+class StreamingMeanAveragePrecisionCalculator(object):
+    """Calculate the average precision of every class, with the predictions
+  of all classes kept in numpy arrays."""
+
+    def __init__(self, num_class, top_n=None):
+        """Construct a calculator to calculate the (macro) average precision.
+
+    Args:
+      num_class: A positive Integer specifying the number of classes.
+      top_n: A positive Integer specifying the average precision at n of
+        every class, or None to use all provided data points.
+
+    Raises:
+      ValueError: An error occurred when num_class is not a positive integer
+      or top_n is not a positive integer.
+    """
+        if not isinstance(num_class, int) or num_class < 1:
+            raise ValueError("num_class must be a positive integer.")
+        if not ((isinstance(top_n, int) and top_n >= 0) or top_n is None):
+            raise ValueError("top_n must be a positive integer or None.")
+
+        self._num_class = num_class
+        self._top_n = top_n
+        # keep at most about twice top n predictions of every class
+        self._max_size = None if top_n is None else 2 * top_n * num_class
+        self.clear()
+
+    @property
+    def num_accumulated_positives(self):
+        """Gets the number of positive samples of every class."""
+        return self._total_positives
+
+    def accumulate_sparse(self,
+                          classes,
+                          predictions,
+                          actuals,
+                          num_positives=None):
+        """Accumulate the predictions and their ground truth labels.
+
+    Args:
+      classes: a numpy 1-D array storing the classes of the predictions.
+      predictions: a numpy 1-D array storing the prediction scores.
+      actuals: a numpy 1-D array storing the ground truth labels. Any value
+        larger than 0 will be treated as positives, otherwise as negatives.
+      num_positives: If provided, it is a list of numbers representing the
+        number of true positives for each class. If not provided, the number
+        of true positives will be inferred from the 'actuals' array.
+
+    Raises:
+      ValueError: An error occurred when the shape of predictions and
+      actuals does not match.
+    """
+        classes = numpy.asarray(classes, dtype='int64').ravel()
+        predictions = numpy.asarray(predictions).ravel()
+        actuals = numpy.asarray(actuals).ravel()
+        if len(predictions) != len(actuals) or len(predictions) != len(classes):
+            raise ValueError(
+                "the shape of predictions and actuals does not match.")
+
+        if num_positives is None:
+            num_positives = numpy.bincount(
+                classes, weights=actuals > 0, minlength=self._num_class)
+        self._total_positives += numpy.asarray(num_positives, dtype='float64')
+
+        self._classes.append(classes)
+        self._predictions.append(predictions)
+        self._actuals.append(actuals)
+        self._size += len(predictions)
+        if self._max_size is not None and self._size > self._max_size:
+            self._compact()
+
+    def accumulate(self, predictions, actuals, num_positives=None):
+        """Accumulate the predictions of classes like
+    MeanAveragePrecisionCalculator.accumulate.
+
+    Args:
+      predictions: A list of lists storing the prediction scores. The outer
+      dimension corresponds to classes.
+      actuals: A list of lists storing the ground truth labels.
+      num_positives: If provided, it is a list of numbers representing the
+      number of true positives for each class.
+    """
+        classes = numpy.concatenate([
+            numpy.full(len(p), i, dtype='int64')
+            for i, p in enumerate(predictions)
+        ])
+        self.accumulate_sparse(classes,
+                               numpy.concatenate(
+                                   [numpy.asarray(p) for p in predictions]),
+                               numpy.concatenate(
+                                   [numpy.asarray(a) for a in actuals]),
+                               num_positives)
+
+    def _merged(self):
+        if len(self._predictions) > 1:
+            self._classes = [numpy.concatenate(self._classes)]
+            self._predictions = [numpy.concatenate(self._predictions)]
+            self._actuals = [numpy.concatenate(self._actuals)]
+        if not self._predictions:
+            return (numpy.zeros(0, dtype='int64'), numpy.zeros(0),
+                    numpy.zeros(0))
+        return self._classes[0], self._predictions[0], self._actuals[0]
+
+    def _compact(self):
+        """ keep the top n predictions of every class """
+        classes, predictions, actuals = self._merged()
+        order, rank = _rank_by_class(classes, predictions, self._num_class)
+        keep = numpy.sort(order[rank < self._top_n])
+        self._classes = [classes[keep]]
+        self._predictions = [predictions[keep]]
+        self._actuals = [actuals[keep]]
+        self._size = len(keep)
+
+    def clear(self):
+        """Clear the accumulated predictions."""
+        self._classes = []
+        self._predictions = []
+        self._actuals = []
+        self._size = 0
+        self._total_positives = numpy.zeros(self._num_class, dtype='float64')
+
+    def is_empty(self):
+        return self._size == 0
+
+    def peek_map_at_n(self):
+        """Peek the non-interpolated mean average precision at n.
+
+    Returns:
+      An array of non-interpolated average precision at n (default 0) for each
+      class.
+    """
+        classes, predictions, actuals = self._merged()
+        return class_average_precisions(
+            classes, predictions, actuals, self._total_positives,
+            self._num_class, self._top_n).tolist()
+
+
+class StreamingAveragePrecisionCalculator(object):
+    """Calculate the average precision and average precision at n, with the
+  predictions kept in numpy arrays."""
+
+    def __init__(self, top_n=None):
+        """Construct a calculator to calculate average precision.
+
+    Args:
+      top_n: A positive Integer specifying the average precision at n, or
+        None to use all provided data points.
+    """
+        self._calculator = StreamingMeanAveragePrecisionCalculator(1, top_n)
+
+    @property
+    def heap_size(self):
+        """Gets the number of kept predictions."""
+        return self._calculator._size
+
+    @property
+    def num_accumulated_positives(self):
+        """Gets the number of positive samples that have been accumulated."""
+        return self._calculator.num_accumulated_positives[0]
+
+    def accumulate(self, predictions, actuals, num_positives=None):
+        """Accumulate the predictions and their ground truth labels, like
+    AveragePrecisionCalculator.accumulate.
+
+    Raises:
+      ValueError: An error occurred when the shape of predictions and actuals
+      does not match, or num_positives is not a nonzero number.
+    """
+        if len(predictions) != len(actuals):
+            raise ValueError(
+                "the shape of predictions and actuals does not match.")
+
+        if not num_positives is None:
+            if not isinstance(num_positives,
+                              numbers.Number) or num_positives < 0:
+                raise ValueError(
+                    "'num_positives' was provided but it wan't a nonzero number."
+                )
+            num_positives = [num_positives]
+
+        self._calculator.accumulate_sparse(
+            numpy.zeros(len(predictions), dtype='int64'), predictions, actuals,
+            num_positives)
+
+    def clear(self):
+        """Clear the accumulated predictions."""
+        self._calculator.clear()
+
+    def peek_ap_at_n(self):
+        """Peek the non-interpolated average precision at n.
+
+    Returns:
+      The non-interpolated average precision at n (default 0).
+    """
+        if self.heap_size <= 0:
+            return 0
+        return self._calculator.peek_map_at_n()[0]
@@ -0,0 +1,106 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Benchmark the youtube-8M GAP and mAP calculation of EvaluationMetrics
+against the heap based calculators, on random predictions, eg:
+
+    python tools/benchmark_youtube8m_metrics.py --num_videos 20000
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from metrics.youtube8m import eval_util
+from metrics.youtube8m import average_precision_calculator as ap_calculator
+from metrics.youtube8m import mean_average_precision_calculator as map_calculator
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--num_videos', type=int, default=20000, help='number of videos')
+    parser.add_argument(
+        '--num_classes', type=int, default=3862, help='number of classes')
+    parser.add_argument(
+        '--batch_size', type=int, default=1024, help='videos in a batch')
+    parser.add_argument(
+        '--top_k', type=int, default=20, help='predictions used per video')
+    return parser.parse_args()
+
+
+def heap_metrics(batches, num_classes, top_k):
+    """ GAP and mAP by the heap based calculators, as EvaluationMetrics
+        computed them before """
+    map_calc = map_calculator.MeanAveragePrecisionCalculator(num_classes)
+    gap_calc = ap_calculator.AveragePrecisionCalculator()
+    for predictions, labels in batches:
+        sparse_predictions, sparse_labels, num_positives = \
+            eval_util.top_k_by_class(predictions, labels, top_k)
+        map_calc.accumulate(sparse_predictions, sparse_labels, num_positives)
+        gap_calc.accumulate(
+            eval_util.flatten(sparse_predictions),
+            eval_util.flatten(sparse_labels), sum(num_positives))
+    return gap_calc.peek_ap_at_n(), map_calc.peek_map_at_n()
+
+
+def numpy_metrics(batches, num_classes, top_k):
+    metrics = eval_util.EvaluationMetrics(num_classes, top_k)
+    for predictions, labels in batches:
+        classes, sparse_predictions, sparse_labels, num_positives = \
+            eval_util.top_k_sparse(predictions, labels, top_k)
+        metrics.map_calculator.accumulate_sparse(
+            classes, sparse_predictions, sparse_labels, num_positives)
+        metrics.global_ap_calculator.accumulate(
+            sparse_predictions, sparse_labels, num_positives.sum())
+    return (metrics.global_ap_calculator.peek_ap_at_n(),
+            metrics.map_calculator.peek_map_at_n())
+
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(0)
+    batches = []
+    for start in range(0, args.num_videos, args.batch_size):
+        size = min(args.batch_size, args.num_videos - start)
+        labels = (rng.rand(size, args.num_classes) < 3. / args.num_classes
+                  ).astype('float32')
+        predictions = (rng.rand(size, args.num_classes) * 0.5 + labels * 0.3
+                       ).astype('float32')
+        batches.append((predictions, labels))
+
+    print('videos: %d, classes: %d, top_k: %d' %
+          (args.num_videos, args.num_classes, args.top_k))
+    print('%-10s %-10s %-12s %-12s' % ('method', 'time(s)', 'GAP', 'mean AP'))
+    results = []
+    for name, func in [('heap', heap_metrics), ('numpy', numpy_metrics)]:
+        start = time.time()
+        gap, aps = func(batches, args.num_classes, args.top_k)
+        cost = time.time() - start
+        results.append((gap, np.array(aps)))
+        print('%-10s %-10.2f %-12.8f %-12.8f' % (name, cost, gap,
+                                                 np.mean(aps)))
+    print('max difference of GAP: %g, APs: %g' %
+          (abs(results[0][0] - results[1][0]),
+           np.abs(results[0][1] - results[1][1]).max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,11 +14,14 @@
 # limitations under the License.
 """Run MRQA"""
 
+import os
 import six
 import math
 import json
 import random
+import hashlib
 import collections
+import multiprocessing
 import numpy as np
 import tokenization
 from batching import prepare_batch_data
@@ -184,13 +187,14 @@ def convert_examples_to_features(
         doc_stride,
         max_query_length,
         is_training,
+        example_index_offset=0,
         #output_fn
 ):
     """Loads a data file into a list of `InputBatch`s."""
 
     unique_id = 1000000000
 
-    for (example_index, example) in enumerate(examples):
+    for (example_index, example) in enumerate(examples, example_index_offset):
         query_tokens = tokenizer.tokenize(example.question_text)
 
         if len(query_tokens) > max_query_length:
@@ -584,15 +588,95 @@ def _check_is_max_context(doc_spans, cur_span_index, position):
     return cur_span_index == best_span_index
 
 
+def features_to_arrays(features):
+    """Packs the fields of `InputFeatures` used for batching into numpy
+    arrays, with input_ids and segment_ids of all features concatenated and
+    indexed by offsets. A start/end position of None is saved as -1."""
+    input_ids, segment_ids, seq_lens = [], [], []
+    example_index, start_position, end_position = [], [], []
+    for feature in features:
+        input_ids.extend(feature.input_ids)
+        segment_ids.extend(feature.segment_ids)
+        seq_lens.append(len(feature.input_ids))
+        example_index.append(feature.example_index)
+        start_position.append(-1 if feature.start_position is None else
+                              feature.start_position)
+        end_position.append(-1 if feature.end_position is None else
+                            feature.end_position)
+    return {
+        "input_ids": np.array(input_ids, dtype="int32"),
+        "segment_ids": np.array(segment_ids, dtype="int8"),
+        "seq_lens": np.array(seq_lens, dtype="int64"),
+        "example_index": np.array(example_index, dtype="int64"),
+        "start_position": np.array(start_position, dtype="int64"),
+        "end_position": np.array(end_position, dtype="int64"),
+    }
+
+
+def concat_feature_arrays(arrays_list):
+    """Concatenates the feature arrays converted from consecutive chunks of
+    examples, and assigns the unique ids and offsets of all features."""
+    arrays = {}
+    for name in arrays_list[0]:
+        arrays[name] = np.concatenate([chunk[name] for chunk in arrays_list])
+    num_features = len(arrays["seq_lens"])
+    arrays["unique_id"] = 1000000000 + np.arange(num_features, dtype="int64")
+    arrays["offsets"] = np.concatenate(
+        [[0], np.cumsum(arrays["seq_lens"])]).astype("int64")
+    return arrays
+
+
+_worker_tokenizer = None
+
+
+def _init_feature_worker(vocab_path, do_lower_case):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenization.FullTokenizer(
+        vocab_file=vocab_path, do_lower_case=do_lower_case)
+
+
+def _convert_examples_chunk(args):
+    (examples, example_index_offset, max_seq_length, doc_stride,
+     max_query_length, is_training) = args
+    return features_to_arrays(
+        convert_examples_to_features(
+            examples=examples,
+            tokenizer=_worker_tokenizer,
+            max_seq_length=max_seq_length,
+            doc_stride=doc_stride,
+            max_query_length=max_query_length,
+            is_training=is_training,
+            example_index_offset=example_index_offset))
+
+
+def _file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
 class DataProcessor(object):
-    def __init__(self, vocab_path, do_lower_case, max_seq_length, in_tokens,
-                 doc_stride, max_query_length):
+    def __init__(self,
+                 vocab_path,
+                 do_lower_case,
+                 max_seq_length,
+                 in_tokens,
+                 doc_stride,
+                 max_query_length,
+                 cache_dir=None,
+                 num_workers=1):
         self._tokenizer = tokenization.FullTokenizer(
             vocab_file=vocab_path, do_lower_case=do_lower_case)
+        self._vocab_path = vocab_path
+        self._do_lower_case = do_lower_case
         self._max_seq_length = max_seq_length
         self._doc_stride = doc_stride
         self._max_query_length = max_query_length
         self._in_tokens = in_tokens
+        self._cache_dir = cache_dir
+        self._num_workers = num_workers
 
         self.vocab = self._tokenizer.vocab
         self.vocab_size = len(self.vocab)
@@ -646,6 +730,63 @@ class DataProcessor(object):
             is_training=is_training)
         return features
 
+    def get_feature_arrays(self, data_path, examples, is_training,
+                           with_negative=False):
+        """Converts the examples to features packed in numpy arrays (see
+        `features_to_arrays`), in parallel by `num_workers` processes. If
+        `cache_dir` is set, the arrays are saved there, keyed by the
+        vocabulary, the conversion options and the data file, and loaded
+        instead of converting again in later runs."""
+        cache_path = None
+        if self._cache_dir is not None:
+            key = hashlib.md5(
+                json.dumps([
+                    _file_md5(self._vocab_path), self._do_lower_case,
+                    self._max_seq_length, self._doc_stride,
+                    self._max_query_length, is_training, with_negative,
+                    _file_md5(data_path)
+                ]).encode("utf-8")).hexdigest()
+            cache_path = os.path.join(
+                self._cache_dir,
+                "%s.%s.npz" % (os.path.basename(data_path), key))
+            if os.path.exists(cache_path):
+                print("loading cached features from %s" % cache_path)
+                with np.load(cache_path) as cache:
+                    return dict((name, cache[name]) for name in cache.files)
+
+        if self._num_workers > 1 and len(examples) > 1:
+            chunk_size = int(
+                math.ceil(len(examples) / float(self._num_workers * 4)))
+            chunks = [(examples[i:i + chunk_size], i, self._max_seq_length,
+                       self._doc_stride, self._max_query_length, is_training)
+                      for i in range(0, len(examples), chunk_size)]
+            pool = multiprocessing.Pool(
+                self._num_workers,
+                initializer=_init_feature_worker,
+                initargs=(self._vocab_path, self._do_lower_case))
+            try:
+                arrays_list = pool.map(_convert_examples_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            arrays_list = [
+                features_to_arrays(self.get_features(examples, is_training))
+            ]
+        arrays = concat_feature_arrays(arrays_list)
+
+        if cache_path is not None:
+            if not os.path.exists(self._cache_dir):
+                os.makedirs(self._cache_dir)
+            # write to a temporary file first, so that a concurrent run never
+            # loads a partially written cache
+            tmp_path = "%s.%d.tmp.npz" % (cache_path[:-len(".npz")],
+                                          os.getpid())
+            np.savez(tmp_path, **arrays)
+            os.rename(tmp_path, cache_path)
+            print("saved features to %s" % cache_path)
+        return arrays
+
     def data_generator(self,
                        data_path,
                        batch_size,
@@ -673,18 +814,24 @@ class DataProcessor(object):
             raise ValueError(
                 "Unknown phase, which should be in ['train', 'predict'].")
 
-        def batch_reader(features, batch_size, in_tokens):
+        def batch_reader(features, order, batch_size, in_tokens):
+            input_ids, segment_ids = features["input_ids"], features[
+                "segment_ids"]
+            offsets, unique_ids = features["offsets"], features["unique_id"]
+            start_positions, end_positions = features[
+                "start_position"], features["end_position"]
             batch, total_token_num, max_len = [], 0, 0
-            for (index, feature) in enumerate(features):
+            for (index, i) in enumerate(order):
                 if phase == 'train':
                     self.current_train_example = index + 1
-                seq_len = len(feature.input_ids)
-                labels = [feature.unique_id
-                          ] if feature.start_position is None else [
-                              feature.start_position, feature.end_position
-                          ]
+                start, end = offsets[i], offsets[i + 1]
+                seq_len = int(end - start)
+                labels = [unique_ids[i]] if start_positions[i] < 0 else [
+                    start_positions[i], end_positions[i]
+                ]
                 example = [
-                    feature.input_ids, feature.segment_ids, range(seq_len)
+                    input_ids[start:end], segment_ids[start:end],
+                    range(seq_len)
                 ] + labels
                 max_len = max(max_len, seq_len)
 
@@ -705,18 +852,23 @@ class DataProcessor(object):
                 yield batch, total_token_num
 
         def wrapper():
+            # features are converted (or loaded from the cache) only once and
+            # shuffled at the feature level in each epoch
+            features = self.get_feature_arrays(
+                data_path,
+                examples,
+                is_training=(phase == 'train'),
+                with_negative=with_negative)
+            order = np.arange(len(features["seq_lens"]))
             for epoch_index in range(epoch):
                 if shuffle:
-                    random.shuffle(examples)
+                    np.random.shuffle(order)
                 if phase == 'train':
                     self.current_train_epoch = epoch_index
-                    features = self.get_features(examples, is_training=True)
-                else:
-                    features = self.get_features(examples, is_training=False)
 
                 all_dev_batches = []
                 for batch_data, total_token_num in batch_reader(
-                        features, batch_size, self._in_tokens):
+                        features, order, batch_size, self._in_tokens):
                     batch_data = prepare_batch_data(
                         batch_data,
                         total_token_num,
@@ -19,6 +19,8 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import itertools
+import multiprocessing
 import unicodedata
 import six
 
@@ -106,6 +108,40 @@ def whitespace_tokenize(text):
     return tokens
 
 
+_worker_tokenizer = None
+
+
+def _init_tokenize_worker(tokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _tokenize_chunk(texts):
+    return [_worker_tokenizer.tokenize(text) for text in texts]
+
+
+def tokenize_many(tokenizer, texts, num_workers=1, chunk_size=1000):
+    """Tokenizes a list of texts, in `num_workers` processes by chunks of
+    `chunk_size` texts if `num_workers` > 1, which is helpful for large
+    corpora. Returns the list of tokens of each text."""
+    texts = list(texts)
+    if num_workers <= 1 or len(texts) <= chunk_size:
+        return [tokenizer.tokenize(text) for text in texts]
+    chunks = [
+        texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)
+    ]
+    pool = multiprocessing.Pool(
+        num_workers,
+        initializer=_init_tokenize_worker,
+        initargs=(tokenizer, ))
+    try:
+        results = pool.map(_tokenize_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    return list(itertools.chain.from_iterable(results))
+
+
 class FullTokenizer(object):
     """Runs end-to-end tokenziation."""
 
@@ -123,6 +159,9 @@ class FullTokenizer(object):
 
         return split_tokens
 
+    def tokenize_many(self, texts, num_workers=1, chunk_size=1000):
+        return tokenize_many(self, texts, num_workers, chunk_size)
+
     def convert_tokens_to_ids(self, tokens):
         return convert_by_vocab(self.vocab, tokens)
 
@@ -146,6 +185,9 @@ class CharTokenizer(object):
 
         return split_tokens
 
+    def tokenize_many(self, texts, num_workers=1, chunk_size=1000):
+        return tokenize_many(self, texts, num_workers, chunk_size)
+
     def convert_tokens_to_ids(self, tokens):
         return convert_by_vocab(self.vocab, tokens)
 
@@ -275,10 +317,22 @@ class BasicTokenizer(object):
 class WordpieceTokenizer(object):
     """Runs WordPiece tokenziation."""
 
-    def __init__(self, vocab, unk_token="[UNK]", max_input_chars_per_word=100):
+    def __init__(self,
+                 vocab,
+                 unk_token="[UNK]",
+                 max_input_chars_per_word=100,
+                 cache_size=100000):
         self.vocab = vocab
         self.unk_token = unk_token
         self.max_input_chars_per_word = max_input_chars_per_word
+        # the word pieces of the recently tokenized words, in LRU order
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        # prefix tries of the pieces starting a word (any token in vocab) and
+        # of the pieces following the start (tokens prefixed with "##")
+        self._trie = _build_trie(self.vocab)
+        self._suffix_trie = _build_trie(token[2:] for token in self.vocab
+                                        if token.startswith("##"))
 
     def tokenize(self, text):
         """Tokenizes a piece of text into its word pieces.
@@ -302,36 +356,63 @@ class WordpieceTokenizer(object):
 
         output_tokens = []
         for token in whitespace_tokenize(text):
-            chars = list(token)
-            if len(chars) > self.max_input_chars_per_word:
-                output_tokens.append(self.unk_token)
-                continue
+            sub_tokens = self._cache.pop(token, None)
+            if sub_tokens is None:
+                sub_tokens = self._tokenize_word(token)
+                if 0 < self.cache_size <= len(self._cache):
+                    self._cache.popitem(last=False)
+            if self.cache_size > 0:
+                self._cache[token] = sub_tokens
+            output_tokens.extend(sub_tokens)
+        return output_tokens
 
-            is_bad = False
-            start = 0
-            sub_tokens = []
-            while start < len(chars):
-                end = len(chars)
-                cur_substr = None
-                while start < end:
-                    substr = "".join(chars[start:end])
-                    if start > 0:
-                        substr = "##" + substr
-                    if substr in self.vocab:
-                        cur_substr = substr
-                        break
-                    end -= 1
-                if cur_substr is None:
-                    is_bad = True
+    def _tokenize_word(self, token):
+        """Splits a word into the longest pieces in vocab from left to right,
+        by walking the prefix tries, or returns [unk_token] if it fails."""
+        if len(token) > self.max_input_chars_per_word:
+            return [self.unk_token]
+
+        start = 0
+        prefix = ""
+        trie = self._trie
+        sub_tokens = []
+        while start < len(token):
+            # the rest of the word is the longest piece if it is in vocab, which
+            # is the common case and checked without walking the trie
+            rest = prefix + token[start:]
+            if rest in self.vocab:
+                sub_tokens.append(rest)
+                break
+            node = trie
+            end = None
+            for i in range(start, len(token)):
+                node = node.get(token[i])
+                if node is None:
                     break
-                sub_tokens.append(cur_substr)
-                start = end
-
-            if is_bad:
-                output_tokens.append(self.unk_token)
-            else:
-                output_tokens.extend(sub_tokens)
-        return output_tokens
+                if _TRIE_END in node:
+                    end = i + 1
+            if end is None:
+                return [self.unk_token]
+            sub_tokens.append(prefix + token[start:end])
+            start = end
+            prefix = "##"
+            trie = self._suffix_trie
+        return sub_tokens
+
+
+# The key marking the end of a token in the nodes of the prefix trie.
+_TRIE_END = None
+
+
+def _build_trie(tokens):
+    """Builds a prefix trie of tokens with nested dicts keyed by chars."""
+    root = {}
+    for token in tokens:
+        node = root
+        for char in token:
+            node = node.setdefault(char, {})
+        node[_TRIE_END] = True
+    return root
 
 
 def _is_whitespace(char):
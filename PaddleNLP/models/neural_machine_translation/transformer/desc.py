@@ -58,6 +58,21 @@ input_descs = {
     "init_idx": [(batch_size, ), "int32"],
 }
 
+# The data shapes of attention biases when compact_attn_bias is set. Only the
+# key padding bias is fed and it is expanded to the shapes in input_descs
+# (together with the bias on subsequent words for trg_slf_attn_bias) by ops.
+compact_attn_bias_descs = {
+    # The actual data shape of src_slf_attn_bias is:
+    # [batch_size, 1, 1, max_src_len_in_batch]
+    "src_slf_attn_bias": [(batch_size, 1, 1, seq_len), "float32"],
+    # The actual data shape of trg_slf_attn_bias is:
+    # [batch_size, 1, 1, max_trg_len_in_batch]
+    "trg_slf_attn_bias": [(batch_size, 1, 1, seq_len), "float32"],
+    # The actual data shape of trg_src_attn_bias is:
+    # [batch_size, 1, 1, max_src_len_in_batch]
+    "trg_src_attn_bias": [(batch_size, 1, 1, seq_len), "float32"],
+}
+
 # Names of word embedding table which might be reused for weight sharing.
 word_emb_param_names = (
     "src_word_emb_table",
@@ -489,32 +489,80 @@ def decoder(dec_input,
     return dec_output
 
 
-def make_all_inputs(input_fields):
+def expand_attn_bias(attn_bias, word, n_head, is_causal=False):
+    """
+    Expand the compact key padding bias with shape
+    [batch_size, 1, 1, max_key_len] to the attention bias with shape
+    [batch_size, n_head, max_query_len, max_key_len], where the query length
+    is that of word. If is_causal, the bias to avoid attention on subsequent
+    words is also added, which requires queries and keys to be the same
+    sequence.
+    """
+    # Ones with shape [batch_size, max_query_len, 1], which are used to
+    # broadcast along the query dimension by matmul.
+    ones = layers.scale(
+        x=layers.cast(
+            x=word, dtype=attn_bias.dtype), scale=0., bias=1.)
+    ones.stop_gradient = True
+    key_bias = layers.reshape(x=attn_bias, shape=[0, 1, -1])
+    bias = layers.matmul(x=ones, y=key_bias)
+    if is_causal:
+        pos = layers.cumsum(ones, axis=1)
+        # The distance between the positions of keys and queries, which is
+        # positive for subsequent words.
+        dist = layers.matmul(
+            x=ones, y=pos, transpose_y=True) - layers.matmul(
+                x=pos, y=ones, transpose_y=True)
+        bias = bias + layers.scale(
+            x=layers.clip(
+                x=dist, min=0., max=1.), scale=-1e9)
+    bias = layers.expand(
+        x=layers.unsqueeze(
+            input=bias, axes=[1]), expand_times=[1, n_head, 1, 1])
+    bias.stop_gradient = True
+    return bias
+
+
+def get_input_descs(compact_attn_bias=False):
+    """
+    Get the data shapes and data types of all inputs.
+    """
+    if not compact_attn_bias:
+        return input_descs
+    descs = dict(input_descs)
+    descs.update(compact_attn_bias_descs)
+    return descs
+
+
+def make_all_inputs(input_fields, compact_attn_bias=False):
     """
     Define the input data layers for the transformer model.
     """
+    descs = get_input_descs(compact_attn_bias)
     inputs = []
     for input_field in input_fields:
         input_var = layers.data(
             name=input_field,
-            shape=input_descs[input_field][0],
-            dtype=input_descs[input_field][1],
-            lod_level=input_descs[input_field][2]
-            if len(input_descs[input_field]) == 3 else 0,
+            shape=descs[input_field][0],
+            dtype=descs[input_field][1],
+            lod_level=descs[input_field][2]
+            if len(descs[input_field]) == 3 else 0,
             append_batch_size=False)
         inputs.append(input_var)
     return inputs
 
 
-def make_all_py_reader_inputs(input_fields, is_test=False):
+def make_all_py_reader_inputs(input_fields,
+                              is_test=False,
+                              compact_attn_bias=False):
+    descs = get_input_descs(compact_attn_bias)
     reader = layers.py_reader(
         capacity=20,
         name="test_reader" if is_test else "train_reader",
-        shapes=[input_descs[input_field][0] for input_field in input_fields],
-        dtypes=[input_descs[input_field][1] for input_field in input_fields],
+        shapes=[descs[input_field][0] for input_field in input_fields],
+        dtypes=[descs[input_field][1] for input_field in input_fields],
         lod_levels=[
-            input_descs[input_field][2]
-            if len(input_descs[input_field]) == 3 else 0
+            descs[input_field][2] if len(descs[input_field]) == 3 else 0
             for input_field in input_fields
         ])
     return layers.read_file(reader), reader
@@ -538,7 +586,8 @@ def transformer(src_vocab_size,
                 label_smooth_eps,
                 bos_idx=0,
                 use_py_reader=False,
-                is_test=False):
+                is_test=False,
+                compact_attn_bias=False):
     if weight_sharing:
         assert src_vocab_size == trg_vocab_size, (
             "Vocabularies in source and target should be same for weight sharing."
@@ -548,10 +597,10 @@ def transformer(src_vocab_size,
                 decoder_data_input_fields[:-1] + label_data_input_fields
 
     if use_py_reader:
-        all_inputs, reader = make_all_py_reader_inputs(data_input_names,
-                                                       is_test)
+        all_inputs, reader = make_all_py_reader_inputs(
+            data_input_names, is_test, compact_attn_bias)
     else:
-        all_inputs = make_all_inputs(data_input_names)
+        all_inputs = make_all_inputs(data_input_names, compact_attn_bias)
 
     enc_inputs_len = len(encoder_data_input_fields)
     dec_inputs_len = len(decoder_data_input_fields[:-1])
@@ -575,7 +624,8 @@ def transformer(src_vocab_size,
         preprocess_cmd,
         postprocess_cmd,
         weight_sharing,
-        enc_inputs, )
+        enc_inputs,
+        compact_attn_bias=compact_attn_bias)
 
     predict = wrap_decoder(
         trg_vocab_size,
@@ -593,7 +643,8 @@ def transformer(src_vocab_size,
         postprocess_cmd,
         weight_sharing,
         dec_inputs,
-        enc_output, )
+        enc_output,
+        compact_attn_bias=compact_attn_bias)
 
     # Padding index do not contribute to the total loss. The weights is used to
     # cancel padding index in calculating the loss.
@@ -630,16 +681,20 @@ def wrap_encoder(src_vocab_size,
                  postprocess_cmd,
                  weight_sharing,
                  enc_inputs=None,
-                 bos_idx=0):
+                 bos_idx=0,
+                 compact_attn_bias=False):
     """
     The wrapper assembles together all needed layers for the encoder.
     """
     if enc_inputs is None:
         # This is used to implement independent encoder program in inference.
         src_word, src_pos, src_slf_attn_bias = make_all_inputs(
-            encoder_data_input_fields)
+            encoder_data_input_fields, compact_attn_bias)
     else:
         src_word, src_pos, src_slf_attn_bias = enc_inputs
+    if compact_attn_bias:
+        src_slf_attn_bias = expand_attn_bias(src_slf_attn_bias, src_word,
+                                             n_head)
     enc_input = prepare_encoder(
         src_word,
         src_pos,
@@ -684,16 +739,24 @@ def wrap_decoder(trg_vocab_size,
                  enc_output=None,
                  caches=None,
                  gather_idx=None,
-                 bos_idx=0):
+                 bos_idx=0,
+                 compact_attn_bias=False):
     """
     The wrapper assembles together all needed layers for the decoder.
     """
     if dec_inputs is None:
         # This is used to implement independent decoder program in inference.
         trg_word, trg_pos, trg_slf_attn_bias, trg_src_attn_bias, enc_output = \
-            make_all_inputs(decoder_data_input_fields)
+            make_all_inputs(decoder_data_input_fields, compact_attn_bias)
     else:
         trg_word, trg_pos, trg_slf_attn_bias, trg_src_attn_bias = dec_inputs
+    if compact_attn_bias:
+        # trg_slf_attn_bias is None in fast decoder.
+        if trg_slf_attn_bias is not None:
+            trg_slf_attn_bias = expand_attn_bias(
+                trg_slf_attn_bias, trg_word, n_head, is_causal=True)
+        trg_src_attn_bias = expand_attn_bias(trg_src_attn_bias, trg_word,
+                                             n_head)
 
     dec_input = prepare_decoder(
         trg_word,
@@ -761,7 +824,8 @@ def fast_decode(src_vocab_size,
                 max_out_len,
                 bos_idx,
                 eos_idx,
-                use_py_reader=False):
+                use_py_reader=False,
+                compact_attn_bias=False):
     """
     Use beam search to decode. Caches will be used to store states of history
     steps which can make the decoding faster.
@@ -769,9 +833,10 @@ def fast_decode(src_vocab_size,
     data_input_names = encoder_data_input_fields + fast_decoder_data_input_fields
 
     if use_py_reader:
-        all_inputs, reader = make_all_py_reader_inputs(data_input_names)
+        all_inputs, reader = make_all_py_reader_inputs(
+            data_input_names, compact_attn_bias=compact_attn_bias)
     else:
-        all_inputs = make_all_inputs(data_input_names)
+        all_inputs = make_all_inputs(data_input_names, compact_attn_bias)
 
     enc_inputs_len = len(encoder_data_input_fields)
     dec_inputs_len = len(fast_decoder_data_input_fields)
@@ -794,7 +859,8 @@ def fast_decode(src_vocab_size,
         postprocess_cmd,
         weight_sharing,
         enc_inputs,
-        bos_idx=bos_idx)
+        bos_idx=bos_idx,
+        compact_attn_bias=compact_attn_bias)
     start_tokens, init_scores, parent_idx, trg_src_attn_bias = dec_inputs
 
     def beam_search():
@@ -872,7 +938,8 @@ def fast_decode(src_vocab_size,
                 enc_output=enc_output,
                 caches=caches,
                 gather_idx=parent_idx,
-                bos_idx=bos_idx)
+                bos_idx=bos_idx,
+                compact_attn_bias=compact_attn_bias)
             # intra-beam topK
             topk_scores, topk_indices = layers.topk(
                 input=layers.softmax(logits), k=beam_size)
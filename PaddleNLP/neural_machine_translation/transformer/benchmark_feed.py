@@ -0,0 +1,171 @@
+"""
+Benchmark the size and the host latency of the data fed to the Transformer
+per batch, with the attention biases of full shapes made by the list based
+padding used before, the vectorized padding and the compact attention biases
+(compact_attn_bias), on random sentence pairs, eg:
+
+    python benchmark_feed.py --batch_size 128 --max_len 100
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+from train import prepare_batch_input
+from desc import *
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=128,
+        help="The number of sentence pairs in a batch.")
+    parser.add_argument(
+        "--max_len",
+        type=int,
+        default=100,
+        help="The max length of sentences.")
+    parser.add_argument(
+        "--num_batches",
+        type=int,
+        default=50,
+        help="The number of batches to run.")
+    parser.add_argument(
+        "--n_head", type=int, default=8, help="The number of heads.")
+    return parser.parse_args()
+
+
+def legacy_pad_batch_data(insts, pad_idx, n_head, is_target=False,
+                          is_label=False, return_attn_bias=True,
+                          return_max_len=True, return_num_token=False):
+    """
+    The list based padding used before, for comparison.
+    """
+    return_list = []
+    max_len = max(len(inst) for inst in insts)
+    inst_data = np.array(
+        [inst + [pad_idx] * (max_len - len(inst)) for inst in insts])
+    return_list += [inst_data.astype("int64").reshape([-1, 1])]
+    if is_label:
+        inst_weight = np.array(
+            [[1.] * len(inst) + [0.] * (max_len - len(inst)) for inst in insts])
+        return_list += [inst_weight.astype("float32").reshape([-1, 1])]
+    else:
+        inst_pos = np.array([
+            list(range(0, len(inst))) + [0] * (max_len - len(inst))
+            for inst in insts
+        ])
+        return_list += [inst_pos.astype("int64").reshape([-1, 1])]
+    if return_attn_bias:
+        if is_target:
+            slf_attn_bias_data = np.ones((inst_data.shape[0], max_len, max_len))
+            slf_attn_bias_data = np.triu(slf_attn_bias_data,
+                                         1).reshape([-1, 1, max_len, max_len])
+            slf_attn_bias_data = np.tile(slf_attn_bias_data,
+                                         [1, n_head, 1, 1]) * [-1e9]
+        else:
+            slf_attn_bias_data = np.array([[0] * len(inst) + [-1e9] *
+                                           (max_len - len(inst))
+                                           for inst in insts])
+            slf_attn_bias_data = np.tile(
+                slf_attn_bias_data.reshape([-1, 1, 1, max_len]),
+                [1, n_head, max_len, 1])
+        return_list += [slf_attn_bias_data.astype("float32")]
+    if return_max_len:
+        return_list += [max_len]
+    if return_num_token:
+        num_token = 0
+        for inst in insts:
+            num_token += len(inst)
+        return_list += [num_token]
+    return return_list if len(return_list) > 1 else return_list[0]
+
+
+def legacy_prepare_batch_input(insts, data_input_names, src_pad_idx,
+                               trg_pad_idx, n_head, d_model):
+    src_word, src_pos, src_slf_attn_bias, src_max_len = legacy_pad_batch_data(
+        [inst[0] for inst in insts], src_pad_idx, n_head, is_target=False)
+    src_word = src_word.reshape(-1, src_max_len, 1)
+    src_pos = src_pos.reshape(-1, src_max_len, 1)
+    trg_word, trg_pos, trg_slf_attn_bias, trg_max_len = legacy_pad_batch_data(
+        [inst[1] for inst in insts], trg_pad_idx, n_head, is_target=True)
+    trg_word = trg_word.reshape(-1, trg_max_len, 1)
+    trg_pos = trg_pos.reshape(-1, trg_max_len, 1)
+    trg_src_attn_bias = np.tile(src_slf_attn_bias[:, :, ::src_max_len, :],
+                                [1, 1, trg_max_len, 1]).astype("float32")
+    lbl_word, lbl_weight, num_token = legacy_pad_batch_data(
+        [inst[2] for inst in insts],
+        trg_pad_idx,
+        n_head,
+        is_target=False,
+        is_label=True,
+        return_attn_bias=False,
+        return_max_len=False,
+        return_num_token=True)
+    data_input_dict = dict(
+        zip(data_input_names, [
+            src_word, src_pos, src_slf_attn_bias, trg_word, trg_pos,
+            trg_slf_attn_bias, trg_src_attn_bias, lbl_word, lbl_weight
+        ]))
+    return data_input_dict, np.asarray([num_token], dtype="float32")
+
+
+def make_batches(args):
+    rng = np.random.RandomState(0)
+    batches = []
+    for _ in range(args.num_batches):
+        batch = []
+        for _ in range(args.batch_size):
+            src_len, trg_len = rng.randint(1, args.max_len + 1, size=2)
+            src = rng.randint(3, 30000, size=src_len).tolist()
+            trg = rng.randint(3, 30000, size=trg_len).tolist()
+            batch.append((src, [0] + trg, trg + [1]))
+        batches.append(batch)
+    return batches
+
+
+def main():
+    args = parse_args()
+    batches = make_batches(args)
+    data_input_names = encoder_data_input_fields + \
+                decoder_data_input_fields[:-1] + label_data_input_fields
+    methods = [
+        ("legacy", legacy_prepare_batch_input, {}),
+        ("vectorized", prepare_batch_input, {"compact_attn_bias": False}),
+        ("compact", prepare_batch_input, {"compact_attn_bias": True}),
+    ]
+
+    print("batches: %d, batch size: %d, max length: %d, heads: %d" %
+          (args.num_batches, args.batch_size, args.max_len, args.n_head))
+    print("%-12s %-16s %-16s %-16s" %
+          ("method", "feed MB/batch", "bias MB/batch", "latency ms/batch"))
+    results = []
+    for name, func, kwargs in methods:
+        feed_bytes = bias_bytes = 0
+        start = time.time()
+        for batch in batches:
+            data_input_dict, _ = func(batch, data_input_names, 1, 1,
+                                      args.n_head, 512, **kwargs)
+            for input_name, data in data_input_dict.items():
+                feed_bytes += data.nbytes
+                if input_name.endswith("attn_bias"):
+                    bias_bytes += data.nbytes
+        cost = time.time() - start
+        results.append(data_input_dict)
+        print("%-12s %-16.3f %-16.3f %-16.3f" %
+              (name, feed_bytes / 1e6 / len(batches),
+               bias_bytes / 1e6 / len(batches), cost * 1e3 / len(batches)))
+
+    # the data of the vectorized padding is the same as that of the legacy
+    for input_name in data_input_names:
+        assert np.array_equal(results[0][input_name],
+                              results[1][input_name]), input_name
+
+
+if __name__ == "__main__":
+    main()
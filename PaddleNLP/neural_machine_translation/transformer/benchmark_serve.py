@@ -0,0 +1,109 @@
+"""
+Benchmark the latency and throughput of online translation by serve.py,
+with requests of the sentences in test files arriving in a Poisson process,
+eg:
+
+    python -u benchmark_serve.py \
+      --src_vocab_fpath gen_data/wmt16_ende_data_bpe/vocab_all.bpe.32000 \
+      --trg_vocab_fpath gen_data/wmt16_ende_data_bpe/vocab_all.bpe.32000 \
+      --special_token '<s>' '<e>' '<unk>' \
+      --test_file_pattern gen_data/wmt16_ende_data_bpe/newstest2014.tok.bpe.32000.en-de \
+      --num_requests 1000 \
+      --qps 50 \
+      model_path trained_models/iter_100000.infer.model \
+      beam_size 5 \
+      max_out_len 255
+
+Set --max_batch_size 1 to compare with translating requests one by one.
+"""
+
+from __future__ import print_function
+
+import glob
+import io
+import time
+
+import numpy as np
+
+from config import ModelHyperParams
+from serve import (DynamicBatcher, Translator, make_parser, make_src_converter,
+                   parse_args)
+
+
+def load_sentences(args):
+    """
+    Load the source sentences of test files, which are repeated if less
+    than num_requests.
+    """
+    sentences = []
+    for fpath in sorted(glob.glob(args.test_file_pattern)):
+        with io.open(fpath, encoding="utf-8") as f:
+            sentences.extend(line.rstrip("\n").split("\t")[0] for line in f)
+    return [
+        sentences[i % len(sentences)] for i in range(args.num_requests)
+    ]
+
+
+def main():
+    parser = make_parser("Benchmark of serving for Transformer.")
+    parser.add_argument(
+        "--test_file_pattern",
+        type=str,
+        required=True,
+        help="The pattern to match test data files.")
+    parser.add_argument(
+        "--num_requests",
+        type=int,
+        default=1000,
+        help="The number of requests to send.")
+    parser.add_argument(
+        "--qps",
+        type=float,
+        default=50.,
+        help="The average number of requests per second, or 0 to send all "
+        "requests at once.")
+    args = parse_args(parser)
+
+    converter = make_src_converter(args)
+    src_seq_ids = [converter(sentence) for sentence in load_sentences(args)]
+    # skip the sentences longer than the server accepts
+    src_seq_ids = [
+        src_ids for src_ids in src_seq_ids
+        if len(src_ids) <= ModelHyperParams.max_length
+    ]
+    translator = Translator()
+    # warm up
+    translator.translate(src_seq_ids[:1])
+
+    batcher = DynamicBatcher(translator.translate, args.max_batch_size,
+                             args.max_wait_ms, args.bucket_boundaries,
+                             ModelHyperParams.max_length)
+    intervals = np.random.RandomState(0).exponential(
+        1. / args.qps, len(src_seq_ids)) if args.qps > 0 else np.zeros(
+            len(src_seq_ids))
+    requests = []
+    start = time.time()
+    next_time = start
+    for src_ids, interval in zip(src_seq_ids, intervals):
+        next_time += interval
+        time.sleep(max(next_time - time.time(), 0))
+        requests.append(batcher.submit(src_ids))
+    for request in requests:
+        request.result()
+    end = max(request.finish_time for request in requests)
+    batcher.close()
+
+    latencies = np.array([
+        request.finish_time - request.arrival_time for request in requests
+    ]) * 1000
+    print("requests: %d, qps: %g, max batch size: %d, max wait: %gms" %
+          (len(requests), args.qps, args.max_batch_size, args.max_wait_ms))
+    print("latency p50: %.2fms, p99: %.2fms, mean: %.2fms" %
+          (np.percentile(latencies, 50), np.percentile(latencies, 99),
+           latencies.mean()))
+    print("throughput: %.2f sentences/s, mean batch size: %.2f" %
+          (len(requests) / (end - start), np.mean(batcher.batch_sizes)))
+
+
+if __name__ == "__main__":
+    main()
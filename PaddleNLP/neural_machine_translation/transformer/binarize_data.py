@@ -0,0 +1,85 @@
+"""
+Convert the data files to ids once and save them in binary files, which are
+memory mapped by the reader when training with `--use_binary_data True`, eg:
+
+    python binarize_data.py \
+      --src_vocab_fpath gen_data/wmt16_ende_data_bpe/vocab_all.bpe.32000 \
+      --trg_vocab_fpath gen_data/wmt16_ende_data_bpe/vocab_all.bpe.32000 \
+      --special_token '<s>' '<e>' '<unk>' \
+      --file_pattern gen_data/wmt16_ende_data_bpe/train.tok.clean.bpe.32000.en-de \
+      --output_prefix gen_data/wmt16_ende_data_bpe/train.bin
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import reader
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        "Binarize data for Transformer.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument(
+        "--src_vocab_fpath",
+        type=str,
+        required=True,
+        help="The path of vocabulary file of source language.")
+    parser.add_argument(
+        "--trg_vocab_fpath",
+        type=str,
+        default=None,
+        help="The path of vocabulary file of target language. Only source "
+        "sentences are converted if not provided.")
+    parser.add_argument(
+        "--file_pattern",
+        type=str,
+        required=True,
+        help="The pattern to match data files.")
+    parser.add_argument(
+        "--output_prefix",
+        type=str,
+        required=True,
+        help="The prefix of the binary files to save.")
+    parser.add_argument(
+        "--special_token",
+        type=str,
+        default=["<s>", "<e>", "<unk>"],
+        nargs=3,
+        help="The <bos>, <eos> and <unk> tokens in the dictionary.")
+    parser.add_argument(
+        "--token_delimiter",
+        type=lambda x: str(x.encode().decode("unicode-escape")),
+        default=" ",
+        help="The delimiter used to split tokens in source or target sentences. "
+        "For EN-DE BPE data we provided, use spaces as token delimiter. ")
+    parser.add_argument(
+        "--tar_fname",
+        type=str,
+        default=None,
+        help="The data file in tar if file_pattern matches a tar file.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start = time.time()
+    num = reader.binarize_data(
+        args.output_prefix,
+        args.src_vocab_fpath,
+        args.trg_vocab_fpath,
+        args.file_pattern,
+        tar_fname=args.tar_fname,
+        token_delimiter=args.token_delimiter,
+        start_mark=args.special_token[0],
+        end_mark=args.special_token[1],
+        unk_mark=args.special_token[2])
+    print("binarized %d sentences to %s.* in %.2fs" %
+          (num, args.output_prefix, time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -93,6 +93,11 @@ class ModelHyperParams(object):
     # the flag indicating whether to share embedding and softmax weights.
     # vocabularies in source and target should be same for weight sharing.
     weight_sharing = True
+    # the flag indicating whether to feed only the key padding biases in shape
+    # [batch_size, 1, 1, max_len] and expand them to the attention biases in
+    # shape [batch_size, n_head, max_len, max_len] by ops, which reduces the
+    # size of data to feed.
+    compact_attn_bias = False
 
 
 def merge_cfg_from_list(cfg_list, g_cfgs):
@@ -112,17 +112,29 @@ def post_process_seq(seq,
     return seq
 
 
-def prepare_batch_input(insts, data_input_names, src_pad_idx, bos_idx, n_head,
-                        d_model, place):
+def prepare_batch_input(insts,
+                        data_input_names,
+                        src_pad_idx,
+                        bos_idx,
+                        n_head,
+                        d_model,
+                        place,
+                        compact_attn_bias=False):
     """
     Put all padded data needed by beam search decoder into a dict.
     """
     src_word, src_pos, src_slf_attn_bias, src_max_len = pad_batch_data(
-        [inst[0] for inst in insts], src_pad_idx, n_head, is_target=False)
+        [inst[0] for inst in insts],
+        src_pad_idx,
+        n_head,
+        is_target=False,
+        compact_attn_bias=compact_attn_bias)
     # start tokens
     trg_word = np.asarray([[bos_idx]] * len(insts), dtype="int64")
-    trg_src_attn_bias = np.tile(src_slf_attn_bias[:, :, ::src_max_len, :],
-                                [1, 1, 1, 1]).astype("float32")
+    # The compact key padding bias is already in shape [batch_size, 1, 1,
+    # max_src_len_in_batch].
+    trg_src_attn_bias = src_slf_attn_bias if compact_attn_bias else \
+        np.ascontiguousarray(src_slf_attn_bias[:, :, :1, :])
     trg_word = trg_word.reshape(-1, 1, 1)
     src_word = src_word.reshape(-1, src_max_len, 1)
     src_pos = src_pos.reshape(-1, src_max_len, 1)
@@ -162,7 +174,8 @@ def prepare_feed_dict_list(data_generator, count, place):
             data_input_dict = prepare_batch_input(
                 data_buffer, data_input_names, ModelHyperParams.eos_idx,
                 ModelHyperParams.bos_idx, ModelHyperParams.n_head,
-                ModelHyperParams.d_model, place)
+                ModelHyperParams.d_model, place,
+                ModelHyperParams.compact_attn_bias)
             feed_dict_list.append(data_input_dict)
     return feed_dict_list if len(feed_dict_list) == count else None
 
@@ -178,7 +191,8 @@ def py_reader_provider_wrapper(data_reader, place):
             data_input_dict = prepare_batch_input(
                 data, data_input_names, ModelHyperParams.eos_idx,
                 ModelHyperParams.bos_idx, ModelHyperParams.n_head,
-                ModelHyperParams.d_model, place)
+                ModelHyperParams.d_model, place,
+                ModelHyperParams.compact_attn_bias)
             yield [data_input_dict[item] for item in data_input_names]
 
     return py_reader_provider
@@ -208,7 +222,8 @@ def fast_infer(args):
         InferTaskConfig.max_out_len,
         ModelHyperParams.bos_idx,
         ModelHyperParams.eos_idx,
-        use_py_reader=args.use_py_reader)
+        use_py_reader=args.use_py_reader,
+        compact_attn_bias=ModelHyperParams.compact_attn_bias)
 
     # This is used here to set dropout to the test mode.
     infer_program = fluid.default_main_program().clone(for_test=True)
@@ -246,8 +261,10 @@ def fast_infer(args):
 
     # data reader settings for inference
     args.train_file_pattern = args.test_file_pattern
+    args.use_binary_data = False
     args.use_token_batch = False
     args.sort_type = reader.SortType.NONE
+    args.num_buckets = 1
     args.shuffle = False
     args.shuffle_batch = False
     test_data = prepare_data_generator(
@@ -1,4 +1,5 @@
 import glob
+import logging
 import six
 import os
 import tarfile
@@ -9,6 +10,7 @@ import numpy as np
 class SortType(object):
     GLOBAL = 'global'
     POOL = 'pool'
+    BUCKET = 'bucket'
     NONE = "none"
 
 
@@ -95,6 +97,198 @@ class MinMaxFilter(object):
         return self._creator.batch
 
 
+def bucket_boundaries(lens, num_buckets):
+    """
+    Choose the upper bounds of at most num_buckets buckets from the histogram
+    of lengths by dynamic programming, which minimize the paddings when all
+    instances are padded to the upper bounds of their buckets.
+    """
+    if len(lens) == 0:
+        raise ValueError("No instance to choose the bucket boundaries from, "
+                         "check the data and the length limits.")
+    values, counts = np.unique(lens, return_counts=True)
+    num = len(values)
+    num_buckets = min(num_buckets, num)
+    # prefix sums of instance numbers and lengths
+    count_sums = np.concatenate([[0], np.cumsum(counts)])
+    len_sums = np.concatenate([[0], np.cumsum(counts * values)])
+    # paddings[i, j] of the bucket containing values[i] to values[j]
+    starts = np.arange(num)[:, np.newaxis]
+    ends = np.arange(num)[np.newaxis, :]
+    paddings = values[ends] * (count_sums[ends + 1] - count_sums[starts]) - (
+        len_sums[ends + 1] - len_sums[starts])
+    paddings = np.where(starts <= ends, paddings, np.inf)
+
+    # min paddings of values[:j + 1] in the current number of buckets
+    min_paddings = paddings[0]
+    last_starts = []
+    for _ in range(1, num_buckets):
+        # the last bucket starts at i and the others end at i - 1
+        candidates = min_paddings[:-1, np.newaxis] + paddings[1:]
+        last_start = np.argmin(candidates, axis=0)
+        last_starts.append(last_start + 1)
+        min_paddings = np.concatenate(
+            [[np.inf], candidates[last_start, np.arange(num)][1:]])
+
+    upper_bounds = [values[-1]]
+    end = num - 1
+    for last_start in reversed(last_starts):
+        end = last_start[end] - 1
+        upper_bounds.append(values[end])
+    return np.array(upper_bounds[::-1], dtype="int64")
+
+
+def plan_bucket_batches(idxs, lens, boundaries, batch_sizes, shuffle, rng,
+                        clip_last_batch):
+    """
+    Put the instances idxs with lengths lens into buckets with upper bounds
+    boundaries, and split each bucket into batches with batch_sizes
+    instances. Return the list of batches, each an array of instances.
+    """
+    idxs = np.array(idxs)
+    if shuffle:
+        rng.shuffle(idxs)
+    bucket_ids = np.searchsorted(boundaries, lens[idxs])
+    # group by bucket and keep the order in each bucket
+    idxs = idxs[np.argsort(bucket_ids, kind="mergesort")]
+    bucket_ends = np.cumsum(np.bincount(bucket_ids, minlength=len(boundaries)))
+
+    batches = []
+    for bucket_id, batch_size in enumerate(batch_sizes):
+        start = bucket_ends[bucket_id - 1] if bucket_id > 0 else 0
+        end = bucket_ends[bucket_id]
+        if clip_last_batch:
+            end -= (end - start) % batch_size
+        batches.extend(
+            np.split(idxs[start:end],
+                     np.arange(start + batch_size, end, batch_size) - start))
+    return [batch for batch in batches if len(batch)]
+
+
+def padding_efficiency(batches, lens):
+    """
+    The ratio of the real tokens to all tokens including paddings in batches.
+    """
+    if not batches:
+        return 0.
+    batch_lens = lens[np.concatenate(batches)]
+    batch_starts = np.cumsum([0] + [len(batch) for batch in batches[:-1]])
+    batch_max_lens = np.maximum.reduceat(batch_lens, batch_starts)
+    return float(batch_lens.sum()) / np.sum(batch_max_lens * np.diff(
+        np.append(batch_starts, len(batch_lens))))
+
+
+def make_converters(src_vocab, trg_vocab, start_mark, end_mark, unk_mark,
+                    token_delimiter):
+    """
+    Make the converter to convert source and target sentences to ids, the
+    target is not converted if trg_vocab is None.
+    """
+    converters = [
+        Converter(
+            vocab=src_vocab,
+            beg=src_vocab[start_mark],
+            end=src_vocab[end_mark],
+            unk=src_vocab[unk_mark],
+            delimiter=token_delimiter,
+            add_beg=False)
+    ]
+    if trg_vocab is not None:
+        converters.append(
+            Converter(
+                vocab=trg_vocab,
+                beg=trg_vocab[start_mark],
+                end=trg_vocab[end_mark],
+                unk=trg_vocab[unk_mark],
+                delimiter=token_delimiter,
+                add_beg=True))
+    return ComposedConverter(converters)
+
+
+def load_lines(fpattern, tar_fname, field_delimiter, only_src):
+    """
+    Yield the fields of lines in data files matched by fpattern.
+    """
+    fpaths = glob.glob(fpattern)
+
+    if len(fpaths) == 1 and tarfile.is_tarfile(fpaths[0]):
+        if tar_fname is None:
+            raise Exception("If tar file provided, please set tar_fname.")
+
+        f = tarfile.open(fpaths[0], "r")
+        for line in f.extractfile(tar_fname):
+            fields = line.strip("\n").split(field_delimiter)
+            if (not only_src and len(fields) == 2) or (only_src and
+                                                       len(fields) == 1):
+                yield fields
+    else:
+        for fpath in fpaths:
+            if not os.path.isfile(fpath):
+                raise IOError("Invalid file: %s" % fpath)
+
+            with open(fpath, "rb") as f:
+                for line in f:
+                    if six.PY3:
+                        line = line.decode()
+                    fields = line.strip("\n").split(field_delimiter)
+                    if (not only_src and len(fields) == 2) or (
+                            only_src and len(fields) == 1):
+                        yield fields
+
+
+def binarize_data(output_prefix,
+                  src_vocab_fpath,
+                  trg_vocab_fpath,
+                  fpattern,
+                  tar_fname=None,
+                  field_delimiter="\t",
+                  token_delimiter=" ",
+                  start_mark="<s>",
+                  end_mark="<e>",
+                  unk_mark="<unk>"):
+    """
+    Convert the data files to ids once and save them in binary files, which
+    are memory mapped by DataReader with use_binary=True. With prefix P, the
+    files are:
+
+        P.src.bin  ids of all source sentences, in int32
+        P.trg.bin  ids of all target sentences (with start and end marks),
+                   in int32, which is absent if trg_vocab_fpath is None
+        P.idx.npz  src_offsets: offsets of source sentences and the end
+                   trg_offsets: offsets of target sentences and the end
+                   src_vocab_size, trg_vocab_size: the sizes of dictionaries
+
+    :return: The number of sentences.
+    :rtype: int
+    """
+    src_vocab = DataReader.load_dict(src_vocab_fpath)
+    trg_vocab = None if trg_vocab_fpath is None else DataReader.load_dict(
+        trg_vocab_fpath)
+    converters = make_converters(src_vocab, trg_vocab, start_mark, end_mark,
+                                 unk_mark, token_delimiter)
+    fields = ["src"] if trg_vocab is None else ["src", "trg"]
+    files = [open(output_prefix + ".%s.bin" % field, "wb") for field in fields]
+    offsets = [[0] for field in fields]
+    try:
+        for line in load_lines(fpattern, tar_fname, field_delimiter,
+                               trg_vocab is None):
+            for i, ids in enumerate(converters(line)):
+                files[i].write(np.array(ids, dtype="int32").tobytes())
+                offsets[i].append(offsets[i][-1] + len(ids))
+    finally:
+        for f in files:
+            f.close()
+
+    index = dict(("%s_offsets" % field, np.array(offset, dtype="int64"))
+                 for field, offset in zip(fields, offsets))
+    index["src_vocab_size"] = len(src_vocab)
+    if trg_vocab is not None:
+        index["trg_vocab_size"] = len(trg_vocab)
+    with open(output_prefix + ".idx.npz", "wb") as f:
+        np.savez(f, **index)
+    return len(offsets[0]) - 1
+
+
 class DataReader(object):
     """
     The data reader loads all data from files and produces batches of data
@@ -124,7 +318,8 @@ class DataReader(object):
     :type src_vocab_fpath: basestring
     :param trg_vocab_fpath: The path of vocabulary file of target language.
     :type trg_vocab_fpath: basestring
-    :param fpattern: The pattern to match data files.
+    :param fpattern: The pattern to match data files, or the prefix of the
+        binary files saved by binarize_data if use_binary.
     :type fpattern: basestring
     :param batch_size: The number of sequences contained in a mini-batch.
         or the maximum number of tokens (include paddings) contained in a
@@ -133,7 +328,9 @@ class DataReader(object):
     :param pool_size: The size of pool buffer.
     :type pool_size: int
     :param sort_type: The grain to sort by length: 'global' for all
-        instances; 'pool' for instances in pool; 'none' for no sort.
+        instances; 'pool' for instances in pool; 'bucket' for instances in
+        buckets of lengths with boundaries chosen to minimize paddings;
+        'none' for no sort.
     :type sort_type: basestring
     :param clip_last_batch: Whether to clip the last uncompleted batch.
     :type clip_last_batch: bool
@@ -166,6 +363,12 @@ class DataReader(object):
     :type unk_mark: basestring
     :param seed: The seed for random.
     :type seed: int
+    :param use_binary: Whether to memory map the binary files saved by
+        binarize_data instead of loading data files, by which the data
+        is not converted at startup and shared by processes on one host.
+    :type use_binary: bool
+    :param num_buckets: The number of buckets if sort_type is 'bucket'.
+    :type num_buckets: int
     """
 
     def __init__(self,
@@ -187,7 +390,9 @@ class DataReader(object):
                  start_mark="<s>",
                  end_mark="<e>",
                  unk_mark="<unk>",
-                 seed=0):
+                 seed=0,
+                 use_binary=False,
+                 num_buckets=64):
         self._src_vocab = self.load_dict(src_vocab_fpath)
         self._only_src = True
         if trg_vocab_fpath is not None:
@@ -204,73 +409,100 @@ class DataReader(object):
         self._max_length = max_length
         self._field_delimiter = field_delimiter
         self._token_delimiter = token_delimiter
-        self.load_src_trg_ids(end_mark, fpattern, start_mark, tar_fname,
-                              unk_mark)
+        self._num_buckets = num_buckets
+        self._bucket_boundaries = None
+        self._use_binary = use_binary
+        if use_binary:
+            self.load_binary_data(fpattern)
+        else:
+            self.load_src_trg_ids(end_mark, fpattern, start_mark, tar_fname,
+                                  unk_mark)
         self._random = np.random
         self._random.seed(seed)
 
     def load_src_trg_ids(self, end_mark, fpattern, start_mark, tar_fname,
                          unk_mark):
-        converters = [
-            Converter(
-                vocab=self._src_vocab,
-                beg=self._src_vocab[start_mark],
-                end=self._src_vocab[end_mark],
-                unk=self._src_vocab[unk_mark],
-                delimiter=self._token_delimiter,
-                add_beg=False)
-        ]
-        if not self._only_src:
-            converters.append(
-                Converter(
-                    vocab=self._trg_vocab,
-                    beg=self._trg_vocab[start_mark],
-                    end=self._trg_vocab[end_mark],
-                    unk=self._trg_vocab[unk_mark],
-                    delimiter=self._token_delimiter,
-                    add_beg=True))
-
-        converters = ComposedConverter(converters)
+        converters = make_converters(
+            self._src_vocab, None if self._only_src else self._trg_vocab,
+            start_mark, end_mark, unk_mark, self._token_delimiter)
 
         self._src_seq_ids = []
         self._trg_seq_ids = None if self._only_src else []
-        self._sample_infos = []
+        max_lens = []
+        min_lens = []
 
-        for i, line in enumerate(self._load_lines(fpattern, tar_fname)):
+        for line in self._load_lines(fpattern, tar_fname):
             src_trg_ids = converters(line)
             self._src_seq_ids.append(src_trg_ids[0])
             lens = [len(src_trg_ids[0])]
             if not self._only_src:
                 self._trg_seq_ids.append(src_trg_ids[1])
                 lens.append(len(src_trg_ids[1]))
-            self._sample_infos.append(SampleInfo(i, max(lens), min(lens)))
+            max_lens.append(max(lens))
+            min_lens.append(min(lens))
+        self._set_sample_infos(max_lens, min_lens)
+
+    def load_binary_data(self, prefix):
+        """
+        Memory map the binary files saved by binarize_data.
+        """
+        with np.load(prefix + ".idx.npz") as index:
+            self._src_offsets = index["src_offsets"]
+            self._trg_offsets = None if self._only_src else index[
+                "trg_offsets"]
+            vocab_sizes = [int(index["src_vocab_size"])] + (
+                [] if self._only_src else [int(index["trg_vocab_size"])])
+        if vocab_sizes != [len(self._src_vocab)] + (
+            [] if self._only_src else [len(self._trg_vocab)]):
+            raise ValueError(
+                "The dictionaries do not match that used by binarize_data.")
+
+        def _memmap(fpath, offsets):
+            # an empty file can not be memory mapped
+            if offsets[-1] == 0:
+                return np.zeros(0, dtype="int32")
+            # slices of ndarray are cheaper than those of memmap
+            return np.memmap(fpath, dtype="int32", mode="r").view(np.ndarray)
+
+        self._src_ids = _memmap(prefix + ".src.bin", self._src_offsets)
+        lens = np.diff(self._src_offsets)
+        max_lens = min_lens = lens
+        if not self._only_src:
+            self._trg_ids = _memmap(prefix + ".trg.bin", self._trg_offsets)
+            trg_lens = np.diff(self._trg_offsets)
+            max_lens = np.maximum(lens, trg_lens)
+            min_lens = np.minimum(lens, trg_lens)
+        self._set_sample_infos(max_lens, min_lens)
+
+    def _set_sample_infos(self, max_lens, min_lens):
+        # The sample infos are kept in arrays rather than SampleInfo objects
+        # to save the memory for large corpora. _sample_idxs is shuffled and
+        # sorted in place among passes.
+        self._sample_max_lens = np.asarray(max_lens, dtype="int64")
+        self._sample_min_lens = np.asarray(min_lens, dtype="int64")
+        self._sample_idxs = np.arange(len(self._sample_max_lens))
+
+    def _get_batch_seq_ids(self, batch_ids):
+        """
+        Get the source and target ids of a batch, the target ids are None if
+        only source.
+        """
+        if not self._use_binary:
+            return [self._src_seq_ids[idx] for idx in batch_ids], None if \
+                self._only_src else [self._trg_seq_ids[idx] for idx in batch_ids]
+
+        def _slice(ids, offsets):
+            starts = offsets[batch_ids].tolist()
+            ends = offsets[batch_ids + 1].tolist()
+            return [ids[start:end].tolist() for start, end in zip(starts, ends)]
+
+        batch_ids = np.asarray(batch_ids)
+        return _slice(self._src_ids, self._src_offsets), None if \
+            self._only_src else _slice(self._trg_ids, self._trg_offsets)
 
     def _load_lines(self, fpattern, tar_fname):
-        fpaths = glob.glob(fpattern)
-
-        if len(fpaths) == 1 and tarfile.is_tarfile(fpaths[0]):
-            if tar_fname is None:
-                raise Exception("If tar file provided, please set tar_fname.")
-
-            f = tarfile.open(fpaths[0], "r")
-            for line in f.extractfile(tar_fname):
-                fields = line.strip("\n").split(self._field_delimiter)
-                if (not self._only_src and len(fields) == 2) or (
-                        self._only_src and len(fields) == 1):
-                    yield fields
-        else:
-            for fpath in fpaths:
-                if not os.path.isfile(fpath):
-                    raise IOError("Invalid file: %s" % fpath)
-
-                with open(fpath, "rb") as f:
-                    for line in f:
-                        if six.PY3:
-                            line = line.decode()
-                        fields = line.strip("\n").split(self._field_delimiter)
-                        if (not self._only_src and len(fields) == 2) or (
-                                self._only_src and len(fields) == 1):
-                            yield fields
+        return load_lines(fpattern, tar_fname, self._field_delimiter,
+                          self._only_src)
 
     @staticmethod
     def load_dict(dict_path, reverse=False):
@@ -285,26 +517,57 @@ class DataReader(object):
                     word_dict[line.strip("\n")] = idx
         return word_dict
 
+    def _bucket_batches(self):
+        valid = (self._sample_max_lens <= self._max_length) & (
+            self._sample_min_lens >= self._min_length)
+        idxs = self._sample_idxs[valid[self._sample_idxs]]
+        if self._bucket_boundaries is None:
+            self._bucket_boundaries = bucket_boundaries(
+                self._sample_max_lens[idxs], self._num_buckets)
+            logging.info("bucket boundaries: %s" %
+                         self._bucket_boundaries.tolist())
+        # cap the tokens (include paddings) of batches by the upper bounds
+        batch_sizes = np.maximum(
+            self._batch_size // self._bucket_boundaries,
+            1) if self._use_token_batch else [self._batch_size] * len(
+                self._bucket_boundaries)
+        batches = plan_bucket_batches(
+            idxs, self._sample_max_lens, self._bucket_boundaries, batch_sizes,
+            self._shuffle, self._random, self._clip_last_batch)
+        logging.info("bucket batches: %d, padding efficiency: %.4f" %
+                     (len(batches),
+                      padding_efficiency(batches, self._sample_max_lens)))
+        return batches
+
     def batch_generator(self):
+        if self._sort_type == SortType.BUCKET:
+            batches = self._bucket_batches()
+            if self._shuffle_batch:
+                self._random.shuffle(batches)
+            for batch in self._batch_seq_ids(batches):
+                yield batch
+            return
+
         # global sort or global shuffle
         if self._sort_type == SortType.GLOBAL:
-            infos = sorted(self._sample_infos, key=lambda x: x.max_len)
+            idxs = self._sample_idxs[np.argsort(
+                self._sample_max_lens[self._sample_idxs], kind="mergesort")]
         else:
+            idxs = self._sample_idxs
             if self._shuffle:
-                infos = self._sample_infos
-                self._random.shuffle(infos)
-            else:
-                infos = self._sample_infos
+                self._random.shuffle(idxs)
 
             if self._sort_type == SortType.POOL:
                 reverse = True
-                for i in range(0, len(infos), self._pool_size):
+                for i in range(0, len(idxs), self._pool_size):
                     # to avoid placing short next to long sentences
                     reverse = not reverse
-                    infos[i:i + self._pool_size] = sorted(
-                        infos[i:i + self._pool_size],
-                        key=lambda x: x.max_len,
-                        reverse=reverse)
+                    pool = idxs[i:i + self._pool_size]
+                    pool_lens = self._sample_max_lens[pool]
+                    # stable sort as sorted
+                    idxs[i:i + self._pool_size] = pool[np.argsort(
+                        -pool_lens if reverse else pool_lens,
+                        kind="mergesort")]
 
         # concat batch
         batches = []
@@ -314,8 +577,10 @@ class DataReader(object):
         batch_creator = MinMaxFilter(self._max_length, self._min_length,
                                      batch_creator)
 
-        for info in infos:
-            batch = batch_creator.append(info)
+        for i, max_len, min_len in zip(
+                idxs.tolist(), self._sample_max_lens[idxs].tolist(),
+                self._sample_min_lens[idxs].tolist()):
+            batch = batch_creator.append(SampleInfo(i, max_len, min_len))
             if batch is not None:
                 batches.append(batch)
 
@@ -325,11 +590,16 @@ class DataReader(object):
         if self._shuffle_batch:
             self._random.shuffle(batches)
 
-        for batch in batches:
-            batch_ids = [info.i for info in batch]
+        for batch in self._batch_seq_ids(
+            [[info.i for info in batch] for batch in batches]):
+            yield batch
+
+    def _batch_seq_ids(self, batches):
+        for batch_ids in batches:
+            src_seq_ids, trg_seq_ids = self._get_batch_seq_ids(batch_ids)
 
             if self._only_src:
-                yield [[self._src_seq_ids[idx]] for idx in batch_ids]
+                yield [[src_ids] for src_ids in src_seq_ids]
             else:
-                yield [(self._src_seq_ids[idx], self._trg_seq_ids[idx][:-1],
-                        self._trg_seq_ids[idx][1:]) for idx in batch_ids]
+                yield [(src_ids, trg_ids[:-1], trg_ids[1:])
+                       for src_ids, trg_ids in zip(src_seq_ids, trg_seq_ids)]
@@ -0,0 +1,414 @@
+"""
+Serve translation online with the beam search decoder. Requests arriving one
+by one are put into buckets by source lengths and translated in dynamic
+batches, by the executor and scope loaded once, eg:
+
+    python -u serve.py \
+      --src_vocab_fpath gen_data/wmt16_ende_data_bpe/vocab_all.bpe.32000 \
+      --trg_vocab_fpath gen_data/wmt16_ende_data_bpe/vocab_all.bpe.32000 \
+      --special_token '<s>' '<e>' '<unk>' \
+      --port 8000 \
+      model_path trained_models/iter_100000.infer.model \
+      beam_size 5 \
+      max_out_len 255
+
+    curl -d 'source sentence with BPE' http://127.0.0.1:8000
+"""
+
+from __future__ import print_function
+
+import argparse
+import bisect
+import logging
+import sys
+sys.path.append("../../models/neural_machine_translation/transformer/")
+import threading
+import time
+
+import numpy as np
+from six.moves import queue
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+import paddle.fluid as fluid
+
+import reader
+from config import *
+from desc import *
+from infer import post_process_seq, prepare_batch_input
+from model import fast_decode as fast_decoder
+
+
+def make_parser(description="Serving for Transformer."):
+    parser = argparse.ArgumentParser(description)
+    parser.add_argument(
+        "--src_vocab_fpath",
+        type=str,
+        required=True,
+        help="The path of vocabulary file of source language.")
+    parser.add_argument(
+        "--trg_vocab_fpath",
+        type=str,
+        required=True,
+        help="The path of vocabulary file of target language.")
+    parser.add_argument(
+        "--special_token",
+        type=str,
+        default=["<s>", "<e>", "<unk>"],
+        nargs=3,
+        help="The <bos>, <eos> and <unk> tokens in the dictionary.")
+    parser.add_argument(
+        "--token_delimiter",
+        type=lambda x: str(x.encode().decode("unicode-escape")),
+        default=" ",
+        help="The delimiter used to split tokens in source or target sentences. "
+        "For EN-DE BPE data we provided, use spaces as token delimiter. ")
+    parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        default=32,
+        help="The maximum number of sentences translated in one run.")
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=10.,
+        help="The maximum time in milliseconds a request waits for other "
+        "requests to batch with.")
+    parser.add_argument(
+        "--bucket_boundaries",
+        type=int,
+        default=[16, 32, 64, 128],
+        nargs="*",
+        help="The upper bounds of source lengths of buckets, requests in "
+        "one bucket are batched together.")
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="The host to serve.")
+    parser.add_argument(
+        "--port", type=int, default=8000, help="The port to serve.")
+    return parser
+
+
+def parse_args(parser=None):
+    parser = make_parser() if parser is None else parser
+    parser.add_argument(
+        'opts',
+        help='See config.py for all options',
+        default=None,
+        nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    # Append args related to dict
+    src_dict = reader.DataReader.load_dict(args.src_vocab_fpath)
+    trg_dict = reader.DataReader.load_dict(args.trg_vocab_fpath)
+    dict_args = [
+        "src_vocab_size", str(len(src_dict)), "trg_vocab_size",
+        str(len(trg_dict)), "bos_idx", str(src_dict[args.special_token[0]]),
+        "eos_idx", str(src_dict[args.special_token[1]]), "unk_idx",
+        str(src_dict[args.special_token[2]])
+    ]
+    merge_cfg_from_list(args.opts + dict_args,
+                        [InferTaskConfig, ModelHyperParams])
+    return args
+
+
+class Translator(object):
+    """
+    Build the beam search decoder program and load the trained model once,
+    and translate batches of source ids with the same executor and scope.
+    """
+
+    def __init__(self, model_path=None, use_gpu=None):
+        model_path = model_path or InferTaskConfig.model_path
+        use_gpu = InferTaskConfig.use_gpu if use_gpu is None else use_gpu
+        self.place = fluid.CUDAPlace(0) if use_gpu else fluid.CPUPlace()
+        self.exe = fluid.Executor(self.place)
+        self.scope = fluid.core.Scope()
+
+        main_program = fluid.Program()
+        startup_program = fluid.Program()
+        with fluid.program_guard(main_program, startup_program):
+            with fluid.unique_name.guard():
+                self.out_ids, self.out_scores, _ = fast_decoder(
+                    ModelHyperParams.src_vocab_size,
+                    ModelHyperParams.trg_vocab_size,
+                    ModelHyperParams.max_length + 1,
+                    ModelHyperParams.n_layer,
+                    ModelHyperParams.n_head,
+                    ModelHyperParams.d_key,
+                    ModelHyperParams.d_value,
+                    ModelHyperParams.d_model,
+                    ModelHyperParams.d_inner_hid,
+                    ModelHyperParams.prepostprocess_dropout,
+                    ModelHyperParams.attention_dropout,
+                    ModelHyperParams.relu_dropout,
+                    ModelHyperParams.preprocess_cmd,
+                    ModelHyperParams.postprocess_cmd,
+                    ModelHyperParams.weight_sharing,
+                    InferTaskConfig.beam_size,
+                    InferTaskConfig.max_out_len,
+                    ModelHyperParams.bos_idx,
+                    ModelHyperParams.eos_idx,
+                    use_py_reader=False,
+                    compact_attn_bias=ModelHyperParams.compact_attn_bias)
+        # This is used here to set dropout to the test mode.
+        self.program = main_program.clone(for_test=True)
+
+        with fluid.scope_guard(self.scope):
+            self.exe.run(startup_program)
+            fluid.io.load_vars(
+                self.exe,
+                model_path,
+                vars=[
+                    var for var in self.program.list_vars()
+                    if isinstance(var, fluid.framework.Parameter)
+                ])
+        self.data_input_names = encoder_data_input_fields + \
+            fast_decoder_data_input_fields
+
+    def translate(self, src_seq_ids):
+        """
+        Translate a batch of source ids, return the n_best hypotheses of
+        every source as lists of (ids, score).
+        """
+        data_input_dict = prepare_batch_input(
+            [[src_ids] for src_ids in src_seq_ids], self.data_input_names,
+            ModelHyperParams.eos_idx, ModelHyperParams.bos_idx,
+            ModelHyperParams.n_head, ModelHyperParams.d_model, self.place,
+            ModelHyperParams.compact_attn_bias)
+        with fluid.scope_guard(self.scope):
+            seq_ids, seq_scores = self.exe.run(
+                program=self.program,
+                feed=data_input_dict,
+                fetch_list=[self.out_ids.name, self.out_scores.name],
+                return_numpy=False,
+                use_program_cache=True)
+        # lod[0] of seq_ids indexes the hypotheses of every source, and lod[1]
+        # indexes the ids of every hypothesis, as parsed in infer.py.
+        lod = seq_ids.lod()
+        ids = np.array(seq_ids).reshape(-1)
+        scores = np.array(seq_scores).reshape(-1)
+        results = []
+        for i in range(len(lod[0]) - 1):
+            hyps = []
+            for j in range(lod[0][i], lod[0][i + 1]):
+                hyps.append((post_process_seq(
+                    ids[lod[1][j]:lod[1][j + 1]].tolist(),
+                    ModelHyperParams.bos_idx, ModelHyperParams.eos_idx,
+                    InferTaskConfig.output_bos, InferTaskConfig.output_eos),
+                             float(scores[lod[1][j + 1] - 1])))
+                if len(hyps) >= InferTaskConfig.n_best:
+                    break
+            results.append(hyps)
+        return results
+
+
+class Request(object):
+    """
+    A request of translation, whose result is set by DynamicBatcher.
+    """
+
+    def __init__(self, src_ids):
+        self.src_ids = src_ids
+        self.arrival_time = time.time()
+        self.finish_time = None
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def set_result(self, result=None, error=None):
+        self._result = result
+        self._error = error
+        self.finish_time = time.time()
+        self._done.set()
+
+    def result(self, timeout=None):
+        """
+        Wait for and return the n_best hypotheses of the request.
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError("The request is not finished in %s seconds." %
+                               timeout)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class DynamicBatcher(object):
+    """
+    Batch requests dynamically for translate_fn in a worker thread. Requests
+    are put into buckets by source lengths, and a bucket is translated once
+    it has max_batch_size requests or its earliest request has waited for
+    max_wait_ms. Requests with more than max_length source ids fail at once
+    with ValueError rather than fail the batches they are in, eg:
+
+        batcher = DynamicBatcher(Translator().translate)
+        hyps = batcher.submit(src_ids).result()
+        batcher.close()
+    """
+
+    def __init__(self,
+                 translate_fn,
+                 max_batch_size=32,
+                 max_wait_ms=10.,
+                 bucket_boundaries=(16, 32, 64, 128),
+                 max_length=None):
+        self._translate_fn = translate_fn
+        self._max_length = max_length
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000.
+        self._bucket_boundaries = sorted(bucket_boundaries)
+        self._buckets = [[] for _ in range(len(self._bucket_boundaries) + 1)]
+        self._queue = queue.Queue()
+        self.batch_sizes = []
+        self._worker = threading.Thread(target=self._run)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def submit(self, src_ids):
+        request = Request(src_ids)
+        if self._max_length is not None and len(src_ids) > self._max_length:
+            request.set_result(error=ValueError(
+                "The source has %d ids, more than max_length %d." %
+                (len(src_ids), self._max_length)))
+        else:
+            self._queue.put(request)
+        return request
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+    def _add(self, request):
+        bucket_id = bisect.bisect_left(self._bucket_boundaries,
+                                       len(request.src_ids))
+        self._buckets[bucket_id].append(request)
+
+    def _next_deadline(self):
+        arrival_times = [
+            bucket[0].arrival_time for bucket in self._buckets if bucket
+        ]
+        return min(arrival_times) + self._max_wait if arrival_times else None
+
+    def _run(self):
+        closed = False
+        while not closed or any(self._buckets):
+            deadline = self._next_deadline()
+            try:
+                if closed:
+                    request = self._queue.get_nowait()
+                elif deadline is None:
+                    request = self._queue.get()
+                else:
+                    request = self._queue.get(
+                        timeout=max(deadline - time.time(), 0))
+                # drain the requests arrived during translating
+                while True:
+                    if request is None:
+                        closed = True
+                    else:
+                        self._add(request)
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            now = time.time()
+            for bucket in self._buckets:
+                while len(bucket) >= self._max_batch_size or (
+                        bucket and (closed or bucket[0].arrival_time +
+                                    self._max_wait <= now)):
+                    batch = bucket[:self._max_batch_size]
+                    del bucket[:self._max_batch_size]
+                    self._translate(batch)
+
+    def _translate(self, batch):
+        self.batch_sizes.append(len(batch))
+        try:
+            results = self._translate_fn(
+                [request.src_ids for request in batch])
+        except Exception as e:
+            logging.exception("Failed to translate a batch.")
+            for request in batch:
+                request.set_result(error=e)
+            return
+        for request, result in zip(batch, results):
+            request.set_result(result)
+
+
+class TranslationServer(socketserver.ThreadingMixIn,
+                        BaseHTTPServer.HTTPServer):
+    """
+    HTTP server translating the source sentence in the body of POST requests.
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address, batcher, src_converter, trg_idx2word,
+                 token_delimiter, max_length):
+        BaseHTTPServer.HTTPServer.__init__(self, server_address,
+                                           TranslationHandler)
+        self.batcher = batcher
+        self.src_converter = src_converter
+        self.trg_idx2word = trg_idx2word
+        self.token_delimiter = token_delimiter
+        self.max_length = max_length
+
+
+class TranslationHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        sentence = self.rfile.read(length).decode("utf-8").strip()
+        src_ids = self.server.src_converter(sentence)
+        # the position encoding only covers max_length positions
+        if len(src_ids) > self.server.max_length:
+            self.send_error(400, "The source sentence has %d tokens, more "
+                            "than max_length %d." %
+                            (len(src_ids), self.server.max_length))
+            return
+        try:
+            hyps = self.server.batcher.submit(src_ids).result()
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        body = "\n".join(
+            self.server.token_delimiter.join(
+                self.server.trg_idx2word[idx] for idx in ids)
+            for ids, score in hyps) + "\n"
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_src_converter(args):
+    src_dict = reader.DataReader.load_dict(args.src_vocab_fpath)
+    return reader.Converter(
+        vocab=src_dict,
+        beg=src_dict[args.special_token[0]],
+        end=src_dict[args.special_token[1]],
+        unk=src_dict[args.special_token[2]],
+        delimiter=args.token_delimiter,
+        add_beg=False)
+
+
+def serve(args):
+    batcher = DynamicBatcher(Translator().translate, args.max_batch_size,
+                             args.max_wait_ms, args.bucket_boundaries,
+                             ModelHyperParams.max_length)
+    server = TranslationServer(
+        (args.host, args.port), batcher,
+        make_src_converter(args),
+        reader.DataReader.load_dict(
+            args.trg_vocab_fpath, reverse=True),
+        args.token_delimiter, ModelHyperParams.max_length)
+    logging.info("serving on %s:%d" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    serve(parse_args())
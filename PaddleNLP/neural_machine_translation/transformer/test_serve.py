@@ -0,0 +1,108 @@
+"""
+Tests of the dynamic batching in serve.py with a fake translate function,
+which fails like the model if any source in a batch is too long, eg:
+
+    python -m unittest test_serve
+"""
+
+import threading
+import time
+import unittest
+
+from six.moves import urllib
+
+from serve import DynamicBatcher, TranslationServer
+
+MAX_LENGTH = 8
+
+
+def fake_translate(src_seq_ids):
+    """
+    Return the reversed source as the only hypothesis of every source, and
+    fail the whole batch on a source longer than MAX_LENGTH as the position
+    encoding lookup does.
+    """
+    time.sleep(0.01)
+    if any(len(src_ids) > MAX_LENGTH for src_ids in src_seq_ids):
+        raise ValueError("source is too long")
+    return [[(src_ids[::-1], 0.)] for src_ids in src_seq_ids]
+
+
+class TestDynamicBatcher(unittest.TestCase):
+    def test_batch(self):
+        batcher = DynamicBatcher(
+            fake_translate, max_batch_size=4, max_wait_ms=50.)
+        src_seq_ids = [list(range(i % MAX_LENGTH + 1)) for i in range(20)]
+        requests = [batcher.submit(src_ids) for src_ids in src_seq_ids]
+        for src_ids, request in zip(src_seq_ids, requests):
+            self.assertEqual(request.result(10), [(src_ids[::-1], 0.)])
+        batcher.close()
+        self.assertEqual(sum(batcher.batch_sizes), len(src_seq_ids))
+        self.assertTrue(max(batcher.batch_sizes) <= 4)
+
+    def test_oversized_request(self):
+        batcher = DynamicBatcher(
+            fake_translate,
+            max_batch_size=4,
+            max_wait_ms=100.,
+            bucket_boundaries=[],
+            max_length=MAX_LENGTH)
+        src_seq_ids = [[1, 2], [3], list(range(MAX_LENGTH + 1)), [4, 5, 6]]
+        requests = [batcher.submit(src_ids) for src_ids in src_seq_ids]
+        with self.assertRaises(ValueError):
+            requests[2].result(10)
+        for i in [0, 1, 3]:
+            self.assertEqual(requests[i].result(10),
+                             [(src_seq_ids[i][::-1], 0.)])
+        batcher.close()
+        # the other requests are translated in one batch
+        self.assertEqual(batcher.batch_sizes, [3])
+
+
+class TestTranslationServer(unittest.TestCase):
+    def setUp(self):
+        self.batcher = DynamicBatcher(
+            fake_translate, max_batch_size=4, max_wait_ms=100.)
+        self.server = TranslationServer(
+            ("127.0.0.1", 0), self.batcher,
+            lambda sentence: [len(word) for word in sentence.split()],
+            dict((i, "w%d" % i) for i in range(100)), " ", MAX_LENGTH)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.batcher.close()
+
+    def post(self, sentence):
+        url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        try:
+            response = urllib.request.urlopen(url, sentence.encode("utf-8"))
+            return response.getcode(), response.read().decode("utf-8")
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    def test_oversized_request(self):
+        sentences = ["a bb ccc", "dddd", " ".join(["e"] * (MAX_LENGTH + 1)),
+                     "ff g"]
+        results = [None] * len(sentences)
+
+        def post(i):
+            results[i] = self.post(sentences[i])
+
+        threads = [
+            threading.Thread(
+                target=post, args=(i, )) for i in range(len(sentences))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [(200, "w3 w2 w1\n"), (200, "w4\n"),
+                                   (400, None), (200, "w1 w2\n")])
+
+
+if __name__ == "__main__":
+    unittest.main()
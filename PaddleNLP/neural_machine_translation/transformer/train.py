@@ -1,6 +1,7 @@
 import argparse
 import ast
 import copy
+import itertools
 import logging
 import multiprocessing
 import os
@@ -39,6 +40,13 @@ def parse_args():
         "--val_file_pattern",
         type=str,
         help="The pattern to match validation data files.")
+    parser.add_argument(
+        "--use_binary_data",
+        type=ast.literal_eval,
+        default=False,
+        help="The flag indicating whether train_file_pattern and "
+        "val_file_pattern are the prefixes of binary data saved by "
+        "binarize_data.py, which are memory mapped rather than loaded.")
     parser.add_argument(
         "--use_token_batch",
         type=ast.literal_eval,
@@ -61,9 +69,15 @@ def parse_args():
     parser.add_argument(
         "--sort_type",
         default="pool",
-        choices=("global", "pool", "none"),
+        choices=("global", "pool", "bucket", "none"),
         help="The grain to sort by length: global for all instances; pool for "
-        "instances in pool; none for no sort.")
+        "instances in pool; bucket for instances in buckets of lengths, whose "
+        "boundaries are chosen to minimize paddings; none for no sort.")
+    parser.add_argument(
+        "--num_buckets",
+        type=int,
+        default=64,
+        help="The number of buckets of lengths if sort_type is bucket.")
     parser.add_argument(
         "--shuffle",
         type=ast.literal_eval,
@@ -173,72 +187,95 @@ def pad_batch_data(insts,
                    is_label=False,
                    return_attn_bias=True,
                    return_max_len=True,
-                   return_num_token=False):
+                   return_num_token=False,
+                   compact_attn_bias=False):
     """
     Pad the instances to the max sequence length in batch, and generate the
-    corresponding position data and attention bias.
+    corresponding position data and attention bias. If compact_attn_bias, the
+    attention bias is the key padding bias in shape [batch_size, 1, 1, max_len]
+    rather than [batch_size, n_head, max_len, max_len].
     """
     return_list = []
-    max_len = max(len(inst) for inst in insts)
+    seq_lens = np.array([len(inst) for inst in insts], dtype="int64")
+    max_len = int(seq_lens.max())
+    # mask of the tokens in shape [batch_size, max_len], which is False for
+    # paddings.
+    token_mask = np.arange(max_len) < seq_lens[:, np.newaxis]
     # Any token included in dict can be used to pad, since the paddings' loss
     # will be masked out by weights and make no effect on parameter gradients.
-    inst_data = np.array(
-        [inst + [pad_idx] * (max_len - len(inst)) for inst in insts])
-    return_list += [inst_data.astype("int64").reshape([-1, 1])]
+    inst_data = np.full(token_mask.shape, pad_idx, dtype="int64")
+    inst_data[token_mask] = np.fromiter(
+        itertools.chain.from_iterable(insts),
+        dtype="int64",
+        count=int(seq_lens.sum()))
+    return_list += [inst_data.reshape([-1, 1])]
     if is_label:  # label weight
-        inst_weight = np.array(
-            [[1.] * len(inst) + [0.] * (max_len - len(inst)) for inst in insts])
-        return_list += [inst_weight.astype("float32").reshape([-1, 1])]
+        inst_weight = token_mask.astype("float32")
+        return_list += [inst_weight.reshape([-1, 1])]
     else:  # position data
-        inst_pos = np.array([
-            list(range(0, len(inst))) + [0] * (max_len - len(inst))
-            for inst in insts
-        ])
-        return_list += [inst_pos.astype("int64").reshape([-1, 1])]
+        inst_pos = np.where(token_mask, np.arange(max_len), 0).astype("int64")
+        return_list += [inst_pos.reshape([-1, 1])]
     if return_attn_bias:
-        if is_target:
+        # This is used to avoid attention on paddings.
+        key_bias = np.where(token_mask, 0., -1e9).astype("float32").reshape(
+            [-1, 1, 1, max_len])
+        if compact_attn_bias:
+            # The attention on subsequent words of target is avoided by ops.
+            slf_attn_bias_data = key_bias
+        elif is_target:
             # This is used to avoid attention on paddings and subsequent
             # words.
-            slf_attn_bias_data = np.ones((inst_data.shape[0], max_len, max_len))
-            slf_attn_bias_data = np.triu(slf_attn_bias_data,
-                                         1).reshape([-1, 1, max_len, max_len])
-            slf_attn_bias_data = np.tile(slf_attn_bias_data,
-                                         [1, n_head, 1, 1]) * [-1e9]
+            slf_attn_bias_data = np.broadcast_to(
+                np.triu(
+                    np.full(
+                        (max_len, max_len), -1e9, dtype="float32"), 1),
+                [len(insts), n_head, max_len, max_len])
         else:
-            # This is used to avoid attention on paddings.
-            slf_attn_bias_data = np.array([[0] * len(inst) + [-1e9] *
-                                           (max_len - len(inst))
-                                           for inst in insts])
-            slf_attn_bias_data = np.tile(
-                slf_attn_bias_data.reshape([-1, 1, 1, max_len]),
-                [1, n_head, max_len, 1])
-        return_list += [slf_attn_bias_data.astype("float32")]
+            slf_attn_bias_data = np.broadcast_to(
+                key_bias, [len(insts), n_head, max_len, max_len])
+        return_list += [np.ascontiguousarray(slf_attn_bias_data)]
     if return_max_len:
         return_list += [max_len]
     if return_num_token:
-        num_token = 0
-        for inst in insts:
-            num_token += len(inst)
-        return_list += [num_token]
+        return_list += [int(seq_lens.sum())]
     return return_list if len(return_list) > 1 else return_list[0]
 
 
-def prepare_batch_input(insts, data_input_names, src_pad_idx, trg_pad_idx,
-                        n_head, d_model):
+def prepare_batch_input(insts,
+                        data_input_names,
+                        src_pad_idx,
+                        trg_pad_idx,
+                        n_head,
+                        d_model,
+                        compact_attn_bias=False):
     """
     Put all padded data needed by training into a dict.
     """
     src_word, src_pos, src_slf_attn_bias, src_max_len = pad_batch_data(
-        [inst[0] for inst in insts], src_pad_idx, n_head, is_target=False)
+        [inst[0] for inst in insts],
+        src_pad_idx,
+        n_head,
+        is_target=False,
+        compact_attn_bias=compact_attn_bias)
     src_word = src_word.reshape(-1, src_max_len, 1)
     src_pos = src_pos.reshape(-1, src_max_len, 1)
     trg_word, trg_pos, trg_slf_attn_bias, trg_max_len = pad_batch_data(
-        [inst[1] for inst in insts], trg_pad_idx, n_head, is_target=True)
+        [inst[1] for inst in insts],
+        trg_pad_idx,
+        n_head,
+        is_target=True,
+        compact_attn_bias=compact_attn_bias)
     trg_word = trg_word.reshape(-1, trg_max_len, 1)
     trg_pos = trg_pos.reshape(-1, trg_max_len, 1)
 
-    trg_src_attn_bias = np.tile(src_slf_attn_bias[:, :, ::src_max_len, :],
-                                [1, 1, trg_max_len, 1]).astype("float32")
+    if compact_attn_bias:
+        # The key padding bias of source is expanded along target by ops.
+        trg_src_attn_bias = src_slf_attn_bias
+    else:
+        trg_src_attn_bias = np.ascontiguousarray(
+            np.broadcast_to(src_slf_attn_bias[:, :, :1, :], [
+                len(insts), n_head, trg_max_len, src_max_len
+            ]))
 
     lbl_word, lbl_weight, num_token = pad_batch_data(
         [inst[2] for inst in insts],
@@ -285,7 +322,9 @@ def prepare_data_generator(args,
         unk_mark=args.special_token[2],
         # count start and end tokens out
         max_length=ModelHyperParams.max_length - 2,
-        clip_last_batch=False).batch_generator
+        clip_last_batch=False,
+        use_binary=args.use_binary_data,
+        num_buckets=args.num_buckets).batch_generator
 
     def stack(data_reader, count, clip_last=True):
         def __impl__():
@@ -345,7 +384,7 @@ def prepare_feed_dict_list(data_generator, init_flag, count):
             data_input_dict, num_token = prepare_batch_input(
                 data_buffer, data_input_names, ModelHyperParams.eos_idx,
                 ModelHyperParams.eos_idx, ModelHyperParams.n_head,
-                ModelHyperParams.d_model)
+                ModelHyperParams.d_model, ModelHyperParams.compact_attn_bias)
             feed_dict_list.append(data_input_dict)
     if init_flag:
         for idx in range(count):
@@ -375,7 +414,7 @@ def py_reader_provider_wrapper(data_reader, place):
             data_input_dict, num_token = prepare_batch_input(
                 data, data_input_names, ModelHyperParams.eos_idx,
                 ModelHyperParams.eos_idx, ModelHyperParams.n_head,
-                ModelHyperParams.d_model)
+                ModelHyperParams.d_model, ModelHyperParams.compact_attn_bias)
             total_dict = dict(data_input_dict.items())
             yield [total_dict[item] for item in data_input_names]
 
@@ -409,7 +448,8 @@ def test_context(exe, train_exe, dev_count):
                 ModelHyperParams.weight_sharing,
                 TrainTaskConfig.label_smooth_eps,
                 use_py_reader=args.use_py_reader,
-                is_test=True)
+                is_test=True,
+                compact_attn_bias=ModelHyperParams.compact_attn_bias)
     test_prog = test_prog.clone(for_test=True)
     test_data = prepare_data_generator(
         args,
@@ -669,7 +709,8 @@ def train(args):
                 TrainTaskConfig.label_smooth_eps,
                 ModelHyperParams.bos_idx,
                 use_py_reader=args.use_py_reader,
-                is_test=False)
+                is_test=False,
+                compact_attn_bias=ModelHyperParams.compact_attn_bias)
 
             optimizer = None
             if args.sync:
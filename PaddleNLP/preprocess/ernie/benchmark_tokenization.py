@@ -0,0 +1,133 @@
+"""
+This module benchmarks the throughput of the WordPiece tokenization with the
+prefix tries and the word cache against the substring based greedy matching
+used before, and checks that their outputs are identical. Run it under the
+PaddleNLP directory, eg:
+
+    python -m preprocess.ernie.benchmark_tokenization \
+        --vocab_path ernie_model/vocab.txt \
+        --data_file data/train.tsv
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import io
+import multiprocessing
+import time
+
+from preprocess.ernie import tokenization
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        "Benchmark of WordPiece tokenization.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument(
+        "--vocab_path", type=str, required=True, help="The vocabulary file.")
+    parser.add_argument(
+        "--data_file",
+        type=str,
+        required=True,
+        help="The text file to tokenize, with one text per line.")
+    parser.add_argument(
+        "--do_lower_case",
+        type=int,
+        default=1,
+        help="Whether to lower case the input text.")
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="The number of processes for tokenize_many.")
+    return parser.parse_args()
+
+
+def legacy_wordpiece_tokenize(wordpiece_tokenizer, text):
+    """The greedy longest-match-first tokenization by substrings used before,
+    for comparison."""
+    vocab = wordpiece_tokenizer.vocab
+    output_tokens = []
+    for token in tokenization.whitespace_tokenize(
+            tokenization.convert_to_unicode(text)):
+        chars = list(token)
+        if len(chars) > wordpiece_tokenizer.max_input_chars_per_word:
+            output_tokens.append(wordpiece_tokenizer.unk_token)
+            continue
+
+        is_bad = False
+        start = 0
+        sub_tokens = []
+        while start < len(chars):
+            end = len(chars)
+            cur_substr = None
+            while start < end:
+                substr = "".join(chars[start:end])
+                if start > 0:
+                    substr = "##" + substr
+                if substr in vocab:
+                    cur_substr = substr
+                    break
+                end -= 1
+            if cur_substr is None:
+                is_bad = True
+                break
+            sub_tokens.append(cur_substr)
+            start = end
+
+        if is_bad:
+            output_tokens.append(wordpiece_tokenizer.unk_token)
+        else:
+            output_tokens.extend(sub_tokens)
+    return output_tokens
+
+
+def run(name, func, texts, num_words):
+    start = time.time()
+    results = func(texts)
+    cost = time.time() - start
+    print("%-28s %10.2f %14.0f" % (name, cost, num_words / cost))
+    return results
+
+
+def main():
+    args = parse_args()
+    with io.open(args.data_file, encoding="utf-8") as f:
+        texts = [line.rstrip("\n") for line in f]
+    tokenizer = tokenization.FullTokenizer(
+        vocab_file=args.vocab_path, do_lower_case=args.do_lower_case)
+    words = [
+        " ".join(tokenizer.basic_tokenizer.tokenize(text)) for text in texts
+    ]
+    num_words = sum(len(text.split()) for text in words)
+    print("texts: %d, words: %d" % (len(texts), num_words))
+    print("%-28s %10s %14s" % ("method", "seconds", "words/s"))
+
+    wordpiece = tokenizer.wordpiece_tokenizer
+    uncached = tokenization.WordpieceTokenizer(
+        vocab=tokenizer.vocab, cache_size=0)
+    legacy = run("wordpiece legacy",
+                 lambda texts: [legacy_wordpiece_tokenize(wordpiece, text)
+                                for text in texts], words, num_words)
+    trie = run("wordpiece trie",
+               lambda texts: [uncached.tokenize(text) for text in texts],
+               words, num_words)
+    cached = run("wordpiece trie + cache",
+                 lambda texts: [wordpiece.tokenize(text) for text in texts],
+                 words, num_words)
+    assert legacy == trie == cached
+
+    full = run("full tokenizer",
+               lambda texts: [tokenizer.tokenize(text) for text in texts],
+               texts, num_words)
+    many = run("tokenize_many (%d workers)" % args.num_workers,
+               lambda texts: tokenizer.tokenize_many(texts, args.num_workers),
+               texts, num_words)
+    assert full == many
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,22 @@
 from __future__ import print_function
 import argparse
 import ast
+import logging
+import os
+import sys
 import paddle.fluid as fluid
 from paddle.fluid.dygraph import Embedding, LayerNorm, FC, to_variable, Layer, guard
 import numpy as np
 import paddle
 import paddle.dataset.wmt16 as wmt16
 
+# share the bucketing with the static graph transformer
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "../../PaddleNLP/neural_machine_translation/transformer"))
+from reader import bucket_boundaries, plan_bucket_batches, padding_efficiency
+
 
 def parse_args():
     parser = argparse.ArgumentParser("Training for Mnist.")
@@ -15,6 +25,29 @@ def parse_args():
         type=ast.literal_eval,
         default=False,
         help="The flag indicating whether to shuffle instances in each pass.")
+    parser.add_argument(
+        "--token_batch_size",
+        type=int,
+        default=0,
+        help="The maximum number of tokens (include paddings) in a mini-batch. "
+        "If set, the instances are batched in buckets of lengths, otherwise "
+        "batched by TrainTaskConfig.batch_size sequences.")
+    parser.add_argument(
+        "--num_buckets",
+        type=int,
+        default=64,
+        help="The number of buckets of lengths if token_batch_size is set.")
+    parser.add_argument(
+        "--pool_size",
+        type=int,
+        default=200000,
+        help="The number of instances to batch in buckets at once.")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="The random seed to shuffle the bucket batches, which must be the "
+        "same on all trainers to split the same batches in data parallel.")
     args = parser.parse_args()
     return args
 
@@ -394,6 +427,55 @@ def prepare_batch_input(insts, src_pad_idx, trg_pad_idx, n_head):
     ]
 
 
+def bucket_batch_reader(reader, token_batch_size, num_buckets, pool_size,
+                        seed):
+    """
+    Batch the instances of reader in buckets of lengths, with at most
+    token_batch_size tokens (include paddings) in each batch. The instances
+    are read into a pool of pool_size, and the boundaries of buckets are
+    chosen from the lengths of the first pool. The batches are shuffled by
+    seed and the pass id, thus are the same on all trainers of a pass.
+    :param reader: the reader of instances (src_ids, trg_ids, lbl_ids)
+    :param token_batch_size: the maximum number of tokens in a batch
+    :param num_buckets: the number of buckets
+    :param pool_size: the number of instances to batch at once
+    :param seed: the random seed of shuffling
+    :return: the batch reader
+    """
+    boundaries = []
+    pass_ids = [0]
+
+    def __batches(pool, rng):
+        lens = np.array([max(len(inst[0]), len(inst[1])) for inst in pool])
+        if not len(boundaries):
+            boundaries.extend(bucket_boundaries(lens, num_buckets))
+        # the instances longer than the boundaries are put in the last bucket
+        bounds = np.array(boundaries[:-1] + [max(boundaries[-1], lens.max())])
+        batches = plan_bucket_batches(
+            np.arange(len(pool)), lens, bounds,
+            np.maximum(token_batch_size // bounds, 1), True, rng, False)
+        logging.info("bucket batches: %d, padding efficiency: %.4f" %
+                     (len(batches), padding_efficiency(batches, lens)))
+        rng.shuffle(batches)
+        return [[pool[idx] for idx in batch] for batch in batches]
+
+    def __impl__():
+        rng = np.random.RandomState(seed + pass_ids[0])
+        pass_ids[0] += 1
+        pool = []
+        for inst in reader():
+            pool.append(inst)
+            if len(pool) == pool_size:
+                for batch in __batches(pool, rng):
+                    yield batch
+                pool = []
+        if pool:
+            for batch in __batches(pool, rng):
+                yield batch
+
+    return __impl__
+
+
 pos_inp1 = position_encoding_init(ModelHyperParams.max_length + 1,
                                   ModelHyperParams.d_model)
 pos_inp2 = position_encoding_init(ModelHyperParams.max_length + 1,
@@ -1119,10 +1201,17 @@ def train():
             transformer = fluid.dygraph.parallel.DataParallel(transformer,
                                                               strategy)
 
-        reader = paddle.batch(
-            wmt16.train(ModelHyperParams.src_vocab_size,
-                        ModelHyperParams.trg_vocab_size),
-            batch_size=TrainTaskConfig.batch_size)
+        if args.token_batch_size:
+            reader = bucket_batch_reader(
+                wmt16.train(ModelHyperParams.src_vocab_size,
+                            ModelHyperParams.trg_vocab_size),
+                args.token_batch_size, args.num_buckets, args.pool_size,
+                args.seed)
+        else:
+            reader = paddle.batch(
+                wmt16.train(ModelHyperParams.src_vocab_size,
+                            ModelHyperParams.trg_vocab_size),
+                batch_size=TrainTaskConfig.batch_size)
         if args.use_data_parallel:
             reader = fluid.contrib.reader.distributed_batch_reader(reader)
 
@@ -1154,4 +1243,5 @@ def train():
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     train()